@@ -0,0 +1,50 @@
+"""
+Benchmark of the json decoding backends
+
+Usage: python -m benchmarks.json_decoding [payload.json ...]
+
+Recorded API responses can be passed as arguments, a synthetic wall.get
+page from benchmarks.wall_parser is used otherwise
+"""
+import io
+import json
+import pathlib
+import sys
+import timeit
+from typing import Dict
+
+from benchmarks.wall_parser import generate_page
+from vk.jsonlib import BACKENDS, iter_items
+
+
+def main() -> None:
+    payloads: Dict[str, bytes] = {
+        path: pathlib.Path(path).read_bytes() for path in sys.argv[1:]
+    }
+
+    if not payloads:
+        payloads["synthetic wall.get"] = json.dumps(
+            {"response": generate_page(10000)}, ensure_ascii=False
+        ).encode()
+
+    for name, payload in payloads.items():
+        print(f"{name}: {len(payload) / 1024 / 1024:.1f}MB")
+
+        for backend, loads in BACKENDS.items():
+            best = min(timeit.repeat(lambda: loads(payload), number=1, repeat=5))
+            print(f"  {backend}: {best:.3f}s")
+
+        best = min(
+            timeit.repeat(
+                lambda: sum(
+                    1 for _ in iter_items(io.BytesIO(payload), "response.items")
+                ),
+                number=1,
+                repeat=3,
+            )
+        )
+        print(f"  iter_items (response.items): {best:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
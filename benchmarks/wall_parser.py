@@ -0,0 +1,96 @@
+"""
+Benchmark of the wall.get response parser on a synthetic page
+
+Usage: python -m benchmarks.wall_parser [posts]
+"""
+import copy
+import sys
+import timeit
+from typing import Any, Dict, List
+
+from vk.api import wall_factory
+
+_PHOTO_SIZE_TYPES = ["s", "m", "x", "o", "p", "q", "r", "y", "z", "w"]
+
+
+def _photo(photo_id: int) -> Dict[str, Any]:
+    return {
+        "type": "photo",
+        "photo": {
+            "id": photo_id,
+            "owner_id": -1,
+            "album_id": -7,
+            "user_id": 100,
+            "text": "",
+            "date": 1658000000 + photo_id,
+            "sizes": [
+                {
+                    "type": size_type,
+                    "url": f"https://sun9-1.userapi.com/{photo_id}_{size_type}.jpg",
+                    "width": 100 * (pos + 1),
+                    "height": 100 * (pos + 1),
+                }
+                for pos, size_type in enumerate(_PHOTO_SIZE_TYPES)
+            ],
+            "width": 1000,
+            "height": 1000,
+        },
+    }
+
+
+def _link(link_id: int) -> Dict[str, Any]:
+    return {
+        "type": "link",
+        "link": {
+            "url": f"https://example.com/{link_id}",
+            "title": "Example",
+            "caption": "example.com",
+            "description": "",
+            "photo": _photo(link_id)["photo"],
+            "is_external": True,
+        },
+    }
+
+
+def _post(post_id: int) -> Dict[str, Any]:
+    return {
+        "id": post_id,
+        "owner_id": -1,
+        "from_id": -1,
+        "date": 1658000000 + post_id,
+        "text": f"Post #{post_id}",
+        "comments": {"count": 1, "can_post": 1, "groups_can_post": 1},
+        "likes": {"count": 10, "user_likes": 0, "can_like": 1, "can_publish": 1},
+        "reposts": {"count": 2, "user_reposted": 0},
+        "post_type": "post",
+        "post_source": {"type": "vk"},
+        "attachments": [_photo(post_id * 10 + pos) for pos in range(3)]
+        + [_link(post_id)],
+        "marked_as_ads": 0,
+        "can_pin": 1,
+        "can_delete": 0,
+        "can_edit": 0,
+        "is_favourite": 0,
+    }
+
+
+def generate_page(posts: int) -> Dict[str, Any]:
+    items: List[Dict[str, Any]] = [_post(post_id) for post_id in range(posts, 0, -1)]
+
+    return {"count": posts, "items": items}
+
+
+def main() -> None:
+    posts = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    page = generate_page(posts)
+    pages = [copy.deepcopy(page) for _ in range(3)]
+
+    timings = timeit.repeat(lambda: wall_factory(pages.pop()), number=1, repeat=3)
+
+    best = min(timings)
+
+    print(f"wall_factory: {posts} posts in {best:.3f}s, {posts / best:.0f} posts/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,89 @@
 import logging
-from typing import List
+from typing import AbstractSet, Iterable, List, Optional, Set
 
 import sqlalchemy
+import sqlalchemy.orm
 
 import vk.api
-from follower.models import VkPost, create_database
+from follower.models import VkCommunityCursor, VkPost, create_database
+from storage.utils import batches
 
-db_engine = sqlalchemy.create_engine("sqlite:///test.db")
-db_session = create_database(db_engine)
+db_session = create_database()
 
 logging.basicConfig()
 logging.getLogger("sqlalchemy.engine").setLevel(logging.DEBUG)
 
+# How many posts to take when the community is polled for the first time
+_INITIAL_POSTS_LIMIT = 100
 
-def get_new_posts(vk_service_token: str, vk_community: str) -> List[vk.api.Post]:
+
+def known_post_ids(
+    db_session: sqlalchemy.orm.session.Session, ids: Iterable[int]
+) -> Set[int]:
+    """
+    Returns the ids of the posts which have already been indexed
+    """
+    known: Set[int] = set()
+
+    for batch in batches(sorted(set(ids))):
+        known.update(
+            post_id
+            for post_id, in db_session.query(VkPost.id).filter(VkPost.id.in_(batch))
+        )
+
+    return known
+
+
+def get_new_posts(
+    vk_service_token: str,
+    vk_community: str,
+    attachment_types: Optional[AbstractSet[str]] = None,
+) -> List[vk.api.Post]:
+    """
+    Returns posts published since the previous call
+
+    Posts are decoded lazily, only `attachment_types` attachments are kept
+    (all of them if not specified)
+
+    The posts and the advanced cursor are flushed, but not committed: the
+    caller commits them along with whatever it made of the posts, so the
+    posts are fetched again if it fails before that
+    """
     vk_params = vk.api.VkApiClientParams(vk_service_token)
 
-    posts: List[vk.api.Post] = []
+    cursor = db_session.query(VkCommunityCursor).filter_by(domain=vk_community).first()
+
+    if not cursor:
+        cursor = VkCommunityCursor(domain=vk_community)
+        db_session.add(cursor)
+
+    logging.debug("Community cursor %s", cursor)
+
+    vk_wall = vk.api.VkApiWall(vk_params, lazy=True, attachment_types=attachment_types)
+
+    posts: List[vk.api.Post] = list(
+        vk_wall.iter_posts(
+            domain=vk_community,
+            since_id=cursor.last_post_id,
+            limit=None if cursor.last_post_id is not None else _INITIAL_POSTS_LIMIT,
+        )
+    )
+
+    known = known_post_ids(db_session(), (post.id for post in posts))
+    new_post_ids = {post.id for post in posts if post.id not in known}
 
-    for post in (
-        vk.api.VkApiWall(vk_params)
-        .get(domain=vk_community, offset=100, count=100)
-        .items
-    ):
-        logging.debug("Got post %s", post)
+    logging.debug("Got %s posts, %s of them are new", len(posts), len(new_post_ids))
 
-        if db_session.query(VkPost).filter_by(id=post.id).first():
-            logging.debug("Post %s has already been indexed", post.id)
-        else:
-            logging.info("New post found %s", post.id)
+    if new_post_ids:
+        db_session.execute(
+            sqlalchemy.insert(VkPost), [{"id": post_id} for post_id in new_post_ids]
+        )
 
-            db_session.add(VkPost(id=post.id))
-            db_session.commit()
+    for post in posts:
+        if cursor.last_post_id is None or post.id > cursor.last_post_id:
+            cursor.last_post_id = post.id
+            cursor.last_post_date = post.date
 
-        posts.append(post)
+    db_session.flush()
 
     return posts
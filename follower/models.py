@@ -1,4 +1,5 @@
 import enum
+from typing import List
 
 # import pg8000
 import sqlalchemy
@@ -7,6 +8,9 @@ import sqlalchemy.orm
 # from google.cloud.sql.connector import connector
 from sqlalchemy.orm.decl_api import DeclarativeMeta
 
+import storage.engine
+from storage.migrations import Migration
+
 mapper_registry = sqlalchemy.orm.registry()
 
 
@@ -34,12 +38,41 @@ class VkPost(Base):
         return f"<VkPost(" f"id={self.id}" ")>"
 
 
-def create_database(engine: sqlalchemy.engine.Engine) -> sqlalchemy.orm.session.Session:
-    Base.metadata.create_all(engine)
+class VkCommunityCursor(Base):
+    """
+    High-watermark of the community wall, everything below it has been seen
+    """
+
+    __tablename__ = "vk_community_cursor"
+
+    domain = sqlalchemy.Column(
+        sqlalchemy.String, primary_key=True, comment="Community screen name"
+    )
+    last_post_id = sqlalchemy.Column(
+        sqlalchemy.Integer, comment="Id of the newest post seen on the wall"
+    )
+    last_post_date = sqlalchemy.Column(
+        sqlalchemy.DateTime, comment="Date of the newest post seen on the wall"
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"<VkCommunityCursor("
+            f"domain={self.domain}, "
+            f"last_post_id={self.last_post_id}, "
+            f"last_post_date={self.last_post_date}"
+            ")>"
+        )
+
+
+# Schema changes of the existing tables, see storage.migrations
+MIGRATIONS: List[Migration] = []
+
 
-    session_maker = sqlalchemy.orm.sessionmaker()
-    session_maker.configure(bind=engine)
-    session = session_maker()
-    session.commit()
+def create_database() -> sqlalchemy.orm.scoped_session:
+    """
+    Returns the thread-local session of the shared database, see storage.engine
+    """
+    storage.engine.register_metadata(Base.metadata, MIGRATIONS)
 
-    return session
+    return storage.engine.session
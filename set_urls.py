@@ -1,21 +1,19 @@
 import hashlib
-import json
 import logging
 import os
-import time
 
 import requests
-import sqlalchemy
 import tqdm
 
 from uploader.models import NFT, create_database
+from uploader.opensea import parse_asset_url
+from uploader.utils import get_opensea_client
 
 logging.basicConfig()
 # logging.getLogger("sqlalchemy.engine").setLevel(logging.DEBUG)
 # logging.getLogger().setLevel(logging.DEBUG)
 
-db_engine = sqlalchemy.create_engine("sqlite:///test.db")
-db_session = create_database(db_engine)
+db_session = create_database()
 
 
 def download(url: str) -> bytes:
@@ -30,61 +28,65 @@ def download_and_generate_hash(url: str) -> str:
     return hashlib.sha256(content).hexdigest()
 
 
-session = requests.Session()
-
 with open("urls.txt") as fd:
     lines = fd.readlines()[:]
+
+    # Assets are fetched in bulk, many tokens per request, the ones missing
+    # from there are fetched one by one below
+    known_urls = {
+        opensea_url
+        for opensea_url, in db_session.query(NFT.opensea_url).filter(
+            NFT.opensea_url.isnot(None)
+        )
+    }
+    opensea_client = get_opensea_client()
+    assets = opensea_client.get_assets_many(
+        parse_asset_url(line.strip())
+        for line in lines
+        if line.strip() and line.strip() not in known_urls
+    )
+
     for pos, line in tqdm.tqdm(enumerate(lines), total=len(lines)):
         opensea_url = line.strip()
-        _, _, _, _, _, address, number = opensea_url.split("/")
+        address, number = parse_asset_url(opensea_url)
 
-        if db_session.query(NFT).filter_by(opensea_url=opensea_url).first():
+        if opensea_url in known_urls:
             continue
 
-        time.sleep(1)
-
         try:
-            url = f"https://api.opensea.io/api/v1/asset/{address}/{number}?format=json"
-
-            headers = {
-                "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/103.0.5060.53 Safari/537.36",
-            }
-
-            response = session.get(url, headers=headers)
-
-            data = json.loads(response.text)
+            data = assets.get((address, number)) or opensea_client.get_asset(
+                address, number
+            )
 
-            if data.get("success", True):
-                image_url = data["image_url"] + "=s0"
+            image_url = data["image_url"] + "=s0"
 
-                image_hash = download_and_generate_hash(image_url)
+            image_hash = download_and_generate_hash(image_url)
 
-                found_nft = db_session.query(NFT).filter_by(hash=image_hash).first()
+            found_nft = db_session.query(NFT).filter_by(hash=image_hash).first()
 
-                if found_nft:
-                    if found_nft.opensea_url:
-                        if found_nft.opensea_url != opensea_url:
-                            opensea = int(data["name"].split("#")[1])
-                            database = int(found_nft.title.split("#")[1])
+            if found_nft:
+                if found_nft.opensea_url:
+                    if found_nft.opensea_url != opensea_url:
+                        opensea = int(data["name"].split("#")[1])
+                        database = int(found_nft.title.split("#")[1])
 
-                            if database < opensea:
-                                print(
-                                    f"NFT {data['name']} is a duplicate for {found_nft.title}"
-                                )
-                                continue
-                            else:
-                                print(
-                                    f"Overwriting {found_nft.title} by {data['name']}"
-                                )
+                        if database < opensea:
+                            print(
+                                f"NFT {data['name']} is a duplicate for {found_nft.title}"
+                            )
+                            continue
+                        else:
+                            print(f"Overwriting {found_nft.title} by {data['name']}")
 
-                    if found_nft.url.startswith("file://"):
-                        found_nft.url = image_url
+                if found_nft.url.startswith("file://"):
+                    found_nft.url = image_url
 
-                    found_nft.title = data["name"]
-                    found_nft.description = data["description"]
-                    found_nft.opensea_url = opensea_url
+                found_nft.title = data["name"]
+                found_nft.description = data["description"]
+                found_nft.opensea_url = opensea_url
+                known_urls.add(opensea_url)
 
-                    print(found_nft)
+                print(found_nft)
             db_session.commit()
         except Exception as e:
             logging.exception(e)
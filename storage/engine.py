@@ -0,0 +1,106 @@
+import os
+import threading
+from typing import Any, List, Optional, Sequence, Tuple
+
+import sqlalchemy
+import sqlalchemy.engine
+import sqlalchemy.orm
+
+from storage.migrations import Migration, migrate
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///test.db")
+# Writers wait for each other instead of failing with "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = 30000
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+_SQLITE_PRAGMAS = (
+    # Readers don't block the writer and the writer doesn't block readers
+    "PRAGMA journal_mode=WAL",
+    # Durable enough with WAL, fsync happens on checkpoints only
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+)
+
+_engine: Optional[sqlalchemy.engine.Engine] = None
+_engine_pid: Optional[int] = None
+_schemas: List[Tuple[sqlalchemy.MetaData, Sequence[Migration]]] = []
+_lock = threading.RLock()
+
+
+def _set_sqlite_pragmas(dbapi_connection: Any, _connection_record: Any) -> None:
+    cursor = dbapi_connection.cursor()
+
+    for pragma in _SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+
+    cursor.close()
+
+
+def _create_schema(
+    engine: sqlalchemy.engine.Engine,
+    metadata: sqlalchemy.MetaData,
+    migrations: Sequence[Migration],
+) -> None:
+    # New tables get everything from the models, existing ones are migrated
+    metadata.create_all(engine)
+    migrate(engine, migrations)
+
+
+def get_engine() -> sqlalchemy.engine.Engine:
+    """
+    Returns the engine of the shared database, creating it on the first call
+
+    There is a single engine per process: connections can't be shared with
+    a forked child, so the child gets its own engine.
+    """
+    global _engine, _engine_pid  # pylint: disable=global-statement
+
+    with _lock:
+        if _engine is None or _engine_pid != os.getpid():
+            engine = sqlalchemy.create_engine(DATABASE_URL)
+
+            if engine.dialect.name == "sqlite":
+                sqlalchemy.event.listen(engine, "connect", _set_sqlite_pragmas)
+
+            for metadata, migrations in _schemas:
+                _create_schema(engine, metadata, migrations)
+
+            _engine, _engine_pid = engine, os.getpid()
+
+        return _engine
+
+
+def register_metadata(
+    metadata: sqlalchemy.MetaData, migrations: Sequence[Migration] = ()
+) -> None:
+    """
+    Makes sure the tables of the metadata exist in the shared database and
+    are up to date with the migrations
+    """
+    with _lock:
+        if any(known is metadata for known, _ in _schemas):
+            return
+
+        _schemas.append((metadata, migrations))
+
+        if _engine is not None and _engine_pid == os.getpid():
+            _create_schema(_engine, metadata, migrations)
+
+
+class _Session(sqlalchemy.orm.Session):
+    """
+    Session bound to the shared engine, so the engine is only created
+    when the database is actually used
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        if kwargs.get("bind") is None:
+            kwargs["bind"] = get_engine()
+
+        super().__init__(**kwargs)
+
+
+# Every thread gets its own session, created on the first use
+session: "sqlalchemy.orm.scoped_session[sqlalchemy.orm.Session]" = (
+    sqlalchemy.orm.scoped_session(sqlalchemy.orm.sessionmaker(class_=_Session))
+)
@@ -0,0 +1,81 @@
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import Callable, List, Sequence
+
+import sqlalchemy
+import sqlalchemy.engine
+
+_metadata = sqlalchemy.MetaData()
+
+schema_migrations = sqlalchemy.Table(
+    "schema_migrations",
+    _metadata,
+    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("applied_at", sqlalchemy.DateTime, nullable=False),
+)
+
+
+@dataclass
+class Migration:
+    """
+    Schema change which is applied once per database
+
+    Ids have to be unique across all the packages sharing the database,
+    `apply` has to be idempotent, as the tables of a new database are
+    created from the models, already containing the change.
+    """
+
+    id: str
+    apply: Callable[[sqlalchemy.engine.Connection], None]
+
+
+def create_index(
+    table: sqlalchemy.Table, name: str
+) -> Callable[[sqlalchemy.engine.Connection], None]:
+    """
+    Returns a migration step creating the index of the table, as it is
+    declared in the model
+    """
+    index = next(index for index in table.indexes if index.name == name)
+
+    def apply(connection: sqlalchemy.engine.Connection) -> None:
+        index.create(connection, checkfirst=True)
+
+    return apply
+
+
+def migrate(
+    engine: sqlalchemy.engine.Engine, migrations: Sequence[Migration]
+) -> List[str]:
+    """
+    Applies the migrations which haven't been applied yet, in order, within
+    a single transaction
+
+    Returns ids of the applied migrations
+    """
+    applied: List[str] = []
+
+    with engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+
+        done = set(
+            connection.execute(sqlalchemy.select(schema_migrations.c.id)).scalars()
+        )
+
+        for migration in migrations:
+            if migration.id in done:
+                continue
+
+            logging.info("Applying migration %s", migration.id)
+
+            migration.apply(connection)
+            connection.execute(
+                schema_migrations.insert().values(
+                    id=migration.id, applied_at=datetime.datetime.utcnow()
+                )
+            )
+
+            applied.append(migration.id)
+
+    return applied
@@ -0,0 +1,26 @@
+from typing import Iterable, Iterator, List, TypeVar
+
+_Value = TypeVar("_Value")
+
+# SQLite limits the number of query parameters, old versions to 999
+IN_QUERY_BATCH_SIZE = 500
+
+
+def batches(
+    values: Iterable[_Value], size: int = IN_QUERY_BATCH_SIZE
+) -> Iterator[List[_Value]]:
+    """
+    Splits the values into lists of up to `size`, by default small enough
+    to be used as parameters of an IN query
+    """
+    batch: List[_Value] = []
+
+    for value in values:
+        batch.append(value)
+
+        if len(batch) == size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
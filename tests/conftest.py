@@ -0,0 +1,38 @@
+import os
+import pathlib
+from typing import Iterator
+
+import pytest
+import sqlalchemy.orm
+
+import storage.engine
+
+_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def uploader_dir(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    # The stub runs in the uploader directory, it has to find the package
+    monkeypatch.setenv(
+        "PYTHONPATH",
+        os.pathsep.join(filter(None, [str(_ROOT), os.environ.get("PYTHONPATH")])),
+    )
+    (tmp_path / "data").mkdir()
+    (tmp_path / "assets").mkdir()
+
+    return str(tmp_path)
+
+
+@pytest.fixture
+def database(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[sqlalchemy.orm.scoped_session]:
+    # Every test gets its own database, the tables are created on first use
+    monkeypatch.setattr(
+        storage.engine, "DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}"
+    )
+    monkeypatch.setattr(storage.engine, "_engine", None)
+
+    yield storage.engine.session
+
+    storage.engine.session.remove()
@@ -0,0 +1,204 @@
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import pytest
+
+from uploader import opensea
+from uploader.opensea import OPENSEA_ASSETS_MAX_TOKEN_IDS, OpenseaClient
+
+# Assets per page of the stub, smaller than a chunk to get several pages
+_PAGE_SIZE = 10
+
+_Response = Tuple[int, Dict[str, str], Any]
+
+
+class _StubOpensea:
+    """
+    Multi-asset endpoint of OpenSea: pages by `_PAGE_SIZE` with a numeric
+    cursor, tokens listed in `unknown` are not returned. `failures` maps a
+    token id to the responses given (one per request) to the chunks
+    containing it before they succeed.
+    """
+
+    def __init__(self) -> None:
+        self.requests: List[Dict[str, List[str]]] = []
+        self.unknown: List[str] = []
+        self.failures: Dict[str, List[_Response]] = {}
+
+    def handle(self, path: str, query: Dict[str, List[str]]) -> _Response:
+        self.requests.append(dict(query, path=[path]))
+
+        token_ids = query.get("token_ids", [])
+
+        for token_id in token_ids:
+            if self.failures.get(token_id):
+                return self.failures[token_id].pop(0)
+
+        address = query["asset_contract_address"][0]
+        found = [token_id for token_id in token_ids if token_id not in self.unknown]
+        page = int(query.get("cursor", ["0"])[0])
+        has_next = (page + 1) * _PAGE_SIZE < len(found)
+
+        return (
+            200,
+            {},
+            {
+                "next": str(page + 1) if has_next else None,
+                "assets": [
+                    {
+                        "token_id": token_id,
+                        "asset_contract": {"address": address},
+                        "image_url": f"https://images/{address}/{token_id}",
+                    }
+                    for token_id in found[page * _PAGE_SIZE : (page + 1) * _PAGE_SIZE]
+                ],
+            },
+        )
+
+
+def _serve(handle: Callable[[str, Dict[str, List[str]]], _Response]) -> Any:
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            url = urllib.parse.urlsplit(self.path)
+            status, headers, body = handle(url.path, urllib.parse.parse_qs(url.query))
+            content = json.dumps(body).encode()
+
+            self.send_response(status)
+
+            for name, value in headers.items():
+                self.send_header(name, value)
+
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    return http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+
+
+@pytest.fixture
+def stub() -> Iterator[_StubOpensea]:
+    yield _StubOpensea()
+
+
+@pytest.fixture
+def client(
+    stub: _StubOpensea, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[OpenseaClient]:
+    monkeypatch.setattr(opensea, "OPENSEA_THROTTLING_BACKOFF", 0.01)
+
+    server = _serve(stub.handle)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    client = OpenseaClient(
+        rate=1000, max_retries=2, api_url=f"http://127.0.0.1:{server.server_port}"
+    )
+
+    yield client
+
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def _numbers(count: int) -> List[str]:
+    return [str(number) for number in range(1, count + 1)]
+
+
+def test_get_assets_follows_the_cursor(
+    client: OpenseaClient, stub: _StubOpensea
+) -> None:
+    assets = client.get_assets("0xa", _numbers(25))
+
+    assert sorted(assets, key=int) == _numbers(25)
+    assert [request.get("cursor") for request in stub.requests] == [
+        None,
+        ["1"],
+        ["2"],
+    ]
+
+
+def test_get_assets_chunks_token_ids(client: OpenseaClient, stub: _StubOpensea) -> None:
+    numbers = _numbers(OPENSEA_ASSETS_MAX_TOKEN_IDS * 2 + 5)
+
+    assets = client.get_assets("0xa", numbers)
+
+    assert sorted(assets, key=int) == numbers
+
+    chunks = [
+        request["token_ids"] for request in stub.requests if "cursor" not in request
+    ]
+
+    assert chunks == [
+        numbers[start : start + OPENSEA_ASSETS_MAX_TOKEN_IDS]
+        for start in range(0, len(numbers), OPENSEA_ASSETS_MAX_TOKEN_IDS)
+    ]
+
+
+def test_get_assets_skips_unknown_tokens(
+    client: OpenseaClient, stub: _StubOpensea
+) -> None:
+    stub.unknown = ["2"]
+
+    assert sorted(client.get_assets("0xa", _numbers(3))) == ["1", "3"]
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_get_assets_keeps_the_chunks_which_succeed(
+    client: OpenseaClient, stub: _StubOpensea, status: int
+) -> None:
+    numbers = _numbers(OPENSEA_ASSETS_MAX_TOKEN_IDS * 3)
+    failing = numbers[OPENSEA_ASSETS_MAX_TOKEN_IDS : OPENSEA_ASSETS_MAX_TOKEN_IDS * 2]
+    # More failures than the client retries
+    stub.failures[failing[0]] = [(status, {"Retry-After": "0"}, {})] * 3
+
+    assets = client.get_assets("0xa", numbers)
+
+    assert sorted(assets, key=int) == [
+        number for number in numbers if number not in failing
+    ]
+    assert not stub.failures[failing[0]]
+
+
+def test_get_assets_waits_for_retry_after(
+    client: OpenseaClient, stub: _StubOpensea
+) -> None:
+    stub.failures["1"] = [(429, {"Retry-After": "1"}, {})]
+
+    started = time.monotonic()
+    assets = client.get_assets("0xa", _numbers(2))
+
+    assert sorted(assets) == ["1", "2"]
+    assert time.monotonic() - started >= 0.9
+    assert len(stub.requests) == 2
+
+
+def test_get_assets_retries_server_errors(
+    client: OpenseaClient, stub: _StubOpensea
+) -> None:
+    stub.failures["1"] = [(502, {}, {}), (503, {}, {})]
+
+    assert sorted(client.get_assets("0xa", _numbers(2))) == ["1", "2"]
+    assert len(stub.requests) == 3
+
+
+def test_get_assets_many_groups_by_contract(
+    client: OpenseaClient, stub: _StubOpensea
+) -> None:
+    pairs = [("0xa", "1"), ("0xb", "1"), ("0xa", "2"), ("0xb", "3"), ("0xa", "1")]
+
+    assets = client.get_assets_many(pairs)
+
+    assert sorted(assets) == sorted(set(pairs))
+    assert assets[("0xb", "3")]["asset_contract"]["address"] == "0xb"
+    assert sorted(
+        (request["asset_contract_address"][0], request["token_ids"])
+        for request in stub.requests
+    ) == [("0xa", ["1", "2"]), ("0xb", ["1", "3"])]
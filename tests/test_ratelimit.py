@@ -0,0 +1,48 @@
+import threading
+import time
+from typing import List
+
+import pytest
+
+from vk.ratelimit import TokenBucket
+
+
+def _acquire_all(bucket: TokenBucket, callers: int) -> List[float]:
+    """
+    Returns when each of the callers got its token, since the start
+    """
+    started = time.monotonic()
+    fired: List[float] = []
+    lock = threading.Lock()
+
+    def acquire() -> None:
+        bucket.acquire()
+
+        with lock:
+            fired.append(time.monotonic() - started)
+
+    threads = [threading.Thread(target=acquire) for _ in range(callers)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return sorted(fired)
+
+
+def test_bucket_paces_callers() -> None:
+    fired = _acquire_all(TokenBucket(rate=20, capacity=1), 5)
+
+    assert fired[-1] == pytest.approx(0.2, abs=0.08)
+
+
+def test_callers_are_spread_after_backoff() -> None:
+    bucket = TokenBucket(rate=10)
+    bucket.on_throttled(0.5)
+
+    # The rate is halved, the callers go one by one after the backoff
+    fired = _acquire_all(bucket, 6)
+
+    assert fired == pytest.approx([0.5, 0.7, 0.9, 1.1, 1.3, 1.5], abs=0.08)
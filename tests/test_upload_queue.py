@@ -0,0 +1,47 @@
+import time
+
+import sqlalchemy.orm
+
+from uploader.models import NFT, create_database
+from uploader.upload_queue import UploadQueue
+
+create_database()
+
+
+def _enqueue(database: sqlalchemy.orm.scoped_session, queue: UploadQueue) -> None:
+    database.add_all([NFT(id=nft_id, hash=f"hash{nft_id}") for nft_id in (1, 2)])
+    database.commit()
+    queue.enqueue([1, 2])
+
+
+def test_extended_lease_is_not_claimed_again(
+    database: sqlalchemy.orm.scoped_session,
+) -> None:
+    queue = UploadQueue(database(), lease_seconds=0.3)
+    _enqueue(database, queue)
+
+    lease = queue.claim(10)
+    assert lease is not None
+
+    for _ in range(3):
+        time.sleep(0.15)
+        assert queue.extend(lease)
+
+    # Twice the lease duration has passed since the claim
+    assert queue.claim(10) is None
+
+
+def test_expired_lease_claimed_by_another_processor_is_lost(
+    database: sqlalchemy.orm.scoped_session,
+) -> None:
+    queue = UploadQueue(database(), lease_seconds=0.1)
+    _enqueue(database, queue)
+
+    lease = queue.claim(10)
+    time.sleep(0.2)
+    other = queue.claim(10)
+
+    assert lease is not None and other is not None
+    assert other.nft_ids == lease.nft_ids
+    assert not queue.extend(lease)
+    assert queue.extend(other)
@@ -0,0 +1,166 @@
+import json
+import os
+import sys
+from typing import Callable, Iterator, List
+
+import pytest
+
+from uploader.uploader_session import (
+    UploaderSession,
+    UploaderSessionError,
+    UploaderSessionPool,
+)
+
+
+def _command(*args: str) -> List[str]:
+    return [sys.executable, "-m", "uploader.uploader_stub", *args]
+
+
+@pytest.fixture
+def nft_file(uploader_dir: str) -> str:
+    path = os.path.join(uploader_dir, "data", "test.json")
+
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"nft": [{"nft_name": "Mem #1", "file_path": "nft_1_a.jpg"}]}, file)
+
+    return path
+
+
+@pytest.fixture
+def pool() -> Iterator[Callable[..., UploaderSessionPool]]:
+    pools: List[UploaderSessionPool] = []
+
+    def make(*args: str, max_uploads: int = 20) -> UploaderSessionPool:
+        pools.append(UploaderSessionPool(_command(*args), max_uploads=max_uploads))
+        return pools[-1]
+
+    yield make
+
+    for made in pools:
+        made.close()
+
+
+def test_session_is_ready_after_start(uploader_dir: str) -> None:
+    session = UploaderSession(_command("--startup-delay", "0.2"), uploader_dir)
+
+    try:
+        session.start()
+
+        assert session.is_alive()
+        assert session.ping()
+    finally:
+        session.close()
+
+    assert not session.is_alive()
+
+
+def test_session_start_times_out(uploader_dir: str) -> None:
+    session = UploaderSession(
+        _command("--startup-delay", "2"), uploader_dir, startup_timeout=0.3
+    )
+
+    try:
+        with pytest.raises(UploaderSessionError):
+            session.start()
+    finally:
+        session.close()
+
+
+def test_session_writes_sale_files(uploader_dir: str, nft_file: str) -> None:
+    session = UploaderSession(
+        _command("--sale-url-prefix", "https://opensea.io/assets/matic/0xa"),
+        uploader_dir,
+    )
+
+    try:
+        session.start()
+        session.upload(nft_file)
+    finally:
+        session.close()
+
+    with open(
+        os.path.join(uploader_dir, "data", "sale_1.json"), encoding="utf-8"
+    ) as file:
+        sale = json.load(file)
+
+    assert sale["nft"] == [
+        {
+            "nft_url": "https://opensea.io/assets/matic/0xa/10",
+            "nft_name": "Mem #1",
+            "file_path": "nft_1_a.jpg",
+        }
+    ]
+
+
+def test_pool_reuses_warm_session(
+    pool: Callable[..., UploaderSessionPool], uploader_dir: str, nft_file: str
+) -> None:
+    sessions = pool()
+
+    with sessions.session(uploader_dir) as first:
+        first.upload(nft_file)
+
+    with sessions.session(uploader_dir) as second:
+        second.upload(nft_file)
+
+    assert second is first
+    assert second.uploads == 2
+    assert second.is_alive()
+
+
+def test_pool_recycles_after_max_uploads(
+    pool: Callable[..., UploaderSessionPool], uploader_dir: str, nft_file: str
+) -> None:
+    sessions = pool(max_uploads=2)
+
+    with sessions.session(uploader_dir) as first:
+        first.upload(nft_file)
+
+    with sessions.session(uploader_dir) as session:
+        session.upload(nft_file)
+
+    assert session is first
+    assert not first.is_alive()
+
+    with sessions.session(uploader_dir) as third:
+        assert third is not first
+        assert third.uploads == 0
+
+
+def test_pool_recycles_failed_session(
+    pool: Callable[..., UploaderSessionPool], uploader_dir: str, nft_file: str
+) -> None:
+    sessions = pool("--fail-every", "2")
+
+    with sessions.session(uploader_dir) as first:
+        first.upload(nft_file)
+
+    with pytest.raises(UploaderSessionError):
+        with sessions.session(uploader_dir) as session:
+            assert session is first
+            session.upload(nft_file)
+
+    assert not first.is_alive()
+
+    with sessions.session(uploader_dir) as second:
+        assert second is not first
+        second.upload(nft_file)
+
+
+def test_dead_session_fails_ping(
+    pool: Callable[..., UploaderSessionPool], uploader_dir: str
+) -> None:
+    sessions = pool()
+
+    with sessions.session(uploader_dir) as first:
+        pass
+
+    assert first._process is not None  # pylint: disable=protected-access
+    first._process.kill()  # pylint: disable=protected-access
+    first._process.wait()  # pylint: disable=protected-access
+
+    assert not first.ping(timeout=1)
+
+    with sessions.session(uploader_dir) as second:
+        assert second is not first
+        assert second.ping()
@@ -0,0 +1,82 @@
+import pathlib
+import sys
+from typing import Iterator, List, Optional
+
+import pytest
+import sqlalchemy.orm
+
+from uploader.models import NFT
+from uploader.uploader_session import UploaderSessionPool
+from uploader.worker import (
+    File,
+    OpenseaAutomaticUploaderAuthData,
+    OpenseaAutomaticUploaderParams,
+    OpenseaAutomaticWorker,
+)
+
+_ASSETS_URL = "https://opensea.io/assets/matic/0xa"
+
+
+def _command(*args: str) -> List[str]:
+    return [sys.executable, "-m", "uploader.uploader_stub", *args]
+
+
+def _get_files(
+    self: OpenseaAutomaticWorker, dst_dir: str, ids: Optional[List[int]] = None
+) -> Iterator[File]:
+    for nft_id in ids or []:
+        path = pathlib.Path(dst_dir) / f"nft_{nft_id}_a.jpg"
+        path.write_bytes(b"")
+
+        yield File(nft_id, path, f"Mem #{nft_id}", "")
+
+
+def test_failed_batch_keeps_uploaded_nfts(
+    database: sqlalchemy.orm.scoped_session,
+    uploader_dir: str,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    database.add_all(
+        [
+            NFT(id=nft_id, hash=f"hash{nft_id}", title=f"Mem #{nft_id}")
+            for nft_id in (1, 2, 3)
+        ]
+    )
+    database.commit()
+    monkeypatch.setattr(OpenseaAutomaticWorker, "_get_files", _get_files)
+
+    # The batch fails after two of its NFTs are uploaded
+    sessions = UploaderSessionPool(
+        _command(
+            "--sale-url-prefix",
+            _ASSETS_URL,
+            "--fail-every",
+            "1",
+            "--fail-after",
+            "2",
+        )
+    )
+    params = OpenseaAutomaticUploaderParams(
+        collection="memes",
+        uploader_dir=uploader_dir,
+        auth_data=OpenseaAutomaticUploaderAuthData(),
+        batch_size=3,
+        session_pool=sessions,
+    )
+    worker = OpenseaAutomaticWorker([1, 2, 3], params)
+
+    try:
+        uploaded = worker.upload()
+    finally:
+        sessions.close()
+
+    assert uploaded == [1, 2]
+    assert not worker.unresolved_ids
+
+    database.remove()
+
+    assert {nft.id: (nft.uploaded, nft.opensea_url) for nft in database.query(NFT)} == {
+        1: (True, f"{_ASSETS_URL}/10"),
+        2: (True, f"{_ASSETS_URL}/11"),
+        3: (False, None),
+    }
@@ -0,0 +1,19 @@
+import logging
+import os
+
+from uploader.models import create_database
+from uploader.perceptual import backfill_perceptual_hashes, load_index
+
+db_session = create_database()
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+# Max hamming distance between perceptual hashes of the same picture
+_PERCEPTUAL_HASH_THRESHOLD = int(os.environ.get("PERCEPTUAL_HASH_THRESHOLD", "5"))
+
+# Run once for the NFTs stored before the perceptual hashes were, the
+# scheduler hashes the new ones itself
+backfill_perceptual_hashes(
+    db_session(), load_index(db_session(), _PERCEPTUAL_HASH_THRESHOLD)
+)
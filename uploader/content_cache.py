@@ -0,0 +1,328 @@
+import hashlib
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple, Union
+
+# Memory tier keeps only the hottest images, the disk tier keeps the rest
+CONTENT_CACHE_MEMORY_BYTES = 64 * 1024 * 1024
+CONTENT_CACHE_DISK_BYTES = 2 * 1024 * 1024 * 1024
+# Url -> hash mapping is tiny, but still shouldn't grow forever
+_MAX_URLS = 1 << 16
+# The directory is scanned (and evicted) every time this fraction of the
+# disk budget is written by the process
+_DISK_SCAN_FRACTION = 16
+
+
+class ContentTooLargeError(ValueError):
+    pass
+
+
+@dataclass
+class CachedFile:
+    hash: str
+    length: int
+    # Can be evicted at any moment, see ContentCache.copy_file
+    path: pathlib.Path
+
+
+class ContentCache:
+    """
+    Bounded cache of the downloaded content, keyed by url and by hash
+
+    Content is kept on disk up to `max_disk_bytes`, so it survives restarts
+    and is shared between processes, the scheduler and the worker for
+    instance. The hottest content is also kept in memory up to
+    `max_memory_bytes`. Both tiers evict the least recently used entries
+    first.
+
+    The disk usage (url files included) is taken from the directory
+    itself, which is scanned every `max_disk_bytes / _DISK_SCAN_FRACTION`
+    bytes written, so the limit holds for all the processes sharing it.
+    Entries are aged by their mtime, objects are touched on every hit.
+
+    Disk layout:
+        objects/<sha256> - the content itself
+        urls/<sha256 of the url> - sha256 of the content found at the url
+    """
+
+    _memory: "OrderedDict[str, bytes]"
+    _urls: "OrderedDict[str, str]"
+
+    def __init__(
+        self,
+        directory: Union[str, pathlib.Path],
+        max_memory_bytes: int = CONTENT_CACHE_MEMORY_BYTES,
+        max_disk_bytes: int = CONTENT_CACHE_DISK_BYTES,
+    ) -> None:
+        self._max_memory_bytes = max_memory_bytes
+        self._max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._urls = OrderedDict()
+        # Written by this process since the directory was scanned
+        self._unscanned_bytes = 0
+        self._lock = threading.RLock()
+        self._directory = pathlib.Path(directory)
+
+        self._load_disk()
+
+    def _objects_dir(self) -> pathlib.Path:
+        return self._directory / "objects"
+
+    def _urls_dir(self) -> pathlib.Path:
+        return self._directory / "urls"
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _load_disk(self) -> None:
+        self._objects_dir().mkdir(parents=True, exist_ok=True)
+        self._urls_dir().mkdir(parents=True, exist_ok=True)
+
+        self._evict_disk()
+
+    @staticmethod
+    def _usage(stat: os.stat_result) -> int:
+        # Tiny url files take a whole block each
+        return max(stat.st_size, getattr(stat, "st_blocks", 0) * 512)
+
+    @classmethod
+    def _scan(cls, directory: pathlib.Path) -> List[Tuple[float, int, str]]:
+        """
+        Returns (mtime, disk usage, path) of the entries, without the files
+        being written
+        """
+        entries = []
+
+        for entry in os.scandir(directory):
+            if entry.name.startswith("."):
+                continue
+
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            entries.append((stat.st_mtime, cls._usage(stat), entry.path))
+
+        return entries
+
+    @staticmethod
+    def _write_atomic(path: pathlib.Path, content: bytes) -> None:
+        descriptor, tmp_file = tempfile.mkstemp(dir=path.parent, prefix=".")
+
+        try:
+            with open(descriptor, "wb") as file:
+                file.write(content)
+
+            os.replace(tmp_file, path)
+        except BaseException:
+            os.unlink(tmp_file)
+            raise
+
+    def _evict_memory(self) -> None:
+        while self._memory_bytes > self._max_memory_bytes and self._memory:
+            _, content = self._memory.popitem(last=False)
+            self._memory_bytes -= len(content)
+
+    def _evict_disk(self) -> None:
+        objects = sorted(self._scan(self._objects_dir()))
+        urls = self._scan(self._urls_dir())
+        disk_bytes = sum(usage for _, usage, _ in objects + urls)
+        evicted = 0
+
+        # The latest object is kept even if it's larger than the limit on
+        # its own, so it can still be copied out
+        for _, usage, path in sorted(objects[:-1] + urls):
+            if disk_bytes <= self._max_disk_bytes:
+                break
+
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Evicted by another process
+                pass
+
+            disk_bytes -= usage
+            evicted += 1
+
+        self._unscanned_bytes = 0
+
+        logging.debug(
+            "Content cache has %s bytes on disk, %s files evicted",
+            disk_bytes,
+            evicted,
+        )
+
+    def _remember_url(self, url: str, hash_: str) -> None:
+        self._urls[url] = hash_
+        self._urls.move_to_end(url)
+
+        while len(self._urls) > _MAX_URLS:
+            self._urls.popitem(last=False)
+
+    def _hash_of(self, url: str) -> Optional[str]:
+        hash_ = self._urls.get(url)
+
+        if hash_ is not None:
+            self._urls.move_to_end(url)
+            return hash_
+
+        try:
+            hash_ = (self._urls_dir() / self._url_key(url)).read_text().strip()
+        except FileNotFoundError:
+            return None
+
+        self._remember_url(url, hash_)
+
+        return hash_
+
+    def _add_disk(self, *paths: pathlib.Path) -> None:
+        for path in paths:
+            try:
+                self._unscanned_bytes += self._usage(os.stat(path))
+            except FileNotFoundError:
+                # Evicted by another process already
+                pass
+
+        if self._unscanned_bytes * _DISK_SCAN_FRACTION > self._max_disk_bytes:
+            self._evict_disk()
+
+    def _put_memory(self, hash_: str, content: bytes) -> None:
+        if len(content) > self._max_memory_bytes:
+            return
+
+        if hash_ not in self._memory:
+            self._memory_bytes += len(content)
+
+        self._memory[hash_] = content
+        self._memory.move_to_end(hash_)
+        self._evict_memory()
+
+    def get_by_hash(self, hash_: str) -> Optional[bytes]:
+        with self._lock:
+            content = self._memory.get(hash_)
+
+            if content is not None:
+                self._memory.move_to_end(hash_)
+                return content
+
+            path = self._objects_dir() / hash_
+
+            try:
+                content = path.read_bytes()
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted by another process, or never stored
+                return None
+
+            self._put_memory(hash_, content)
+
+            return content
+
+    def get(self, url: str) -> Optional[bytes]:
+        with self._lock:
+            hash_ = self._hash_of(url)
+
+            return self.get_by_hash(hash_) if hash_ is not None else None
+
+    def get_file(self, url: str) -> Optional[CachedFile]:
+        with self._lock:
+            hash_ = self._hash_of(url)
+
+            if hash_ is None:
+                return None
+
+            path = self._objects_dir() / hash_
+
+            try:
+                length = path.stat().st_size
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+
+            return CachedFile(hash_, length, path)
+
+    def copy_file(self, hash_: str, destination: Union[str, pathlib.Path]) -> bool:
+        """
+        Copies the content to the destination (replacing it), returns False
+        if it isn't in the cache anymore
+
+        The content is hard linked when possible, under the lock, so it
+        can't be evicted by this process meanwhile, and the copy stays once
+        the cache entry is evicted (by any process).
+        """
+        path = self._objects_dir() / hash_
+        destination = pathlib.Path(destination)
+        tmp_file = destination.with_name(f".{destination.name}.tmp")
+
+        with self._lock:
+            try:
+                if os.path.lexists(tmp_file):
+                    os.unlink(tmp_file)
+
+                try:
+                    os.link(path, tmp_file)
+                except FileNotFoundError:
+                    raise
+                except OSError:
+                    # Another file system, or no hard links there
+                    shutil.copyfile(path, tmp_file)
+
+                os.replace(tmp_file, destination)
+            except FileNotFoundError:
+                # Evicted by another process
+                return False
+
+            return True
+
+    def _store(self, url: str, hash_: str, length: int, tmp_file: str) -> CachedFile:
+        path = self._objects_dir() / hash_
+
+        url_path = self._urls_dir() / self._url_key(url)
+
+        with self._lock:
+            os.replace(tmp_file, path)
+            self._write_atomic(url_path, hash_.encode())
+            self._remember_url(url, hash_)
+            self._add_disk(path, url_path)
+
+        return CachedFile(hash_, length, path)
+
+    def spool(
+        self, url: str, chunks: Iterable[bytes], max_size: Optional[int] = None
+    ) -> CachedFile:
+        """
+        Writes the content of the url to disk chunk by chunk, hashing it on
+        the way, so the whole content is never held in memory
+
+        Raises ContentTooLargeError as soon as `max_size` bytes are exceeded
+        """
+        hasher = hashlib.sha256()
+        length = 0
+        descriptor, tmp_file = tempfile.mkstemp(dir=self._objects_dir(), prefix=".")
+
+        try:
+            with open(descriptor, "wb") as file:
+                for chunk in chunks:
+                    length += len(chunk)
+
+                    if max_size is not None and length > max_size:
+                        raise ContentTooLargeError(
+                            f"Content of {url} is larger than {max_size} bytes"
+                        )
+
+                    hasher.update(chunk)
+                    file.write(chunk)
+        except BaseException:
+            os.unlink(tmp_file)
+            raise
+
+        return self._store(url, hasher.hexdigest(), length, tmp_file)
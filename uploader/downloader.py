@@ -0,0 +1,172 @@
+import concurrent.futures
+import logging
+import threading
+import urllib.parse
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, Tuple
+
+import requests
+import requests.adapters
+
+from uploader.content_cache import CachedFile, ContentCache, ContentTooLargeError
+
+DOWNLOAD_MAX_WORKERS = 16
+DOWNLOAD_MAX_PER_HOST = 8
+DOWNLOAD_MAX_IN_FLIGHT = 64
+DOWNLOAD_TIMEOUT = (5.0, 30.0)
+DOWNLOAD_MAX_SIZE = 64 * 1024 * 1024
+_CHUNK_SIZE = 64 * 1024
+
+
+class DownloadEngine:
+    """
+    Downloads images concurrently with a bounded thread pool
+
+    All the requests go through one pooled keep-alive session. The number
+    of concurrent requests to the same host is limited by `max_per_host`,
+    the number of submitted, but not finished downloads by `max_in_flight`
+    (`submit` blocks when the limit is reached). The same url is never
+    downloaded twice at the same time.
+
+    Response bodies are streamed straight into the content cache, hashed
+    on the way, so the memory used by a download doesn't depend on the
+    image size. Urls found in the cache are not downloaded at all.
+    """
+
+    _futures: Dict[str, "concurrent.futures.Future[CachedFile]"]
+    _host_limits: Dict[str, threading.BoundedSemaphore]
+
+    def __init__(
+        self,
+        cache: ContentCache,
+        max_workers: int = DOWNLOAD_MAX_WORKERS,
+        max_per_host: int = DOWNLOAD_MAX_PER_HOST,
+        max_in_flight: int = DOWNLOAD_MAX_IN_FLIGHT,
+        timeout: Tuple[float, float] = DOWNLOAD_TIMEOUT,
+        max_size: int = DOWNLOAD_MAX_SIZE,
+    ) -> None:
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix="download"
+        )
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=max_workers, pool_maxsize=max_per_host
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self._cache = cache
+        self._timeout = timeout
+        self._max_size = max_size
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._host_limits = defaultdict(
+            lambda: threading.BoundedSemaphore(max_per_host)
+        )
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        self._session.close()
+
+    def _get(self, url: str) -> CachedFile:
+        with self._lock:
+            host_limit = self._host_limits[urllib.parse.urlsplit(url).netloc]
+
+        with host_limit:
+            logging.debug("Downloading %s", url)
+
+            with self._session.get(url, timeout=self._timeout, stream=True) as response:
+                response.raise_for_status()
+
+                if int(response.headers.get("Content-Length", 0)) > self._max_size:
+                    raise ContentTooLargeError(
+                        f"Content of {url} is larger than {self._max_size} bytes"
+                    )
+
+                return self._cache.spool(
+                    url, response.iter_content(_CHUNK_SIZE), self._max_size
+                )
+
+    def _download(self, url: str) -> CachedFile:
+        try:
+            cached = self._cache.get_file(url)
+
+            return cached if cached is not None else self._get(url)
+        finally:
+            with self._lock:
+                self._futures.pop(url, None)
+
+            self._in_flight.release()
+
+    def submit(self, url: str) -> "concurrent.futures.Future[CachedFile]":
+        with self._lock:
+            future = self._futures.get(url)
+
+            if future is not None:
+                return future
+
+        self._in_flight.acquire()
+
+        with self._lock:
+            # Could have been submitted while waiting for the slot
+            future = self._futures.get(url)
+
+            if future is not None:
+                self._in_flight.release()
+                return future
+
+            future = self._futures[url] = self._executor.submit(self._download, url)
+
+        return future
+
+    def download_file(self, url: str) -> CachedFile:
+        return self.submit(url).result()
+
+    def _read(self, url: str, cached: CachedFile) -> bytes:
+        content = self._cache.get_by_hash(cached.hash)
+
+        if content is None:
+            raise RuntimeError(f"Content of {url} was evicted from the cache")
+
+        return content
+
+    def download_to(self, url: str, destination: str, attempts: int = 3) -> CachedFile:
+        """
+        Downloads the url into the destination file through the cache
+
+        Content evicted before it's copied out (by a concurrent download or
+        another process sharing the cache) is downloaded again
+        """
+        for _ in range(attempts):
+            cached = self.download_file(url)
+
+            if self._cache.copy_file(cached.hash, destination):
+                return cached
+
+            logging.warning("Content of %s was evicted, downloading again", url)
+
+        raise RuntimeError(f"Content of {url} keeps being evicted from the cache")
+
+    def download(self, url: str) -> bytes:
+        return self._read(url, self.download_file(url))
+
+    def download_many(self, urls: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        """
+        Yields (url, content) pairs in the order the downloads finish
+
+        Failed downloads are logged and skipped, so one bad url doesn't
+        stop the rest
+        """
+        futures = {self.submit(url): url for url in urls}
+
+        for future in concurrent.futures.as_completed(futures):
+            url = futures[future]
+
+            try:
+                content = self._read(url, future.result())
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Can't download %s", url)
+                continue
+
+            yield url, content
@@ -0,0 +1,90 @@
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import sqlalchemy
+import sqlalchemy.orm
+
+from storage.utils import batches
+from uploader.models import ContentHash
+from uploader.utils import download_and_generate_hash, get_download_engine
+
+
+def get_content_hash(
+    db_session: sqlalchemy.orm.session.Session,
+    url: str,
+    vk_photo_id: Optional[str] = None,
+) -> str:
+    """
+    Returns the hash of the content at the url
+
+    Content is downloaded only the first time the url (or VK photo, whose
+    urls can change over time) is seen, afterwards the hash is taken from
+    the persistent index. The new index entry is added to the session, but
+    not committed.
+    """
+    condition = ContentHash.url == url
+
+    if vk_photo_id is not None:
+        condition = sqlalchemy.or_(condition, ContentHash.vk_photo_id == vk_photo_id)
+
+    known = db_session.query(ContentHash).filter(condition).first()
+
+    if known:
+        logging.debug("Content hash is known: %s", known)
+        return known.hash
+
+    content_hash = download_and_generate_hash(url)
+
+    db_session.merge(ContentHash(url=url, vk_photo_id=vk_photo_id, hash=content_hash))
+
+    return content_hash
+
+
+def get_content_hashes(
+    db_session: sqlalchemy.orm.session.Session,
+    photos: Sequence[Tuple[str, str]],
+) -> List[Optional[str]]:
+    """
+    Bulk version of get_content_hash for (url, vk photo id) pairs
+
+    The index is checked with one query per batch, unknown content is
+    downloaded concurrently. New index entries are added to the session,
+    but not committed. Failed downloads are logged and their photos have
+    no hash (None), so one bad url doesn't stop the rest.
+    """
+    known: Dict[str, str] = {}
+
+    for batch in batches(photos):
+        urls = [url for url, _ in batch]
+        vk_photo_ids = [vk_photo_id for _, vk_photo_id in batch]
+
+        for content_hash in db_session.query(ContentHash).filter(
+            sqlalchemy.or_(
+                ContentHash.url.in_(urls), ContentHash.vk_photo_id.in_(vk_photo_ids)
+            )
+        ):
+            known[content_hash.url] = content_hash.hash
+
+            if content_hash.vk_photo_id is not None:
+                known[content_hash.vk_photo_id] = content_hash.hash
+
+    unknown = {
+        url: vk_photo_id
+        for url, vk_photo_id in photos
+        if url not in known and vk_photo_id not in known
+    }
+
+    # Everything is submitted first, so the downloads run concurrently
+    for url in unknown:
+        get_download_engine().submit(url)
+
+    for url, vk_photo_id in unknown.items():
+        try:
+            known[url] = known[vk_photo_id] = download_and_generate_hash(url)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Can't download %s", url)
+            continue
+
+        db_session.add(ContentHash(url=url, vk_photo_id=vk_photo_id, hash=known[url]))
+
+    return [known.get(url, known.get(vk_photo_id)) for url, vk_photo_id in photos]
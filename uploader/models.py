@@ -1,3 +1,4 @@
+import datetime
 import enum
 
 # import pg8000
@@ -7,6 +8,9 @@ import sqlalchemy.orm
 # from google.cloud.sql.connector import connector
 from sqlalchemy.orm.decl_api import DeclarativeMeta
 
+import storage.engine
+from storage.migrations import Migration, create_index
+
 mapper_registry = sqlalchemy.orm.registry()
 
 
@@ -32,7 +36,7 @@ class NFT(Base):
 
     url = sqlalchemy.Column(sqlalchemy.String, comment="URL of the picture")
     opensea_url = sqlalchemy.Column(
-        sqlalchemy.String, comment="URL of the asset on OpenSea"
+        sqlalchemy.String, comment="URL of the asset on OpenSea", index=True
     )
     title = sqlalchemy.Column(sqlalchemy.String, comment="Title of the NFT")
     description = sqlalchemy.Column(sqlalchemy.String, comment="Description of the NFT")
@@ -40,6 +44,17 @@ class NFT(Base):
         sqlalchemy.Boolean, comment="Was NFT uploaded to OpenSea?", default=False
     )
 
+    __table_args__ = (
+        # Only the pending uploads are indexed, so the upload queue lookup
+        # doesn't depend on the number of already uploaded NFTs
+        sqlalchemy.Index(
+            "ix_nft_pending_upload",
+            "id",
+            sqlite_where=uploaded == sqlalchemy.false(),
+            postgresql_where=uploaded == sqlalchemy.false(),
+        ),
+    )
+
     def __repr__(self) -> str:
         return (
             f"<NFT("
@@ -54,12 +69,126 @@ class NFT(Base):
         )
 
 
-def create_database(engine: sqlalchemy.engine.Engine) -> sqlalchemy.orm.session.Session:
-    Base.metadata.create_all(engine)
+class NFTPerceptualHash(Base):
+    """
+    Perceptual hash of the NFT picture, to find its near-duplicates
+    """
+
+    __tablename__ = "nft_perceptual_hash"
+
+    nft_id = sqlalchemy.Column(
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("nft.id"), primary_key=True
+    )
+    hash = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        comment="64-bit difference hash, stored as a signed integer",
+        nullable=False,
+    )
+
+    def __repr__(self) -> str:
+        return f"<NFTPerceptualHash(" f"nft_id={self.nft_id}, " f"hash={self.hash}" ")>"
+
+
+class UploadQueueItem(Base):
+    """
+    NFT waiting to be uploaded, see uploader.upload_queue
+    """
+
+    __tablename__ = "upload_queue"
+
+    nft_id = sqlalchemy.Column(
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("nft.id"), primary_key=True
+    )
+    lease_id = sqlalchemy.Column(
+        sqlalchemy.String, comment="Lease of the worker holding the item", index=True
+    )
+    leased_until = sqlalchemy.Column(
+        sqlalchemy.DateTime, comment="Item is released after this time (UTC)"
+    )
+    available_at = sqlalchemy.Column(
+        sqlalchemy.DateTime,
+        comment="Item can't be claimed before this time (UTC)",
+        nullable=False,
+    )
+    attempts = sqlalchemy.Column(
+        sqlalchemy.Integer, comment="How many times the item was claimed", default=0
+    )
+    last_error = sqlalchemy.Column(
+        sqlalchemy.String, comment="Why the last attempt failed"
+    )
 
-    session_maker = sqlalchemy.orm.sessionmaker()
-    session_maker.configure(bind=engine)
-    session = session_maker()
-    session.commit()
+    def __repr__(self) -> str:
+        return (
+            f"<UploadQueueItem("
+            f"nft_id={self.nft_id}, "
+            f"lease_id={self.lease_id}, "
+            f"leased_until={self.leased_until}, "
+            f"available_at={self.available_at}, "
+            f"attempts={self.attempts}, "
+            f"last_error={self.last_error}"
+            ")>"
+        )
+
+
+class ContentHash(Base):
+    """
+    Hash of the content found at the url, so it doesn't have to be
+    downloaded again to be recognized
+    """
+
+    __tablename__ = "content_hash"
+
+    url = sqlalchemy.Column(sqlalchemy.String, primary_key=True, comment="Source URL")
+    vk_photo_id = sqlalchemy.Column(
+        sqlalchemy.String, comment="VK photo id in the owner_id_id form", index=True
+    )
+    hash = sqlalchemy.Column(
+        sqlalchemy.String, comment="Hash of the content", nullable=False, index=True
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"<ContentHash("
+            f"url={self.url}, "
+            f"vk_photo_id={self.vk_photo_id}, "
+            f"hash={self.hash}"
+            ")>"
+        )
+
+
+def _enqueue_pending_nfts(connection: sqlalchemy.engine.Connection) -> None:
+    # Before the queue, everything not uploaded yet was pending
+    pending = sqlalchemy.select(
+        NFT.id, sqlalchemy.literal(datetime.datetime.utcnow()), sqlalchemy.literal(0)
+    ).where(
+        NFT.uploaded == sqlalchemy.false(),
+        NFT.id.not_in(sqlalchemy.select(UploadQueueItem.nft_id)),
+    )
+
+    connection.execute(
+        sqlalchemy.insert(UploadQueueItem).from_select(
+            ["nft_id", "available_at", "attempts"], pending
+        )
+    )
+
+
+MIGRATIONS = [
+    Migration(
+        "nft_0001_opensea_url_index",
+        create_index(NFT.__table__, "ix_nft_opensea_url"),
+    ),
+    Migration(
+        "nft_0002_pending_upload_index",
+        create_index(NFT.__table__, "ix_nft_pending_upload"),
+    ),
+    Migration("upload_queue_0001_enqueue_pending", _enqueue_pending_nfts),
+]
+
+
+def create_database() -> sqlalchemy.orm.scoped_session:
+    """
+    Returns the thread-local session of the shared database, see storage.engine
+    """
+    storage.engine.register_metadata(Base.metadata, MIGRATIONS)
 
-    return session
+    return storage.engine.session
@@ -0,0 +1,63 @@
+from typing import Any, Dict, Iterable, Mapping, Sequence, Set
+
+import sqlalchemy
+import sqlalchemy.orm
+
+from storage.utils import batches
+from uploader.models import NFT
+
+
+def known_hashes(
+    db_session: sqlalchemy.orm.session.Session, hashes: Iterable[str]
+) -> Set[str]:
+    """
+    Returns the hashes which already have an NFT, with one query per batch
+    """
+    known: Set[str] = set()
+
+    for batch in batches(set(hashes)):
+        known.update(
+            nft_hash
+            for nft_hash, in db_session.query(NFT.hash).filter(NFT.hash.in_(batch))
+        )
+
+    return known
+
+
+def insert_nfts(
+    db_session: sqlalchemy.orm.session.Session,
+    rows: Sequence[Mapping[str, Any]],
+    title_prefix: str = "Mem #",
+) -> Dict[str, int]:
+    """
+    Inserts NFT rows (column name -> value, hash is required) and titles
+    them `title_prefix` followed by their id
+
+    Returns ids of the inserted NFTs by hash. Rows are inserted with a
+    single executemany and titled with a single UPDATE, nothing is
+    committed, so the whole page can be stored in one transaction.
+    """
+    if not rows:
+        return {}
+
+    db_session.execute(sqlalchemy.insert(NFT), list(rows))
+
+    nft_ids: Dict[str, int] = {}
+
+    for batch in batches(row["hash"] for row in rows):
+        nft_ids.update(
+            db_session.query(NFT.hash, NFT.id).filter(NFT.hash.in_(batch)).all()
+        )
+
+    for batch in batches(nft_ids.values()):
+        db_session.execute(
+            sqlalchemy.update(NFT)
+            .where(NFT.id.in_(batch))
+            .values(
+                title=sqlalchemy.literal(title_prefix)
+                + sqlalchemy.cast(NFT.id, sqlalchemy.String)
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    return nft_ids
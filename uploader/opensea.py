@@ -0,0 +1,225 @@
+import email.utils
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+import requests.adapters
+
+from vk.jsonlib import loads
+from vk.ratelimit import TokenBucket
+
+OPENSEA_API_URL = "https://api.opensea.io/api/v1"
+# Quota of the API without a key
+OPENSEA_REQUESTS_PER_SECOND = 2.0
+OPENSEA_MAX_RETRIES = 5
+# Used when a throttled response doesn't say when to come back
+OPENSEA_THROTTLING_BACKOFF = 1.0
+OPENSEA_TIMEOUT = (5.0, 30.0)
+# Limits of the multi-asset endpoint
+OPENSEA_ASSETS_MAX_TOKEN_IDS = 30
+OPENSEA_ASSETS_PAGE_SIZE = 50
+_USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) "
+    "AppleWebKit/537.36 "
+    "(KHTML, like Gecko) "
+    "Chrome/103.0.5060.53 Safari/537.36"
+)
+
+
+class OpenseaApiError(RuntimeError):
+    pass
+
+
+def parse_asset_url(opensea_url: str) -> Tuple[str, str]:
+    """
+    Returns (contract address, token id) of an OpenSea asset url
+    """
+    # Remove any extra get params from the url
+    _, _, _, _, _, address, number = opensea_url.split("?")[0].split("/")
+
+    return address, number
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """
+    Parses the Retry-After header, which is either seconds or a date
+    """
+    value = response.headers.get("Retry-After")
+
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class OpenseaClient:
+    """
+    OpenSea API client, can be shared by any number of threads
+
+    Requests are paced by a token bucket tuned to the API quota. Throttled
+    (429) and unavailable (5xx) responses are retried after Retry-After,
+    or an exponential backoff when it's missing, throttling also slows the
+    bucket down for everyone.
+    """
+
+    def __init__(
+        self,
+        rate: float = OPENSEA_REQUESTS_PER_SECOND,
+        max_retries: int = OPENSEA_MAX_RETRIES,
+        timeout: Tuple[float, float] = OPENSEA_TIMEOUT,
+        api_url: str = OPENSEA_API_URL,
+        pool_size: int = 16,
+    ) -> None:
+        self._token_bucket = TokenBucket(rate)
+        self._max_retries = max_retries
+        self._timeout = timeout
+        self._api_url = api_url
+        self._session = requests.Session()
+        self._session.headers["User-Agent"] = _USER_AGENT
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self._session.close()
+
+    def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        url = self._api_url + path
+
+        for attempt in range(self._max_retries + 1):
+            self._token_bucket.acquire()
+
+            response = self._session.get(url, params=params, timeout=self._timeout)
+            throttled = response.status_code == 429
+
+            if not (throttled or response.status_code >= 500):
+                break
+
+            if attempt >= self._max_retries:
+                break
+
+            retry_after = _retry_after(response)
+            backoff = (
+                retry_after
+                if retry_after is not None
+                else OPENSEA_THROTTLING_BACKOFF * 2**attempt
+            )
+
+            logging.warning(
+                "OpenSea answered %s to %s, retrying in %s seconds (%s/%s)",
+                response.status_code,
+                url,
+                backoff,
+                attempt + 1,
+                self._max_retries,
+            )
+
+            if throttled:
+                self._token_bucket.on_throttled(backoff)
+            else:
+                time.sleep(backoff)
+
+        if not response.ok:
+            raise OpenseaApiError(
+                f"OpenSea answered {response.status_code} to {url}: {response.text}"
+            )
+
+        self._token_bucket.on_success()
+
+        return loads(response.content)
+
+    def get_asset(self, address: str, number: str) -> Dict[str, Any]:
+        data = self._get(f"/asset/{address}/{number}", {"format": "json"})
+
+        if not data.get("success", True):
+            raise OpenseaApiError(f"Asset {address}/{number} can't be fetched")
+
+        return data
+
+    def _iter_assets(self, address: str, numbers: Sequence[str]) -> Iterator[Any]:
+        cursor: Optional[str] = None
+
+        while True:
+            params: Dict[str, Any] = {
+                "asset_contract_address": address,
+                "token_ids": list(numbers),
+                "limit": OPENSEA_ASSETS_PAGE_SIZE,
+                "format": "json",
+            }
+
+            if cursor:
+                params["cursor"] = cursor
+
+            data = self._get("/assets", params)
+
+            yield from data.get("assets") or []
+
+            cursor = data.get("next")
+
+            if not cursor:
+                return
+
+    def get_assets(
+        self, address: str, numbers: Sequence[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetches assets of one contract by token id, up to
+        `OPENSEA_ASSETS_MAX_TOKEN_IDS` of them per request
+
+        Assets which can't be fetched are missing from the result: the
+        ones OpenSea doesn't return and the ones of a failed request (it is
+        logged, the rest go on), so the caller can fall back to get_asset
+        """
+        assets: Dict[str, Dict[str, Any]] = {}
+
+        for start in range(0, len(numbers), OPENSEA_ASSETS_MAX_TOKEN_IDS):
+            chunk = numbers[start : start + OPENSEA_ASSETS_MAX_TOKEN_IDS]
+
+            try:
+                for asset in self._iter_assets(address, chunk):
+                    assets[str(asset["token_id"])] = asset
+            except (OpenseaApiError, requests.RequestException, ValueError):
+                logging.exception(
+                    "Can't fetch assets %s of %s from OpenSea", chunk, address
+                )
+
+        logging.info(
+            "Fetched %s of %s assets of %s from OpenSea",
+            len(assets),
+            len(numbers),
+            address,
+        )
+
+        return assets
+
+    def get_assets_many(
+        self, assets: Iterable[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        Bulk version of get_assets for (contract address, token id) pairs,
+        the tokens are grouped by contract
+        """
+        numbers: Dict[str, List[str]] = defaultdict(list)
+
+        for address, number in set(assets):
+            numbers[address].append(number)
+
+        return {
+            (address, number): asset
+            for address, contract_numbers in numbers.items()
+            for number, asset in self.get_assets(
+                address, sorted(contract_numbers)
+            ).items()
+        }
@@ -0,0 +1,281 @@
+import io
+import itertools
+import logging
+from collections import defaultdict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+import numpy
+import sqlalchemy.orm
+from PIL import Image
+
+from storage.utils import batches
+from uploader.models import NFT, NFTPerceptualHash
+from uploader.utils import download_many
+
+_Key = TypeVar("_Key")
+
+PERCEPTUAL_HASH_BITS = 64
+_DHASH_WIDTH = 9
+_DHASH_HEIGHT = 8
+_SIGNED_OFFSET = 1 << PERCEPTUAL_HASH_BITS
+# int.bit_count is only available since python 3.10
+_popcount: Callable[[int], int] = getattr(
+    int, "bit_count", lambda value: bin(value).count("1")
+)
+# With 22-bit chunks buckets stay almost empty up to millions of hashes
+_CHUNK_BITS = 22
+# Full size images of a backfill batch are held in memory at once
+_BACKFILL_BATCH_SIZE = 100
+
+
+def _thumbnail(image: bytes) -> "numpy.ndarray[Any, Any]":
+    return numpy.asarray(
+        Image.open(io.BytesIO(image))
+        .convert("L")
+        .resize((_DHASH_WIDTH, _DHASH_HEIGHT), Image.Resampling.LANCZOS),
+        dtype=numpy.int16,
+    )
+
+
+def dhash_batch(images: Sequence[Optional[bytes]]) -> List[Optional[int]]:
+    """
+    Calculates 64-bit difference hashes of the images
+
+    Each image is shrunk to a 9x8 grayscale thumbnail, then every bit of
+    the hash tells whether a pixel is brighter than its right neighbour.
+    Shrinking is done by Pillow, comparison and packing for the whole
+    batch at once by NumPy. Small images (VK "s" size for instance) are
+    enough, the hash doesn't depend on the resolution or JPEG quality.
+
+    Missing (None) and undecodable images get None instead of a hash.
+    """
+    thumbnails: Dict[int, "numpy.ndarray[Any, Any]"] = {}
+
+    for position, image in enumerate(images):
+        if image is None:
+            continue
+
+        try:
+            thumbnails[position] = _thumbnail(image)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Can't decode image %s of the batch", position)
+
+    hashes: List[Optional[int]] = [None] * len(images)
+
+    if not thumbnails:
+        return hashes
+
+    pixels = numpy.stack(list(thumbnails.values()))
+    bits = (pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(len(thumbnails), -1)
+    packed = numpy.packbits(bits, axis=1)
+
+    for position, row in zip(thumbnails, packed):
+        hashes[position] = int.from_bytes(row.tobytes(), "big")
+
+    return hashes
+
+
+def to_signed(perceptual_hash: int) -> int:
+    """
+    SQLite integers are signed 64-bit, so hashes are stored shifted
+    """
+    if perceptual_hash >= _SIGNED_OFFSET >> 1:
+        return perceptual_hash - _SIGNED_OFFSET
+
+    return perceptual_hash
+
+
+def from_signed(stored_hash: int) -> int:
+    return stored_hash + _SIGNED_OFFSET if stored_hash < 0 else stored_hash
+
+
+def hamming_distance(left: int, right: int) -> int:
+    return _popcount(left ^ right)
+
+
+class HammingIndex(Generic[_Key]):
+    """
+    Multi-index hashing structure for the near-duplicate lookups
+
+    Hashes are split into chunks, each chunk has its own hash table. By the
+    pigeonhole principle two hashes within `threshold` bits of each other
+    have at least one chunk within `threshold // chunks` bits, so only the
+    table buckets that close to the query chunks are checked, instead of the
+    whole collection. Unlike a BK-tree, whose lookups visit a large part of
+    the tree for any useful threshold, the cost here depends on the bucket
+    sizes only, which keeps lookups under a millisecond at millions of
+    hashes.
+    """
+
+    _tables: List[Dict[int, List[Tuple[int, _Key]]]]
+
+    def __init__(
+        self,
+        threshold: int,
+        bits: int = PERCEPTUAL_HASH_BITS,
+        chunk_bits: int = _CHUNK_BITS,
+    ) -> None:
+        if not 0 <= threshold < bits:
+            raise ValueError(f"Threshold should be in [0, {bits}), got {threshold}")
+
+        self._threshold = threshold
+        self._chunks = [
+            (shift, (1 << min(chunk_bits, bits - shift)) - 1)
+            for shift in range(0, bits, chunk_bits)
+        ]
+        self._tables = [defaultdict(list) for _ in self._chunks]
+        self._size = 0
+
+        # Every chunk value within this distance of the query chunk is probed
+        radius = threshold // len(self._chunks)
+        self._probes = [
+            numpy.array(
+                [
+                    sum(1 << bit for bit in flipped)
+                    for distance in range(radius + 1)
+                    for flipped in itertools.combinations(
+                        range(mask.bit_length()), distance
+                    )
+                ],
+                dtype=numpy.int64,
+            )
+            for _, mask in self._chunks
+        ]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, perceptual_hash: int, key: _Key) -> None:
+        item = (perceptual_hash, key)
+
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table[(perceptual_hash >> shift) & mask].append(item)
+
+        self._size += 1
+
+    def query(self, perceptual_hash: int) -> List[Tuple[_Key, int]]:
+        """
+        Returns keys of the hashes within the threshold with their distances,
+        closest first
+        """
+        found: Dict[int, Tuple[_Key, int]] = {}
+
+        for table, (shift, mask), probes in zip(
+            self._tables, self._chunks, self._probes
+        ):
+            chunk = (perceptual_hash >> shift) & mask
+            # Probing is vectorized, only the non-empty buckets are visited
+            # by the Python code
+            buckets = filter(None, map(table.get, (probes ^ chunk).tolist()))
+
+            for item in itertools.chain.from_iterable(buckets):
+                distance = hamming_distance(perceptual_hash, item[0])
+
+                if distance <= self._threshold:
+                    # The same item can be found through several chunks
+                    found[id(item)] = (item[1], distance)
+
+        return sorted(found.values(), key=lambda key_distance: key_distance[1])
+
+
+def load_index(
+    db_session: sqlalchemy.orm.session.Session, threshold: int
+) -> HammingIndex[int]:
+    """
+    Builds the index of perceptual hashes of all the NFTs, keyed by NFT id
+    """
+    index: HammingIndex[int] = HammingIndex(threshold)
+
+    for nft_id, stored_hash in db_session.query(
+        NFTPerceptualHash.nft_id, NFTPerceptualHash.hash
+    ).yield_per(10000):
+        index.add(from_signed(stored_hash), nft_id)
+
+    return index
+
+
+def add_perceptual_hashes(
+    db_session: sqlalchemy.orm.session.Session,
+    index: HammingIndex[int],
+    hashes: Iterable[Tuple[int, int]],
+) -> None:
+    """
+    Stores (nft_id, perceptual hash) pairs with a single executemany and
+    adds them to the index
+    """
+    rows = [
+        {"nft_id": nft_id, "hash": to_signed(perceptual_hash)}
+        for nft_id, perceptual_hash in hashes
+    ]
+
+    if not rows:
+        return
+
+    db_session.execute(sqlalchemy.insert(NFTPerceptualHash), rows)
+
+    for row in rows:
+        index.add(from_signed(row["hash"]), row["nft_id"])
+
+
+def backfill_perceptual_hashes(
+    db_session: sqlalchemy.orm.session.Session,
+    index: HammingIndex[int],
+    batch_size: int = _BACKFILL_BATCH_SIZE,
+) -> int:
+    """
+    Hashes the images of the NFTs stored without a perceptual hash (added
+    before the hashes were), so near-duplicates of them are found too
+
+    Meant to be run once, see uploader/backfill_perceptual_hashes.py, the
+    scheduler hashes the new NFTs itself. Images are downloaded
+    concurrently batch by batch, every batch is committed. Images which
+    can't be downloaded or decoded are left without hash. Local files
+    (file:// urls) are skipped.
+
+    Returns the number of hashes added
+    """
+    missing = (
+        db_session.query(NFT.id, NFT.url)
+        .outerjoin(NFTPerceptualHash, NFTPerceptualHash.nft_id == NFT.id)
+        .filter(
+            NFTPerceptualHash.nft_id.is_(None),
+            NFT.url.isnot(None),
+            NFT.url.notlike("file://%"),
+        )
+        .order_by(NFT.id)
+        .all()
+    )
+    added = 0
+
+    for batch in batches(missing, batch_size):
+        contents = download_many(url for _, url in batch)
+        hashes = [
+            (nft_id, perceptual_hash)
+            for (nft_id, _), perceptual_hash in zip(
+                batch, dhash_batch([contents.get(url) for _, url in batch])
+            )
+            if perceptual_hash is not None
+        ]
+
+        add_perceptual_hashes(db_session, index, hashes)
+        db_session.commit()
+
+        added += len(hashes)
+
+    if missing:
+        logging.info(
+            "Backfilled perceptual hashes of %s of %s NFTs", added, len(missing)
+        )
+
+    return added
@@ -1,9 +1,26 @@
+import contextlib
+import dataclasses
 import logging
 import os
+import shlex
+import shutil
+import tempfile
+import threading
+from typing import Iterator
 
 import sqlalchemy
 
 from uploader.models import NFT, create_database
+from uploader.upload_queue import (
+    UPLOAD_LEASE_SECONDS,
+    UPLOAD_MAX_ATTEMPTS,
+    Lease,
+    UploadQueue,
+)
+from uploader.uploader_session import (
+    UPLOADER_SESSION_MAX_UPLOADS,
+    UploaderSessionPool,
+)
 from uploader.worker import (
     OpenseaAutomaticUploaderAuthData,
     OpenseaAutomaticUploaderParams,
@@ -15,35 +32,176 @@ _METAMASK_RECOVERY_PHRASE = os.environ["METAMASK_RECOVERY_PHRASE"]
 _TWO_CAPTCHA_KEY = os.environ["TWO_CAPTCHA_KEY"]
 _OPENSEA_COLLECTION = os.environ["OPENSEA_COLLECTION"]
 _OPENSEA_UPLOADER_DIR = os.environ["OPENSEA_UPLOADER_DIR"]
+_UPLOAD_BATCH_SIZE = int(os.environ.get("UPLOAD_BATCH_SIZE", "50"))
+_OPENSEA_UPLOADER_INSTANCES = int(os.environ.get("OPENSEA_UPLOADER_INSTANCES", "1"))
+_OPENSEA_UPLOADER_BATCH_SIZE = int(os.environ.get("OPENSEA_UPLOADER_BATCH_SIZE", "10"))
+# Long-lived uploader process, see UploaderSession. Without it the uploader
+# is started for every batch. Experimental: the bundled uploader has no
+# session mode, only uploader.uploader_stub speaks the protocol, so don't
+# set it for the real uploader
+_OPENSEA_UPLOADER_SESSION_COMMAND = shlex.split(
+    os.environ.get("OPENSEA_UPLOADER_SESSION_COMMAND", "")
+)
+_OPENSEA_UPLOADER_SESSION_MAX_UPLOADS = int(
+    os.environ.get("OPENSEA_UPLOADER_SESSION_MAX_UPLOADS", UPLOADER_SESSION_MAX_UPLOADS)
+)
+_OPENSEA_UPLOADER_WORK_DIR = os.environ.get("OPENSEA_UPLOADER_WORK_DIR")
+_OPENSEA_RESOLVER_WORKERS = int(os.environ.get("OPENSEA_RESOLVER_WORKERS", "4"))
+# Comma separated browser profiles, one per instance, each with its own wallet
+_OPENSEA_UPLOADER_PROFILES = [
+    profile
+    for profile in os.environ.get("OPENSEA_UPLOADER_PROFILES", "").split(",")
+    if profile
+]
+_UPLOAD_LEASE_SECONDS = float(
+    os.environ.get("UPLOAD_LEASE_SECONDS", UPLOAD_LEASE_SECONDS)
+)
+_UPLOAD_MAX_ATTEMPTS = int(os.environ.get("UPLOAD_MAX_ATTEMPTS", UPLOAD_MAX_ATTEMPTS))
 
 logging.getLogger().setLevel(logging.DEBUG)
 
-db_engine = sqlalchemy.create_engine("sqlite:///test.db")
-db_session = create_database(db_engine)
+db_session = create_database()
+
+
+@contextlib.contextmanager
+def _keep_lease(lease: Lease) -> Iterator[None]:
+    """
+    Extends the lease in the background until the context is left, so
+    a batch can take longer than the lease duration
+    """
+    stopped = threading.Event()
+
+    def extend() -> None:
+        # The thread has its own session
+        upload_queue = UploadQueue(db_session(), lease_seconds=_UPLOAD_LEASE_SECONDS)
+
+        try:
+            while not stopped.wait(_UPLOAD_LEASE_SECONDS / 3):
+                if not upload_queue.extend(lease):
+                    logging.warning(
+                        "Lease %s has expired, NFTs %s could be uploaded twice",
+                        lease.id,
+                        lease.nft_ids,
+                    )
+                    return
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Can't extend lease %s", lease.id)
+        finally:
+            db_session.remove()
+
+    thread = threading.Thread(target=extend, name="lease-keeper", daemon=True)
+    thread.start()
+
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
 
 
 def process() -> None:
     """
     Process "to upload" NFT queue
 
-    This is a temporary solution, before we have a proper queue
-
-    In the absense of a queue, we just take all the NFTs that are not uploaded
-    yet and spin up an upload worker for each one of them
+    NFTs are claimed from the upload queue in batches, each batch is given
+    to its own upload worker. Several processors can run at the same time,
+    they never get the same NFTs.
     """
-    upload_queue = db_session.query(NFT).filter_by(uploaded=False)
+    upload_queue = UploadQueue(
+        db_session(),
+        lease_seconds=_UPLOAD_LEASE_SECONDS,
+        max_attempts=_UPLOAD_MAX_ATTEMPTS,
+    )
 
+    auth_data = OpenseaAutomaticUploaderAuthData(
+        password=_METAMASK_PASSWORD,
+        recovery_phrase=_METAMASK_RECOVERY_PHRASE,
+        two_captcha_key=_TWO_CAPTCHA_KEY,
+    )
+    # Instance copies (and their warm sessions) are reused by the workers, so
+    # the work directory has to outlive them
+    tmp_work_dir = (
+        None
+        if _OPENSEA_UPLOADER_WORK_DIR
+        else tempfile.mkdtemp(prefix="opensea-uploader-")
+    )
     uploader_params = OpenseaAutomaticUploaderParams(
         collection=_OPENSEA_COLLECTION,
         uploader_dir=_OPENSEA_UPLOADER_DIR,
-        auth_data=OpenseaAutomaticUploaderAuthData(
-            password=_METAMASK_PASSWORD,
-            recovery_phrase=_METAMASK_RECOVERY_PHRASE,
-            two_captcha_key=_TWO_CAPTCHA_KEY,
-        ),
+        auth_data=auth_data,
+        instances=_OPENSEA_UPLOADER_INSTANCES,
+        batch_size=_OPENSEA_UPLOADER_BATCH_SIZE,
+        work_dir=_OPENSEA_UPLOADER_WORK_DIR or tmp_work_dir,
+        instance_auth_data=[
+            dataclasses.replace(auth_data, profile=profile)
+            for profile in _OPENSEA_UPLOADER_PROFILES
+        ],
+        session_pool=UploaderSessionPool(
+            _OPENSEA_UPLOADER_SESSION_COMMAND, _OPENSEA_UPLOADER_SESSION_MAX_UPLOADS
+        )
+        if _OPENSEA_UPLOADER_SESSION_COMMAND
+        else None,
+        resolver_workers=_OPENSEA_RESOLVER_WORKERS,
     )
-    worker = OpenseaAutomaticWorker([nft.id for nft in upload_queue], uploader_params)
-    worker.upload()
+
+    if uploader_params.session_pool is not None:
+        logging.warning(
+            "Uploader sessions are experimental, %s has to speak the "
+            "UploaderSession protocol",
+            _OPENSEA_UPLOADER_SESSION_COMMAND,
+        )
+
+    try:
+        while True:
+            lease = upload_queue.claim(_UPLOAD_BATCH_SIZE)
+
+            if lease is None:
+                break
+
+            # Could have been uploaded by a processor whose lease has expired
+            uploaded = [
+                nft_id
+                for nft_id, in db_session.query(NFT.id).filter(
+                    NFT.id.in_(lease.nft_ids), NFT.uploaded == sqlalchemy.true()
+                )
+            ]
+
+            if uploaded:
+                upload_queue.complete(lease, uploaded)
+
+            nft_ids = [nft_id for nft_id in lease.nft_ids if nft_id not in uploaded]
+
+            if not nft_ids:
+                continue
+
+            worker = OpenseaAutomaticWorker(nft_ids, uploader_params)
+
+            try:
+                with _keep_lease(lease):
+                    uploaded = worker.upload()
+            except Exception as exc:  # pylint: disable=broad-except
+                logging.exception("Upload of NFTs %s failed", nft_ids)
+                upload_queue.release(lease, repr(exc))
+                continue
+
+            upload_queue.complete(lease, uploaded)
+
+            if worker.unresolved_ids:
+                # Retrying them could upload some of them twice
+                upload_queue.hold(
+                    lease,
+                    worker.unresolved_ids,
+                    "Uploaded OpenSea urls can't be matched, resolve manually",
+                )
+
+            # Only the missing NFTs are retried
+            upload_queue.release(lease, "Not found in the uploader output")
+    finally:
+        if uploader_params.session_pool is not None:
+            uploader_params.session_pool.close()
+
+        if tmp_work_dir is not None:
+            shutil.rmtree(tmp_work_dir, ignore_errors=True)
 
 
 process()
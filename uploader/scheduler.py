@@ -1,17 +1,24 @@
 import hashlib
+import itertools
 import logging
 import os
-from typing import List
-
-import sqlalchemy
+from typing import Dict, List, Optional
 
 import vk.api
 from follower.main import get_new_posts
+from uploader.hash_index import get_content_hashes
 from uploader.models import NFT, create_database
-from uploader.utils import download_and_generate_hash, reupload_photo, strip_tags
-
-db_engine = sqlalchemy.create_engine("sqlite:///test.db")
-db_session = create_database(db_engine)
+from uploader.nft_store import insert_nfts, known_hashes
+from uploader.perceptual import (
+    HammingIndex,
+    add_perceptual_hashes,
+    dhash_batch,
+    load_index,
+)
+from uploader.upload_queue import UploadQueue
+from uploader.utils import download_many, reupload_photo, strip_tags
+
+db_session = create_database()
 
 logging.basicConfig()
 logging.getLogger("sqlalchemy.engine").setLevel(logging.DEBUG)
@@ -20,6 +27,8 @@ logging.getLogger().setLevel(logging.DEBUG)
 
 _VK_COMMUNITY = os.environ["VK_COMMUNITY"]
 _VK_SERVICE_TOKEN = os.environ["VK_SERVICE_TOKEN"]
+# Max hamming distance between perceptual hashes of the same picture
+_PERCEPTUAL_HASH_THRESHOLD = int(os.environ.get("PERCEPTUAL_HASH_THRESHOLD", "5"))
 
 
 def schedule_local() -> List[int]:
@@ -70,51 +79,138 @@ def schedule_local() -> List[int]:
 def schedule() -> List[int]:
     scheduled: List[int] = []
 
-    new_posts = get_new_posts(_VK_SERVICE_TOKEN, _VK_COMMUNITY)
-
-    for post in new_posts:
-        if post.is_pinned:
-            continue
+    perceptual_index = load_index(db_session(), _PERCEPTUAL_HASH_THRESHOLD)
 
-        already_uploaded = False
+    new_posts = [
+        post
+        for post in get_new_posts(
+            _VK_SERVICE_TOKEN, _VK_COMMUNITY, attachment_types={"photo"}
+        )
+        if not post.is_pinned
+    ]
+    post_photos = [
+        [
+            attachment
+            for attachment in post.attachments
+            if isinstance(attachment, vk.api.Photo)
+        ]
+        for post in new_posts
+    ]
+
+    # The smallest size is enough for the perceptual hash, the full size
+    # is only downloaded for the photos which aren't near-duplicates
+    thumbnails = download_many(
+        photo.smallest().url for photos in post_photos for photo in photos
+    )
+    perceptual_hashes = iter(
+        dhash_batch(
+            [
+                # Photos which can't be downloaded have no perceptual hash
+                thumbnails.get(photo.smallest().url)
+                for photos in post_photos
+                for photo in photos
+            ]
+        )
+    )
 
-        for attachment in post.attachments:
-            if isinstance(attachment, vk.api.Photo):
-                for size in attachment.sizes:
-                    photo_hash = download_and_generate_hash(size.url)
+    candidates = []
 
-                    found_nft = db_session.query(NFT).filter_by(hash=photo_hash).first()
+    for post, photos in zip(new_posts, post_photos):
+        photo_perceptual_hashes = list(itertools.islice(perceptual_hashes, len(photos)))
 
-                    if found_nft:
-                        logging.info("NFT found in database: %s", found_nft)
-                        already_uploaded = True
+        near_duplicates = [
+            nft_id
+            for perceptual_hash in photo_perceptual_hashes
+            if perceptual_hash is not None
+            for nft_id, _ in perceptual_index.query(perceptual_hash)
+        ]
 
-        if already_uploaded:
+        if near_duplicates:
+            logging.info(
+                "Post %s is a near-duplicate of NFTs %s", post.id, near_duplicates
+            )
             continue
 
-        for attachment in post.attachments:
-            if isinstance(attachment, vk.api.Photo):
-                largest_photo = sorted(attachment.sizes)[-1]
-                largest_photo_hash = reupload_photo(largest_photo.url)
+        candidates.append((post, photos, photo_perceptual_hashes))
 
-                if db_session.query(NFT).filter_by(hash=largest_photo_hash).first():
-                    continue
-
-                nft = NFT(
-                    hash=download_and_generate_hash(largest_photo.url),
-                    url=largest_photo_hash,
-                    description=strip_tags(post.text),
-                )
-
-                db_session.add(nft)
-                db_session.flush()
-                db_session.refresh(nft)
-
-                nft.title = f"Mem #{nft.id}"
+    content_hashes = iter(
+        get_content_hashes(
+            db_session(),
+            [
+                (photo.largest().url, f"{photo.owner_id}_{photo.id}")
+                for _, photos, _ in candidates
+                for photo in photos
+            ],
+        )
+    )
+    post_hashes = [
+        list(itertools.islice(content_hashes, len(photos)))
+        for _, photos, _ in candidates
+    ]
+    uploaded_hashes = known_hashes(
+        db_session(),
+        (
+            photo_hash
+            for photo_hash in itertools.chain.from_iterable(post_hashes)
+            if photo_hash is not None
+        ),
+    )
+
+    nft_rows: List[Dict[str, str]] = []
+    new_perceptual_hashes: Dict[str, Optional[int]] = {}
+    # Perceptual hashes of this page, which aren't in the index yet
+    page_index: HammingIndex[str] = HammingIndex(_PERCEPTUAL_HASH_THRESHOLD)
+
+    for (post, photos, photo_perceptual_hashes), photo_hashes in zip(
+        candidates, post_hashes
+    ):
+        already_uploaded = uploaded_hashes.intersection(photo_hashes)
 
-                scheduled.append(nft.id)
+        if already_uploaded:
+            logging.info("NFTs found in database: %s", already_uploaded)
+            continue
 
-    db_session.commit()
+        for photo, photo_hash, perceptual_hash in zip(
+            photos, photo_hashes, photo_perceptual_hashes
+        ):
+            # Photos which can't be downloaded are skipped
+            if photo_hash is None or photo_hash in new_perceptual_hashes:
+                continue
+
+            # Several versions of the same picture within the page, the
+            # candidates have no near-duplicates in the index already
+            if perceptual_hash is not None and page_index.query(perceptual_hash):
+                continue
+
+            nft_rows.append(
+                {
+                    "hash": photo_hash,
+                    "url": reupload_photo(photo.largest().url),
+                    "description": strip_tags(post.text),
+                }
+            )
+            new_perceptual_hashes[photo_hash] = perceptual_hash
+
+            if perceptual_hash is not None:
+                page_index.add(perceptual_hash, photo_hash)
+
+    nft_ids = insert_nfts(db_session(), nft_rows)
+
+    add_perceptual_hashes(
+        db_session(),
+        perceptual_index,
+        [
+            (nft_ids[photo_hash], perceptual_hash)
+            for photo_hash, perceptual_hash in new_perceptual_hashes.items()
+            if perceptual_hash is not None
+        ],
+    )
+
+    scheduled.extend(nft_ids[row["hash"]] for row in nft_rows)
+
+    # Commits the whole page along with the queue items and the community
+    # cursor, see get_new_posts
+    UploadQueue(db_session()).enqueue(scheduled)
 
     return scheduled
 
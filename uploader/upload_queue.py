@@ -0,0 +1,201 @@
+import datetime
+import logging
+import uuid
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, cast
+
+import sqlalchemy
+import sqlalchemy.orm
+
+from uploader.models import UploadQueueItem
+
+# A browser upload of a batch can take a while
+UPLOAD_LEASE_SECONDS = 60 * 60
+UPLOAD_RETRY_DELAY_SECONDS = 10 * 60
+UPLOAD_MAX_ATTEMPTS = 5
+
+
+@dataclass
+class Lease:
+    id: str
+    nft_ids: List[int]
+    expires_at: datetime.datetime
+
+
+class UploadQueue:
+    """
+    Durable queue of NFTs to be uploaded, shared by all the processors
+
+    Items are claimed in batches under a lease, nobody else can claim them
+    until the lease is completed, released or expires (so items of a
+    crashed processor come back by themselves), long uploads extend it. A
+    released item becomes visible again after the retry delay, items
+    failed `max_attempts` times (and the held ones) are not claimed anymore
+    and stay in the table for investigation.
+
+    Every method runs in its own transaction, committed before returning.
+    """
+
+    def __init__(
+        self,
+        db_session: sqlalchemy.orm.session.Session,
+        lease_seconds: float = UPLOAD_LEASE_SECONDS,
+        retry_delay_seconds: float = UPLOAD_RETRY_DELAY_SECONDS,
+        max_attempts: int = UPLOAD_MAX_ATTEMPTS,
+    ) -> None:
+        self._db_session = db_session
+        self._lease_duration = datetime.timedelta(seconds=lease_seconds)
+        self._retry_delay = datetime.timedelta(seconds=retry_delay_seconds)
+        self._max_attempts = max_attempts
+
+    def enqueue(self, nft_ids: Iterable[int]) -> None:
+        now = datetime.datetime.utcnow()
+        rows = [
+            {"nft_id": nft_id, "available_at": now, "attempts": 0} for nft_id in nft_ids
+        ]
+
+        if rows:
+            self._db_session.execute(sqlalchemy.insert(UploadQueueItem), rows)
+
+        self._db_session.commit()
+
+    def claim(self, limit: int) -> Optional[Lease]:
+        """
+        Leases up to `limit` available items, returns None if there are none
+
+        The claim is a single UPDATE, so concurrent processors always get
+        disjoint batches (rows are locked with SKIP LOCKED where supported,
+        SQLite serializes writers anyway).
+        """
+        now = datetime.datetime.utcnow()
+        lease = Lease(uuid.uuid4().hex, [], now + self._lease_duration)
+
+        available = (
+            sqlalchemy.select(UploadQueueItem.nft_id)
+            .where(
+                UploadQueueItem.available_at <= now,
+                sqlalchemy.or_(
+                    UploadQueueItem.leased_until.is_(None),
+                    UploadQueueItem.leased_until < now,
+                ),
+                UploadQueueItem.attempts < self._max_attempts,
+            )
+            .order_by(UploadQueueItem.nft_id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+
+        self._db_session.execute(
+            sqlalchemy.update(UploadQueueItem)
+            .where(UploadQueueItem.nft_id.in_(available))
+            .values(
+                lease_id=lease.id,
+                leased_until=lease.expires_at,
+                attempts=UploadQueueItem.attempts + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        lease.nft_ids = list(
+            self._db_session.execute(
+                sqlalchemy.select(UploadQueueItem.nft_id)
+                .where(UploadQueueItem.lease_id == lease.id)
+                .order_by(UploadQueueItem.nft_id)
+            ).scalars()
+        )
+
+        self._db_session.commit()
+
+        if not lease.nft_ids:
+            return None
+
+        logging.info("Claimed NFTs %s under lease %s", lease.nft_ids, lease.id)
+
+        return lease
+
+    def extend(self, lease: Lease) -> bool:
+        """
+        Prolongs the lease by the lease duration from now, returns False if
+        it has expired and its items were claimed by someone else meanwhile
+
+        Long uploads should call it every now and then (well within the
+        lease duration), so the items are never claimed twice.
+        """
+        expires_at = datetime.datetime.utcnow() + self._lease_duration
+
+        result = cast(
+            sqlalchemy.engine.CursorResult,
+            self._db_session.execute(
+                sqlalchemy.update(UploadQueueItem)
+                .where(UploadQueueItem.lease_id == lease.id)
+                .values(leased_until=expires_at)
+                .execution_options(synchronize_session=False)
+            ),
+        )
+        self._db_session.commit()
+
+        if not result.rowcount:
+            return False
+
+        lease.expires_at = expires_at
+
+        return True
+
+    def complete(self, lease: Lease, nft_ids: Optional[Iterable[int]] = None) -> None:
+        """
+        Removes the items (all the leased ones by default) from the queue
+        """
+        condition = UploadQueueItem.lease_id == lease.id
+
+        if nft_ids is not None:
+            condition = sqlalchemy.and_(
+                condition, UploadQueueItem.nft_id.in_(list(nft_ids))
+            )
+
+        self._db_session.execute(
+            sqlalchemy.delete(UploadQueueItem)
+            .where(condition)
+            .execution_options(synchronize_session=False)
+        )
+        self._db_session.commit()
+
+    def hold(self, lease: Lease, nft_ids: Iterable[int], error: str) -> None:
+        """
+        Takes the items out of the lease without giving them back to the
+        queue, like the ones failed `max_attempts` times, for the cases
+        retrying could do harm (e.g. upload them twice)
+        """
+        self._db_session.execute(
+            sqlalchemy.update(UploadQueueItem)
+            .where(
+                UploadQueueItem.lease_id == lease.id,
+                UploadQueueItem.nft_id.in_(list(nft_ids)),
+            )
+            .values(
+                lease_id=None,
+                leased_until=None,
+                # Not claimed anymore, see claim
+                attempts=self._max_attempts,
+                last_error=error,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        self._db_session.commit()
+
+    def release(self, lease: Lease, error: str = "") -> None:
+        """
+        Gives the items still held by the lease back to the queue, they
+        become available again after the retry delay
+        """
+        self._db_session.execute(
+            sqlalchemy.update(UploadQueueItem)
+            .where(UploadQueueItem.lease_id == lease.id)
+            .values(
+                lease_id=None,
+                leased_until=None,
+                available_at=datetime.datetime.utcnow() + self._retry_delay,
+                last_error=error,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        self._db_session.commit()
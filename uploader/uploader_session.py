@@ -0,0 +1,232 @@
+import contextlib
+import json
+import logging
+import queue
+import subprocess
+import threading
+import time
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence
+
+UPLOADER_SESSION_STARTUP_TIMEOUT = 10 * 60.0
+UPLOADER_SESSION_UPLOAD_TIMEOUT = 60 * 60.0
+UPLOADER_SESSION_PING_TIMEOUT = 30.0
+UPLOADER_SESSION_MAX_UPLOADS = 20
+
+
+class UploaderSessionError(RuntimeError):
+    pass
+
+
+class UploaderSession:
+    """
+    Long-lived uploader process, which keeps its browser and wallet login
+    between the batches
+
+    The process talks JSON lines over stdin/stdout:
+        - once started (logged in), it writes {"ready": true}
+        - {"command": "ping"} is answered with {"ok": true}
+        - {"command": "upload", "file": <nft list path>} is answered with
+          {"ok": true} when the batch is uploaded (sale files are written
+          to data/ as usual), or {"ok": false, "error": <reason>}
+        - {"command": "quit"} makes it exit
+
+    Experimental: the bundled uploader (`python main.py`) doesn't speak it
+    yet, uploader.uploader_stub is the only implementation for now.
+    """
+
+    _process: Optional["subprocess.Popen[str]"]
+    _lines: "queue.Queue[Optional[str]]"
+
+    def __init__(
+        self,
+        command: Sequence[str],
+        cwd: str,
+        startup_timeout: float = UPLOADER_SESSION_STARTUP_TIMEOUT,
+        upload_timeout: float = UPLOADER_SESSION_UPLOAD_TIMEOUT,
+    ) -> None:
+        self._command = list(command)
+        self._cwd = cwd
+        self._startup_timeout = startup_timeout
+        self._upload_timeout = upload_timeout
+        self._process = None
+        self._lines = queue.Queue()
+        self.uploads = 0
+
+    def __repr__(self) -> str:
+        pid = self._process.pid if self._process is not None else None
+        return f"<UploaderSession(cwd={self._cwd}, pid={pid}, uploads={self.uploads})>"
+
+    @staticmethod
+    def _read_lines(stdout: IO[str], lines: "queue.Queue[Optional[str]]") -> None:
+        for line in stdout:
+            lines.put(line)
+
+        # End of output, the process is gone
+        lines.put(None)
+
+    def start(self) -> None:
+        logging.info("Starting uploader session %s in %s", self._command, self._cwd)
+
+        self._process = subprocess.Popen(
+            self._command,
+            cwd=self._cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+
+        threading.Thread(
+            target=self._read_lines,
+            args=(self._process.stdout, self._lines),
+            daemon=True,
+        ).start()
+
+        self._receive(self._startup_timeout, "ready")
+
+    def _receive(self, timeout: float, key: str) -> Dict[str, Any]:
+        """
+        Returns the next message containing `key`, other output of the
+        uploader (it can be chatty) is logged and skipped
+        """
+        deadline = time.monotonic() + timeout
+
+        while True:
+            try:
+                line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty as exc:
+                raise UploaderSessionError(
+                    f"Uploader session {self} didn't answer in {timeout}s"
+                ) from exc
+
+            if line is None:
+                raise UploaderSessionError(f"Uploader session {self} has exited")
+
+            try:
+                message = json.loads(line)
+            except ValueError:
+                message = None
+
+            if isinstance(message, dict) and key in message:
+                return message
+
+            logging.debug("Uploader session output: %s", line.rstrip())
+
+    def _send(self, message: Dict[str, Any]) -> None:
+        if self._process is None or self._process.stdin is None:
+            raise UploaderSessionError(f"Uploader session {self} is not started")
+
+        try:
+            self._process.stdin.write(json.dumps(message) + "\n")
+            self._process.stdin.flush()
+        except OSError as exc:
+            raise UploaderSessionError(f"Uploader session {self} has exited") from exc
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def ping(self, timeout: float = UPLOADER_SESSION_PING_TIMEOUT) -> bool:
+        try:
+            self._send({"command": "ping"})
+            return bool(self._receive(timeout, "ok")["ok"])
+        except UploaderSessionError:
+            logging.exception("Uploader session %s health check failed", self)
+            return False
+
+    def upload(self, nft_file: str) -> None:
+        self._send({"command": "upload", "file": nft_file})
+        response = self._receive(self._upload_timeout, "ok")
+        self.uploads += 1
+
+        if not response["ok"]:
+            raise UploaderSessionError(
+                f"Uploader session {self} failed: {response.get('error')}"
+            )
+
+    def close(self) -> None:
+        if self._process is None:
+            return
+
+        logging.info("Closing uploader session %s", self)
+
+        if self.is_alive():
+            try:
+                self._send({"command": "quit"})
+                self._process.wait(timeout=UPLOADER_SESSION_PING_TIMEOUT)
+            except (UploaderSessionError, subprocess.TimeoutExpired):
+                self._process.kill()
+                self._process.wait()
+
+        self._process = None
+
+
+class UploaderSessionPool:
+    """
+    Warm uploader sessions, one per uploader directory
+
+    A session is health checked before every batch and recycled after
+    `max_uploads` batches or as soon as a batch fails, so a stuck browser
+    never gets another batch.
+    """
+
+    _idle: Dict[str, UploaderSession]
+
+    def __init__(
+        self,
+        command: Sequence[str],
+        max_uploads: int = UPLOADER_SESSION_MAX_UPLOADS,
+        startup_timeout: float = UPLOADER_SESSION_STARTUP_TIMEOUT,
+        upload_timeout: float = UPLOADER_SESSION_UPLOAD_TIMEOUT,
+    ) -> None:
+        self._command = list(command)
+        self._max_uploads = max_uploads
+        self._startup_timeout = startup_timeout
+        self._upload_timeout = upload_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def session(self, cwd: str) -> Iterator[UploaderSession]:
+        with self._lock:
+            session = self._idle.pop(cwd, None)
+
+        if session is not None and not (session.is_alive() and session.ping()):
+            session.close()
+            session = None
+
+        if session is None:
+            session = UploaderSession(
+                self._command, cwd, self._startup_timeout, self._upload_timeout
+            )
+
+            try:
+                session.start()
+            except BaseException:
+                session.close()
+                raise
+
+        try:
+            yield session
+        except BaseException:
+            session.close()
+            raise
+
+        if session.uploads >= self._max_uploads:
+            session.close()
+            return
+
+        with self._lock:
+            # Only one batch runs in a directory at a time
+            previous = self._idle.pop(cwd, None)
+            self._idle[cwd] = session
+
+        if previous is not None:
+            previous.close()
+
+    def close(self) -> None:
+        with self._lock:
+            sessions: List[UploaderSession] = list(self._idle.values())
+            self._idle.clear()
+
+        for session in sessions:
+            session.close()
@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict
+
+
+def _answer(message: Dict[str, Any]) -> None:
+    print(json.dumps(message), flush=True)
+
+
+def main() -> None:
+    """
+    Stub of the uploader session process, see UploaderSession
+
+    Pretends to upload the batches: waits `--delay` seconds and, with
+    `--sale-url-prefix`, writes a sale file with an url for every NFT of
+    the batch. Every `--fail-every`-th batch fails, after uploading its
+    first `--fail-after` NFTs.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--startup-delay", type=float, default=0.0)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--sale-url-prefix", default="")
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--fail-after", type=int, default=0)
+    args = parser.parse_args()
+
+    time.sleep(args.startup_delay)
+    print("Stub uploader is logged in", flush=True)
+    _answer({"ready": True})
+
+    uploads = 0
+
+    for line in sys.stdin:
+        message = json.loads(line)
+
+        if message["command"] == "quit":
+            break
+
+        if message["command"] == "ping":
+            _answer({"ok": True})
+            continue
+
+        uploads += 1
+        time.sleep(args.delay)
+        failed = bool(args.fail_every) and uploads % args.fail_every == 0
+
+        with open(message["file"], encoding="utf-8") as nft_file:
+            nfts = json.load(nft_file)["nft"]
+
+        if failed:
+            nfts = nfts[: args.fail_after]
+
+        if args.sale_url_prefix and nfts:
+            sale = {
+                "nft": [
+                    {
+                        "nft_url": f"{args.sale_url_prefix}/{uploads}{position}",
+                        "nft_name": nft["nft_name"],
+                        "file_path": nft["file_path"],
+                    }
+                    for position, nft in enumerate(nfts)
+                ]
+            }
+
+            with open(
+                os.path.join("data", f"sale_{uploads}.json"), "w", encoding="utf-8"
+            ) as sale_file:
+                json.dump(sale, sale_file)
+
+        if failed:
+            _answer({"ok": False, "error": f"Batch {uploads} failed"})
+        else:
+            _answer({"ok": True})
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,27 @@
-import hashlib
+import concurrent.futures
 import logging
-from functools import lru_cache, wraps
+import os
+import tempfile
+import threading
+from functools import wraps
 from html.parser import HTMLParser
 from io import StringIO
-from typing import Any, Callable, Tuple, Type, TypeVar
-
-import requests
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Type, TypeVar
+
+from uploader.content_cache import (
+    CONTENT_CACHE_DISK_BYTES,
+    CONTENT_CACHE_MEMORY_BYTES,
+    CachedFile,
+    ContentCache,
+)
+from uploader.downloader import (
+    DOWNLOAD_MAX_IN_FLIGHT,
+    DOWNLOAD_MAX_PER_HOST,
+    DOWNLOAD_MAX_SIZE,
+    DOWNLOAD_MAX_WORKERS,
+    DownloadEngine,
+)
+from uploader.opensea import OPENSEA_REQUESTS_PER_SECOND, OpenseaClient
 
 
 class MLStripper(HTMLParser):
@@ -29,11 +45,115 @@ def strip_tags(html: str) -> str:
     return stripper.get_data()
 
 
-@lru_cache(None)
+_content_cache: Optional[ContentCache] = None
+_download_engine: Optional[DownloadEngine] = None
+_opensea_client: Optional[OpenseaClient] = None
+_lock = threading.Lock()
+
+
+def get_content_cache() -> ContentCache:
+    """
+    Returns the content cache, creating it on the first call
+
+    Shared by the scheduler and the workers, so every image is fetched once
+    """
+    global _content_cache  # pylint: disable=global-statement
+
+    with _lock:
+        if _content_cache is None:
+            _content_cache = ContentCache(
+                os.environ.get(
+                    "CONTENT_CACHE_DIR",
+                    os.path.join(tempfile.gettempdir(), "nft-content-cache"),
+                ),
+                int(
+                    os.environ.get(
+                        "CONTENT_CACHE_MEMORY_BYTES", CONTENT_CACHE_MEMORY_BYTES
+                    )
+                ),
+                int(
+                    os.environ.get("CONTENT_CACHE_DISK_BYTES", CONTENT_CACHE_DISK_BYTES)
+                ),
+            )
+
+        return _content_cache
+
+
+def get_download_engine() -> DownloadEngine:
+    """
+    Returns the download engine, creating it on the first call
+
+    Downloads go through the content cache, so cached images aren't fetched
+    """
+    global _download_engine  # pylint: disable=global-statement
+
+    content_cache = get_content_cache()
+
+    with _lock:
+        if _download_engine is None:
+            _download_engine = DownloadEngine(
+                content_cache,
+                int(os.environ.get("DOWNLOAD_MAX_WORKERS", DOWNLOAD_MAX_WORKERS)),
+                int(os.environ.get("DOWNLOAD_MAX_PER_HOST", DOWNLOAD_MAX_PER_HOST)),
+                int(os.environ.get("DOWNLOAD_MAX_IN_FLIGHT", DOWNLOAD_MAX_IN_FLIGHT)),
+                max_size=int(os.environ.get("DOWNLOAD_MAX_SIZE", DOWNLOAD_MAX_SIZE)),
+            )
+
+        return _download_engine
+
+
+def get_opensea_client() -> OpenseaClient:
+    """
+    Returns the OpenSea client, creating it on the first call
+
+    One client per process, so all the uploader instances share the API quota
+    """
+    global _opensea_client  # pylint: disable=global-statement
+
+    with _lock:
+        if _opensea_client is None:
+            _opensea_client = OpenseaClient(
+                float(
+                    os.environ.get(
+                        "OPENSEA_REQUESTS_PER_SECOND", OPENSEA_REQUESTS_PER_SECOND
+                    )
+                )
+            )
+
+        return _opensea_client
+
+
+def download_file(url: str) -> CachedFile:
+    """
+    Downloads the url into the content cache, without reading it into memory
+    """
+    return get_download_engine().download_file(url)
+
+
+def download_to(url: str, destination: str) -> CachedFile:
+    """
+    Downloads the url into the destination file, through the content cache
+    """
+    return get_download_engine().download_to(url, destination)
+
+
+def submit_download(url: str) -> "concurrent.futures.Future[CachedFile]":
+    """
+    Starts downloading the url into the content cache in the background
+    """
+    return get_download_engine().submit(url)
+
+
 def download(url: str) -> bytes:
-    response = requests.get(url)
+    return get_download_engine().download(url)
+
 
-    return response.content
+def download_many(urls: Iterable[str]) -> Dict[str, bytes]:
+    """
+    Downloads the urls concurrently, returns the content by url, the ones
+    which can't be downloaded are missing
+    """
+    return dict(get_download_engine().download_many(urls))
 
 
 def upload(content: bytes) -> str:
@@ -41,9 +161,7 @@ def upload(content: bytes) -> str:
 
 
 def download_and_generate_hash(url: str) -> str:
-    content = download(url)
-
-    return hashlib.sha256(content).hexdigest()
+    return download_file(url).hash
 
 
 def reupload_photo(url: str) -> str:
@@ -1,27 +1,54 @@
 import abc
+import concurrent.futures
+import dataclasses
 import json
 import logging
 import os
 import pathlib
+import queue
+import re
+import shutil
 import subprocess
 import tempfile
 import time
 import urllib.parse
 from dataclasses import asdict, dataclass, field
-from functools import lru_cache
-from typing import Generic, Iterator, List, TypeVar, Union
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TypeVar,
+    Union,
+)
 
-import requests
 import sqlalchemy
 
+from storage.utils import batches
+from uploader.hash_index import get_content_hash
 from uploader.models import NFT, create_database
-from uploader.utils import download_and_generate_hash, retry
+from uploader.opensea import parse_asset_url
+from uploader.uploader_session import UploaderSessionPool
+from uploader.utils import download_to, get_opensea_client, retry, submit_download
 
-db_engine = sqlalchemy.create_engine("sqlite:///test.db")
-db_session = create_database(db_engine)
+db_session = create_database()
 
 _UploaderParams = TypeVar("_UploaderParams")
 
+# Downloads started ahead of the file being written to the manifest
+_DOWNLOAD_AHEAD = 16
+# How often the progress of the OpenSea urls resolution is logged
+_RESOLVER_PROGRESS_EVERY = 25
+# Files given to the uploader are named after their NFTs, so the uploaded
+# items can be told apart without looking at the images
+_FILE_PREFIX = "nft_{nft_id}_"
+_FILE_NAME = re.compile(r"^nft_(\d+)_")
+
 
 @dataclass
 class PropertyOpenseaUploaderStuct:
@@ -55,6 +82,7 @@ class NFTOpenseaUploaderStuct:
     blockchain: str = ""
 
 
+# Format of the manifest, it is written item by item, see _write_manifest
 @dataclass
 class ResultOpenseaUploaderStuct:
     nft: List[NFTOpenseaUploaderStuct] = field(default_factory=list)
@@ -67,10 +95,25 @@ class ImageFileOpenseaUploaderStuct:
     description: str
 
 
+@dataclass
+class UploadedNFT:
+    opensea_url: str
+    # Taken from the file name, None for the files named differently
+    nft_id: Optional[int] = None
+
+
+def _get_nft_id(file_path: str) -> Optional[int]:
+    match = _FILE_NAME.match(os.path.basename(file_path))
+
+    return int(match.group(1)) if match else None
+
+
 @dataclass
 class File:
     nft_id: int
     file_path: pathlib.Path
+    title: str
+    description: str
 
 
 class WorkerBase(abc.ABC, Generic[_UploaderParams]):
@@ -81,11 +124,12 @@ class WorkerBase(abc.ABC, Generic[_UploaderParams]):
 
     Contract (invariant held before invoking the worker):
         - NFT with this hash has never been uploaded before when it reaches the worker
-        - Nobody else is working on the same NFT
+        - Nobody else is working on the same NFT (see uploader.upload_queue)
         - Identical NFTs can't be supplied to the worker
     """
 
     _ids: List[int]
+    _unresolved_ids: List[int]
 
     def __init__(self, ids: List[int], uploader_params: _UploaderParams) -> None:
         """
@@ -95,58 +139,105 @@ class WorkerBase(abc.ABC, Generic[_UploaderParams]):
         """
         self._ids = ids
         self._uploader_params = uploader_params
+        self._unresolved_ids = []
 
-    @lru_cache(None)
-    def _download(self, url: str, dst_dir: str) -> pathlib.Path:
+    @property
+    def unresolved_ids(self) -> List[int]:
         """
-        Downloads a specified file into a destination directory
+        Ids of the NFTs which are not known to be uploaded, but could have
+        been, after upload(). They must not be retried until resolved manually
+        """
+        return [nft_id for nft_id in self._unresolved_ids if nft_id in self._ids]
+
+    def _download(self, url: str, dst_dir: str, nft_id: int) -> pathlib.Path:
+        """
+        Downloads a specified file of the NFT into a destination directory
 
         Returns a path to the donwloaded file
         """
 
         logging.info("Downloading %s to %s", url, dst_dir)
 
-        response = requests.get(url)
-
         descriptor, tmp_file = tempfile.mkstemp(
-            dir=dst_dir, suffix=os.path.splitext(urllib.parse.urlparse(url).path)[1]
+            dir=dst_dir,
+            prefix=_FILE_PREFIX.format(nft_id=nft_id),
+            suffix=os.path.splitext(urllib.parse.urlparse(url).path)[1],
         )
+        os.close(descriptor)
 
-        with open(descriptor, "wb") as dst_file:
-            dst_file.write(response.content)
+        download_to(url, tmp_file)
 
         return pathlib.Path(tmp_file)
 
-    def _get_files(self) -> Iterator[File]:
-        tmp_dir = tempfile.mkdtemp()
+    def _get_files(
+        self, dst_dir: str, ids: Optional[List[int]] = None
+    ) -> Iterator[File]:
+        """
+        Yields files of the NFTs (all of them by default) as they are
+        downloaded into `dst_dir`, the next `_DOWNLOAD_AHEAD` downloads run in
+        the background meanwhile. The caller removes the directory.
+
+        The NFT rows are fetched with a single query.
+        """
+        nfts = (
+            db_session.query(NFT.id, NFT.url, NFT.title, NFT.description)
+            .filter(NFT.id.in_(ids if ids is not None else self._ids))
+            .order_by(NFT.id)
+            .all()
+        )
+        submitted = 0
 
-        for nft in db_session.query(NFT).filter(NFT.id.in_(self._ids)):
-            logging.info("Downloading NFT %s", nft)
+        for position, nft in enumerate(nfts):
+            while submitted < min(len(nfts), position + 1 + _DOWNLOAD_AHEAD):
+                submit_download(nfts[submitted].url)
+                submitted += 1
 
-            yield File(nft.id, self._download(nft.url, tmp_dir))
+            logging.info("Downloading NFT %s", nft.id)
 
-    def _upload(self) -> None:
+            yield File(
+                nft.id,
+                self._download(nft.url, dst_dir, nft.id),
+                nft.title,
+                nft.description,
+            )
+
+    def _upload(self) -> List[int]:
         """
         Method should be implemented in the subclass
 
-        Should contain a logic to perform an upload to a specific destination
+        Should contain a logic to perform an upload to a specific destination,
+        returns ids of the NFTs which were actually uploaded. They should be
+        marked with _mark_complete as soon as they are uploaded, upload()
+        doesn't mark them again.
         """
         raise NotImplementedError()
 
-    def _mark_complete(self) -> None:
+    def _mark_complete(self, ids: List[int]) -> None:
         """
-        Mark all the nfts as uploaded, preventing other workers to grab them
+        Mark the nfts as uploaded with a single update, preventing other
+        workers to grab them
         """
+        if not ids:
+            return
+
+        logging.info("Marking NFTs %s upload as complete", ids)
 
-        for nft in db_session.query(NFT).filter(NFT.id.in_(self._ids)):
-            nft.uploaded = True
+        db_session.execute(
+            sqlalchemy.update(NFT)
+            .where(NFT.id.in_(ids))
+            .values(uploaded=True)
+            .execution_options(synchronize_session=False)
+        )
+        db_session.commit()
 
-            logging.info("Marking %s upload as complete", nft)
-            db_session.commit()
+    def upload(self) -> List[int]:
+        """
+        Returns ids of the uploaded NFTs, the rest of them should be retried
+        (except unresolved_ids)
 
-    def upload(self) -> None:
-        self._upload()
-        self._mark_complete()
+        The uploaded NFTs are already marked complete by _upload.
+        """
+        return [nft_id for nft_id in self._upload() if nft_id in self._ids]
 
 
 @dataclass
@@ -164,6 +255,45 @@ class OpenseaAutomaticUploaderParams:
     collection: str
     uploader_dir: str
     auth_data: OpenseaAutomaticUploaderAuthData
+    # Uploader instances running at the same time, each in its own copy
+    # of `uploader_dir`
+    instances: int = 1
+    # NFTs uploaded by one run of an instance
+    batch_size: int = 10
+    # Wallets of the instances, `auth_data` is used by the ones without
+    instance_auth_data: List[OpenseaAutomaticUploaderAuthData] = field(
+        default_factory=list
+    )
+    # Where the instance copies are made, by default a temporary directory
+    # removed after every upload (so warm sessions can't be reused)
+    work_dir: Optional[str] = None
+    # Warm uploader sessions (experimental, see UploaderSession), `python
+    # main.py` is run for every batch without
+    session_pool: Optional[UploaderSessionPool] = None
+    # OpenSea urls of a batch resolved at the same time, the API calls are
+    # rate limited by the shared client anyway
+    resolver_workers: int = 4
+
+
+class UploadError(RuntimeError):
+    """
+    Upload of a batch has failed, the NFTs of it uploaded before the failure
+    are `uploaded_ids`
+    """
+
+    def __init__(self, message: str, uploaded_ids: List[int]) -> None:
+        super().__init__(message)
+        self.uploaded_ids = uploaded_ids
+
+
+@dataclass
+class UploadBatchResult:
+    instance: int
+    nft_ids: List[int]
+    uploaded_ids: List[int] = field(default_factory=list)
+    # Not uploaded ones of a batch with OpenSea urls nobody was matched to
+    unresolved_ids: List[int] = field(default_factory=list)
+    error: Optional[BaseException] = None
 
 
 class UploaderBase(abc.ABC, Generic[_UploaderParams]):
@@ -176,31 +306,37 @@ class UploaderBase(abc.ABC, Generic[_UploaderParams]):
     def __init__(self, params: _UploaderParams) -> None:
         self._params = params
 
-    def upload(self, files: Iterator[File]) -> None:
+    def upload(self, files: Iterator[File]) -> List[int]:
         """
-        To be implemented in a subclass
+        To be implemented in a subclass, returns ids of the NFTs found in the
+        results of the upload
+
+        Raises UploadError if the upload fails, with the NFTs found in the
+        results anyway
         """
         raise NotImplementedError()
 
 
 class OpenseaAutomaticUploader(UploaderBase):
-    _requests_session: requests.Session
-    _opensea_api_user_agent = (
-        "Mozilla/5.0 (X11; Linux x86_64) "
-        "AppleWebKit/537.36 "
-        "(KHTML, like Gecko) "
-        "Chrome/103.0.5060.53 Safari/537.36"
-    )
-    _opensea_api_url = "https://api.opensea.io/api/v1"
+    _manifest_ids: Set[int]
+    _unresolved_urls: List[str]
 
     def __init__(self, params: OpenseaAutomaticUploaderParams) -> None:
         super().__init__(params)
-        self._requests_session = requests.Session()
+        self._manifest_ids = set()
+        self._unresolved_urls = []
+
+    @property
+    def unresolved_urls(self) -> List[str]:
+        """
+        OpenSea urls of the last upload which can't be matched to any NFT
+        """
+        return self._unresolved_urls
 
     def _get_nfts(
-        self, image_files: List[ImageFileOpenseaUploaderStuct], collection: str = ""
+        self, image_files: Iterable[ImageFileOpenseaUploaderStuct], collection: str = ""
     ) -> Iterator[NFTOpenseaUploaderStuct]:
-        for _, image_file in enumerate(image_files):
+        for image_file in image_files:
             yield NFTOpenseaUploaderStuct(
                 file_path=image_file.file_path,
                 nft_name=image_file.title,
@@ -218,9 +354,9 @@ class OpenseaAutomaticUploader(UploaderBase):
                     directory + "/" + file + f"_{time.time()}.backup",
                 )
 
-    def _gather_opensea_urls(self) -> List[str]:
+    def _gather_opensea_urls(self) -> List[UploadedNFT]:
         directory = self._params.uploader_dir + "/data"
-        result: List[str] = []
+        result: List[UploadedNFT] = []
 
         for file in os.listdir(directory):
             if not (file.startswith("sale_") and file.endswith(".json")):
@@ -234,93 +370,199 @@ class OpenseaAutomaticUploader(UploaderBase):
                 logging.info("File %s data: %s", file, data)
 
                 for nft in data["nft"]:
-                    result.append(nft["nft_url"].strip())
+                    result.append(
+                        UploadedNFT(
+                            nft["nft_url"].strip(),
+                            _get_nft_id(nft.get("file_path", "")),
+                        )
+                    )
 
         return result
 
     @retry(tries=5)
-    def _update_opensea_url(self, opensea_url: str) -> None:
+    def _update_opensea_url(
+        self, opensea_url: str, asset: Optional[Dict[str, Any]] = None
+    ) -> int:
         """
         Downloads the image from the opensea and finds corresponding NFT
         in the database to update it with opensea url, where this NFT is
-        uploaded to
-        """
-        session = self._requests_session
+        uploaded to, the asset is fetched unless given
 
+        Returns id of the NFT
+        """
+        address, number = parse_asset_url(opensea_url)
         # Remove any extra get params from the url
         opensea_url = opensea_url.split("?")[0]
 
-        _, _, _, _, _, address, number = opensea_url.split("/")
+        known_nft = db_session.query(NFT).filter_by(opensea_url=opensea_url).first()
 
-        if db_session.query(NFT).filter_by(opensea_url=opensea_url).first():
-            return
+        if known_nft:
+            return known_nft.id
 
-        time.sleep(1)
+        data = (
+            asset
+            if asset is not None
+            else get_opensea_client().get_asset(address, number)
+        )
 
-        url = f"{self._opensea_api_url}/asset/{address}/{number}?format=json"
+        logging.info("NFT data: %s", data)
 
-        logging.info("NFT url is %s", url)
+        image_url = data["image_url"] + "=s0"
 
-        headers = {
-            "User-Agent": self._opensea_api_user_agent,
-        }
+        image_hash = get_content_hash(db_session(), image_url)
 
-        response = session.get(url, headers=headers)
+        found_nft = db_session.query(NFT).filter_by(hash=image_hash)[0]
 
-        data = json.loads(response.text)
+        found_nft.opensea_url = opensea_url
 
-        logging.info("NFT data: %s", data)
+        logging.info("Updated NFT %s", found_nft)
 
-        if data.get("success", True):
-            image_url = data["image_url"] + "=s0"
+        db_session.commit()
 
-            image_hash = download_and_generate_hash(image_url)
+        return found_nft.id
 
-            found_nft = db_session.query(NFT).filter_by(hash=image_hash)[0]
+    def _resolve_opensea_url(
+        self, opensea_url: str, asset: Optional[Dict[str, Any]]
+    ) -> Optional[int]:
+        try:
+            return self._update_opensea_url(opensea_url, asset)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Can't find NFT uploaded to %s", opensea_url)
+            return None
+        finally:
+            db_session.remove()
 
-            found_nft.opensea_url = opensea_url
+    def _set_opensea_urls(self, opensea_urls: Dict[int, str]) -> List[int]:
+        """
+        Stores the urls of the NFTs known from the manifest with a single
+        executemany, returns ids of the NFTs
+        """
+        if not opensea_urls:
+            return []
+
+        db_session.bulk_update_mappings(
+            NFT,
+            [
+                # Remove any extra get params from the url
+                {"id": nft_id, "opensea_url": opensea_url.split("?")[0]}
+                for nft_id, opensea_url in opensea_urls.items()
+            ],
+        )
+        db_session.commit()
 
-            logging.info("Updated NFT %s", found_nft)
+        logging.info("Updated OpenSea urls of NFTs %s", list(opensea_urls))
 
-            db_session.commit()
-        else:
-            raise RuntimeError(
-                f"NFT with url {opensea_url} can't be fetched from OpenSea"
-            )
+        return list(opensea_urls)
 
-    def _update_opensea_urls(self, opensea_urls: List[str]) -> None:
+    def _update_opensea_urls(self, opensea_urls: List[str]) -> List[int]:
+        """
+        Resolves the urls concurrently, returns ids of the NFTs they belong
+        to, urls which can't be matched are kept in `unresolved_urls`
+
+        Assets are fetched from OpenSea in bulk beforehand, the ones missing
+        from there are fetched one by one.
+        """
+        nft_ids: List[int] = []
+        pending: Set[str] = set()
+
+        # Remove any extra get params from the urls
         for opensea_url in opensea_urls:
-            self._update_opensea_url(opensea_url)
+            pending.add(opensea_url.split("?")[0])
 
-    def _run_uploader(self, files: Iterator[File]) -> None:
-        # Write json file with the list of nft needed by the nft uploader
-        result = ResultOpenseaUploaderStuct(
-            list(
-                self._get_nfts(
-                    [
-                        ImageFileOpenseaUploaderStuct(
-                            str(file.file_path),
-                            db_session.query(NFT)
-                            .filter(NFT.id == file.nft_id)[0]
-                            .title,
-                            db_session.query(NFT)
-                            .filter(NFT.id == file.nft_id)[0]
-                            .description,
-                        )
-                        for file in files
-                    ],
-                    self._params.collection,
-                )
-            )
+        if not pending:
+            return nft_ids
+
+        started = time.monotonic()
+
+        for batch in batches(list(pending)):
+            for nft_id, opensea_url in db_session.query(NFT.id, NFT.opensea_url).filter(
+                NFT.opensea_url.in_(batch)
+            ):
+                nft_ids.append(nft_id)
+                pending.discard(opensea_url)
+
+        assets = get_opensea_client().get_assets_many(
+            parse_asset_url(opensea_url) for opensea_url in pending
         )
 
-        logging.info("Generated upload file for opensea uploader %s", result)
+        with concurrent.futures.ThreadPoolExecutor(
+            self._params.resolver_workers, thread_name_prefix="opensea-resolver"
+        ) as executor:
+            futures = {
+                executor.submit(
+                    self._resolve_opensea_url,
+                    opensea_url,
+                    assets.get(parse_asset_url(opensea_url)),
+                ): opensea_url
+                for opensea_url in pending
+            }
+            failed = 0
+
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                nft_id = future.result()
+
+                if nft_id is not None:
+                    nft_ids.append(nft_id)
+                else:
+                    self._unresolved_urls.append(futures[future])
+                    failed += 1
+
+                if done % _RESOLVER_PROGRESS_EVERY == 0 or done == len(futures):
+                    logging.info(
+                        "Resolved %s of %s OpenSea urls in %.1fs, %s failed",
+                        done,
+                        len(futures),
+                        time.monotonic() - started,
+                        failed,
+                    )
+
+        return nft_ids
+
+    @staticmethod
+    def _write_manifest(
+        manifest: IO[str], nfts: Iterable[NFTOpenseaUploaderStuct]
+    ) -> int:
+        """
+        Writes ResultOpenseaUploaderStuct of the nfts one item at a time,
+        returns the number of items
+        """
+        count = 0
+
+        manifest.write('{"nft": [')
+
+        for nft in nfts:
+            if count:
+                manifest.write(", ")
+
+            json.dump(asdict(nft), manifest)
+            count += 1
+
+        manifest.write("]}")
 
-        # Write image list
+        return count
+
+    def _get_image_files(
+        self, files: Iterator[File]
+    ) -> Iterator[ImageFileOpenseaUploaderStuct]:
+        for file in files:
+            self._manifest_ids.add(file.nft_id)
+
+            yield ImageFileOpenseaUploaderStuct(
+                str(file.file_path), file.title, file.description
+            )
+
+    def _run_uploader(self, files: Iterator[File]) -> None:
+        # Write json file with the list of nft needed by the nft uploader,
+        # files are written as soon as they are downloaded
         with open(
             self._params.uploader_dir + "/data/test.json", "w", encoding="utf-8"
-        ) as file:
-            file.write(json.dumps(asdict(result)))
+        ) as manifest:
+            count = self._write_manifest(
+                manifest,
+                self._get_nfts(self._get_image_files(files), self._params.collection),
+            )
+
+        logging.info("Generated upload file for opensea uploader with %s NFTs", count)
 
         # Write auth data
         with open(
@@ -328,6 +570,16 @@ class OpenseaAutomaticUploader(UploaderBase):
         ) as file:
             file.write(json.dumps(asdict(self._params.auth_data)))
 
+        if self._params.session_pool is not None:
+            with self._params.session_pool.session(
+                self._params.uploader_dir
+            ) as session:
+                session.upload(
+                    os.path.abspath(self._params.uploader_dir + "/data/test.json")
+                )
+
+            return
+
         # Run the uploader
         process = subprocess.Popen(
             "python main.py",
@@ -350,25 +602,214 @@ class OpenseaAutomaticUploader(UploaderBase):
                 f"stderr: {stderr}"
             )
 
-    def upload(self, files: Iterator[File]) -> None:
+    def _get_uploaded_ids(self) -> List[int]:
+        # Gathering artifacts, NFTs are found by their file names, the ones
+        # which can't be are looked up on OpenSea
+        uploaded_nfts = self._gather_opensea_urls()
+        known = {
+            nft.nft_id: nft.opensea_url
+            for nft in uploaded_nfts
+            if nft.nft_id is not None and nft.nft_id in self._manifest_ids
+        }
+
+        return self._set_opensea_urls(known) + self._update_opensea_urls(
+            [nft.opensea_url for nft in uploaded_nfts if nft.nft_id not in known]
+        )
+
+    def upload(self, files: Iterator[File]) -> List[int]:
+        self._unresolved_urls = []
+
         # Cleanup old artifacts
         self._remove_old_sale_files()
 
-        # Run uploader
-        self._run_uploader(files)
+        try:
+            self._run_uploader(files)
+        except Exception as exc:
+            # The NFTs uploaded before the failure have their sale files too,
+            # they must not be uploaded again
+            raise UploadError(
+                f"Upload failed: {exc!r}", self._get_uploaded_ids()
+            ) from exc
 
-        # Gathering artifacts
-        opensea_urls = self._gather_opensea_urls()
-        self._update_opensea_urls(opensea_urls)
+        return self._get_uploaded_ids()
 
 
 class OpenseaAutomaticWorker(WorkerBase[OpenseaAutomaticUploaderParams]):
+    """
+    Splits the NFTs into batches and uploads them with several uploader
+    instances at once
+
+    Every instance works in its own copy of the uploader directory (own
+    data/ and assets/), optionally with its own wallet. NFTs are marked
+    complete as soon as their batch is done, only the ones found in the
+    uploader output are.
+    """
+
+    _instance_dirs: List[str]
+    _work_dir: Optional[str]
+    # Temporary work directory made by the worker itself, removed once the
+    # upload is over
+    _tmp_work_dir: Optional[str]
+
     def __init__(
         self, ids: List[int], uploader_params: OpenseaAutomaticUploaderParams
     ) -> None:
         super().__init__(ids, uploader_params)
 
-        self._uploader = OpenseaAutomaticUploader(uploader_params)
+        self._instance_dirs = []
+        self._work_dir = None
+        self._tmp_work_dir = None
+
+    def _get_instance_params(self, instance: int) -> OpenseaAutomaticUploaderParams:
+        params = self._uploader_params
+        auth_data = (
+            params.instance_auth_data[instance]
+            if instance < len(params.instance_auth_data)
+            else params.auth_data
+        )
+
+        if params.instances == 1:
+            return dataclasses.replace(params, auth_data=auth_data)
+
+        if self._work_dir is None:
+            if params.work_dir is None:
+                self._work_dir = self._tmp_work_dir = tempfile.mkdtemp(
+                    prefix="opensea-uploader-"
+                )
+            else:
+                self._work_dir = params.work_dir
+
+        while len(self._instance_dirs) <= instance:
+            instance_dir = os.path.join(
+                self._work_dir, f"instance_{len(self._instance_dirs)}"
+            )
+
+            if not os.path.exists(instance_dir):
+                # Sale files of the original must not be picked up by the copy
+                shutil.copytree(
+                    params.uploader_dir,
+                    instance_dir,
+                    symlinks=True,
+                    ignore=lambda directory, _: ["data"]
+                    if os.path.samefile(directory, params.uploader_dir)
+                    else [],
+                )
+                os.makedirs(os.path.join(instance_dir, "data"))
+
+            self._instance_dirs.append(instance_dir)
+
+        return dataclasses.replace(
+            params, uploader_dir=self._instance_dirs[instance], auth_data=auth_data
+        )
+
+    def _upload_batch(
+        self,
+        instances: "queue.Queue[int]",
+        instance_params: List[OpenseaAutomaticUploaderParams],
+        nft_ids: List[int],
+    ) -> UploadBatchResult:
+        instance = instances.get()
+        result = UploadBatchResult(instance, nft_ids)
+
+        try:
+            logging.info("Uploading NFTs %s with instance %s", result.nft_ids, instance)
+
+            # Files are downloaded while the manifest is written and removed
+            # as soon as the uploader is done with them
+            uploader = OpenseaAutomaticUploader(instance_params[instance])
+
+            with tempfile.TemporaryDirectory(prefix="nft-files-") as files_dir:
+                try:
+                    uploaded = uploader.upload(self._get_files(files_dir, nft_ids))
+                except UploadError as exc:
+                    # Only the rest of the batch is retried
+                    logging.exception(
+                        "Instance %s failed to upload NFTs %s, NFTs %s are uploaded",
+                        instance,
+                        result.nft_ids,
+                        exc.uploaded_ids,
+                    )
+                    result.error = exc
+                    uploaded = exc.uploaded_ids
+
+            result.uploaded_ids = [
+                nft_id for nft_id in result.nft_ids if nft_id in uploaded
+            ]
+            # The only place the NFTs are marked: right away, not after all
+            # the batches
+            self._mark_complete(result.uploaded_ids)
+
+            if uploader.unresolved_urls:
+                # Any of the rest could be behind these urls
+                result.unresolved_ids = [
+                    nft_id
+                    for nft_id in result.nft_ids
+                    if nft_id not in result.uploaded_ids
+                ]
+        except Exception as exc:  # pylint: disable=broad-except
+            logging.exception(
+                "Instance %s failed to upload NFTs %s", instance, result.nft_ids
+            )
+            result.error = exc
+        finally:
+            instances.put(instance)
+            db_session.remove()
+
+        return result
+
+    def _upload(self) -> List[int]:
+        params = self._uploader_params
+        batches = [
+            self._ids[start : start + params.batch_size]
+            for start in range(0, len(self._ids), params.batch_size)
+        ]
+        instance_count = max(1, min(params.instances, len(batches)))
+
+        try:
+            instance_params = [
+                self._get_instance_params(instance)
+                for instance in range(instance_count)
+            ]
+
+            # Free instances, every batch takes one for the duration of the
+            # upload
+            instances: "queue.Queue[int]" = queue.Queue()
+
+            for instance in range(instance_count):
+                instances.put(instance)
+
+            with concurrent.futures.ThreadPoolExecutor(instance_count) as executor:
+                results = list(
+                    executor.map(
+                        lambda batch: self._upload_batch(
+                            instances, instance_params, batch
+                        ),
+                        batches,
+                    )
+                )
+        finally:
+            if self._tmp_work_dir is not None:
+                shutil.rmtree(self._tmp_work_dir, ignore_errors=True)
+                self._tmp_work_dir = self._work_dir = None
+                self._instance_dirs = []
+
+        for result in results:
+            missing = set(result.nft_ids) - set(result.uploaded_ids)
+
+            if result.unresolved_ids:
+                logging.warning(
+                    "Instance %s uploaded NFTs which can't be matched, "
+                    "NFTs %s have to be resolved manually",
+                    result.instance,
+                    result.unresolved_ids,
+                )
+            elif missing:
+                logging.warning(
+                    "Instance %s didn't upload NFTs %s", result.instance, missing
+                )
+
+        self._unresolved_ids = [
+            nft_id for result in results for nft_id in result.unresolved_ids
+        ]
 
-    def _upload(self) -> None:
-        self._uploader.upload(self._get_files())
+        return [nft_id for result in results for nft_id in result.uploaded_ids]
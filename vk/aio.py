@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import time
+from types import TracebackType
+from typing import (
+    AbstractSet,
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
+
+import aiohttp
+
+from vk.api import (
+    VK_WALL_GET_MAX_COUNT,
+    ObjectIdType,
+    Post,
+    UtilsResolveScreenNameResult,
+    VkApiClientBase,
+    VkApiClientParams,
+    VkApiError,
+    Wall,
+    WallGetRequest,
+    WallWalk,
+    resolve_screen_name_result_factory,
+    wall_factory,
+)
+from vk.jsonlib import loads
+from vk.metrics import RequestHook
+
+VK_ASYNC_MAX_CONCURRENCY = 10
+VK_ASYNC_MAX_CONNECTIONS = 10
+VK_ASYNC_TIMEOUT = 30.0
+
+
+class AsyncVkApiBase(VkApiClientBase):
+    """
+    Asyncio counterpart of VkApiBase
+
+    Returns the same dataclasses as the sync client and shares the same rate
+    limit budget for the same token. All the requests go through one pooled
+    session, and the number of requests in flight is limited, so a single
+    event loop can poll many communities at once.
+    """
+
+    _session: Optional[aiohttp.ClientSession]
+    _semaphore: Optional[asyncio.Semaphore]
+
+    def __init__(
+        self,
+        params: VkApiClientParams,
+        max_concurrency: int = VK_ASYNC_MAX_CONCURRENCY,
+        max_connections: int = VK_ASYNC_MAX_CONNECTIONS,
+        session: Optional[aiohttp.ClientSession] = None,
+        hooks: Optional[Sequence[RequestHook]] = None,
+    ) -> None:
+        """
+        Session can be shared between clients, in this case it is not
+        closed by the client
+        """
+        super().__init__(params, hooks)
+
+        self._max_connections = max_connections
+        self._session = session
+        self._owns_session = session is None
+        self._max_concurrency = max_concurrency
+        self._semaphore = None
+
+    async def __aenter__(self) -> "AsyncVkApiBase":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None and self._owns_session:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Session and semaphore have to be created within the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._max_connections),
+                timeout=aiohttp.ClientTimeout(total=VK_ASYNC_TIMEOUT),
+                headers={
+                    "Accept": "application/json",
+                    "Content-Type": "application/x-www-form-urlencoded",
+                },
+            )
+
+        return self._session
+
+    async def _call(self, method: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Performs a single HTTP request to the API, retrying if throttled
+
+        Returns the whole decoded response, other errors are not handled here
+        """
+        logging.debug("Request: %s", request)
+
+        tmp_request = self._prepare_request(request)
+        session = self._get_session()
+        semaphore = cast(asyncio.Semaphore, self._semaphore)
+        started = time.perf_counter()
+        payload_bytes = 0
+
+        for attempt in range(self._client_params.max_retries + 1):
+            await self._token_bucket.acquire_async()
+
+            async with semaphore:
+                async with session.get(
+                    self._api_url + method,
+                    params={key: str(value) for key, value in tmp_request.items()},
+                ) as http_response:
+                    content = await http_response.read()
+
+            payload_bytes += len(content)
+            response = loads(content)
+
+            if not self._is_throttled(response, attempt):
+                break
+
+        self._notify_hooks(method, started, attempt, payload_bytes, response)
+
+        return response
+
+    async def query(self, method: str, request: Dict[str, Any]) -> Any:
+        return self._unwrap_response(await self._call(method, request))
+
+    async def query_many(
+        self, calls: List[Tuple[str, Dict[str, Any]]]
+    ) -> List[Union[Any, VkApiError]]:
+        """
+        Same as VkApiBase.query_many, but execute batches run concurrently
+        """
+        batches = list(self._split_calls(calls))
+
+        responses = await asyncio.gather(
+            *(self._call("execute", request) for _, request in batches)
+        )
+
+        results: List[Union[Any, VkApiError]] = []
+
+        for (batch, _), response in zip(batches, responses):
+            results.extend(self._split_execute_response(batch, response))
+
+        return results
+
+
+class AsyncVkApiUtils(AsyncVkApiBase):
+    async def resolve_screen_name(
+        self, screen_name: str
+    ) -> UtilsResolveScreenNameResult:
+        result = await self.query(
+            "utils.resolveScreenName", {"screen_name": screen_name}
+        )
+
+        return resolve_screen_name_result_factory(result)
+
+    async def resolve_screen_names(
+        self, screen_names: List[str]
+    ) -> List[Union[UtilsResolveScreenNameResult, VkApiError]]:
+        results = await self.query_many(
+            [
+                ("utils.resolveScreenName", {"screen_name": screen_name})
+                for screen_name in screen_names
+            ]
+        )
+
+        return [
+            result
+            if isinstance(result, VkApiError)
+            else resolve_screen_name_result_factory(result)
+            for result in results
+        ]
+
+
+class AsyncVkApiWall(AsyncVkApiBase):
+    _skip_unknown_attachments: bool
+    _lazy: bool
+    _attachment_types: Optional[AbstractSet[str]]
+
+    def __init__(
+        self,
+        params: VkApiClientParams,
+        skip_unknown_attachments: bool = False,
+        lazy: bool = False,
+        attachment_types: Optional[AbstractSet[str]] = None,
+        **kwargs: Any,
+    ) -> None:
+        """
+        See VkApiWall and AsyncVkApiBase for the arguments
+        """
+        super().__init__(params, **kwargs)
+
+        self._skip_unknown_attachments = skip_unknown_attachments
+        self._lazy = lazy
+        self._attachment_types = attachment_types
+
+    def _wall_factory(self, response: Dict[str, Any]) -> Wall:
+        return wall_factory(
+            response, self._skip_unknown_attachments, self._lazy, self._attachment_types
+        )
+
+    async def get(
+        self,
+        domain: str,
+        offset: int,
+        count: int,
+        owner_id: Optional[int] = None,
+        _filter: Optional[str] = None,
+        extended: Optional[bool] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Wall:
+        request = WallGetRequest(
+            domain=domain,
+            offset=offset,
+            count=count,
+            owner_id=owner_id,
+            _filter=_filter,
+            extended=extended,
+            fields=fields,
+        )
+
+        return self._wall_factory(await self.query("wall.get", request.to_query()))
+
+    async def get_many(
+        self, wall_requests: List[WallGetRequest]
+    ) -> List[Union[Wall, VkApiError]]:
+        results = await self.query_many(
+            [("wall.get", request.to_query()) for request in wall_requests]
+        )
+
+        return [
+            result if isinstance(result, VkApiError) else self._wall_factory(result)
+            for result in results
+        ]
+
+    async def iter_posts(
+        self,
+        domain: str,
+        since_id: Optional[ObjectIdType] = None,
+        limit: Optional[int] = None,
+        first_page_size: int = 10,
+        max_page_size: int = VK_WALL_GET_MAX_COUNT,
+    ) -> AsyncIterator[Post]:
+        """
+        Walks the wall from the newest post to the oldest one, see WallWalk
+        """
+        walk = WallWalk(domain, since_id, limit, first_page_size, max_page_size)
+
+        while True:
+            request = walk.next_request()
+
+            if request is None:
+                return
+
+            wall = self._wall_factory(await self.query("wall.get", request.to_query()))
+
+            for post in walk.consume(wall):
+                yield post
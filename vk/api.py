@@ -1,23 +1,55 @@
+import contextlib
 import copy
 import datetime
 import json
 import logging
+import time
 from abc import ABC
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from http.client import HTTPConnection
-from typing import Any, Dict, List, Optional, Union, cast
+from typing import (
+    AbstractSet,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
 
 import requests
 
+from vk.jsonlib import PrefixedStream, Readable, iter_items, loads
+from vk.metrics import RequestHook, RequestRecord
+from vk.ratelimit import VK_DEFAULT_REQUESTS_PER_SECOND, TokenBucket, get_token_bucket
 from vk.utils import (
+    dataclass_slots,
     int_to_bool,
-    int_to_bool_optional,
     validate_type,
-    validate_type_optional,
 )
 
+_T = TypeVar("_T")
+
 VK_API_URL = "https://api.vk.com/method/"
 VK_API_VERSION = "5.131"
+VK_WALL_GET_MAX_COUNT = 100
+VK_EXECUTE_MAX_CALLS = 25
+# Used when VK didn't report the error of a failed call within execute
+VK_EXECUTE_UNKNOWN_ERROR_CODE = -1
+# Too many requests per second, flood control, rate limit reached
+VK_THROTTLING_ERROR_CODES = frozenset([6, 9, 29])
+VK_THROTTLING_MAX_RETRIES = 5
+VK_THROTTLING_BACKOFF = 1.0
+# How much of a streamed response to read to tell an error from a success
+_STREAM_HEAD_SIZE = 64
 
 
 def _enable_requests_debug() -> None:
@@ -55,36 +87,97 @@ class VkApiClientParams:
     version: str = VK_API_VERSION
     app_id: Optional[int] = None
     secure_key: Optional[str] = None
+    requests_per_second: float = VK_DEFAULT_REQUESTS_PER_SECOND
+    max_retries: int = VK_THROTTLING_MAX_RETRIES
 
 
-class VkApiBase:
+class VkApiClientBase:
+    """
+    Transport-agnostic part of the client, shared by sync and async clients
+    """
+
     _api_url: str = VK_API_URL
     _client_params: VkApiClientParams
-
-    def __init__(self, params: VkApiClientParams, debug: bool = True) -> None:
+    _token_bucket: TokenBucket
+
+    def __init__(
+        self, params: VkApiClientParams, hooks: Optional[Sequence[RequestHook]] = None
+    ) -> None:
+        """
+        Hooks are called after every API call, see vk.metrics
+        """
         self._client_params = params
+        self._token_bucket = get_token_bucket(
+            params.service_token, params.requests_per_second
+        )
+        self._hooks = list(hooks or [])
 
-        self._session = requests.Session()
-        self._session.headers["Accept"] = "application/json"
-        self._session.headers["Content-Type"] = "application/x-www-form-urlencoded"
+    def _notify_hooks(
+        self,
+        method: str,
+        started: float,
+        retries: int,
+        payload_bytes: int,
+        response: Dict[str, Any],
+    ) -> None:
+        if not self._hooks:
+            return
 
-        if debug:
-            _enable_requests_debug()
+        api_error = response.get("error")
+        record = RequestRecord(
+            method=method,
+            latency=time.perf_counter() - started,
+            payload_bytes=payload_bytes,
+            retries=retries,
+            error_code=api_error["error_code"] if api_error else None,
+        )
 
-    def query(self, method: str, request: Dict[str, Any]) -> Dict[str, Any]:
-        logging.debug("Request: %s", request)
+        for hook in self._hooks:
+            try:
+                hook.on_request(record)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Request hook %s failed", hook)
 
+    def _prepare_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
         # Add auth and version to the request
         tmp_request = copy.deepcopy(request)
         tmp_request["access_token"] = self._client_params.service_token
         tmp_request["v"] = self._client_params.version
 
-        json_response = self._session.get(
-            self._api_url + method, params=tmp_request
-        ).text
+        return tmp_request
 
-        response = json.loads(json_response)
+    def _is_throttled(self, response: Dict[str, Any], attempt: int) -> bool:
+        """
+        Checks whether the request has been throttled and should be retried
 
+        Slows down the token bucket (and so everyone using the same token)
+        on throttling and speeds it up again on success
+        """
+        api_error = response.get("error")
+
+        if not api_error or api_error["error_code"] not in VK_THROTTLING_ERROR_CODES:
+            self._token_bucket.on_success()
+            return False
+
+        if attempt >= self._client_params.max_retries:
+            return False
+
+        backoff = VK_THROTTLING_BACKOFF * 2**attempt
+
+        logging.warning(
+            "Throttled by VK with error %s, retrying in %s seconds (%s/%s)",
+            api_error["error_code"],
+            backoff,
+            attempt + 1,
+            self._client_params.max_retries,
+        )
+
+        self._token_bucket.on_throttled(backoff)
+
+        return True
+
+    @staticmethod
+    def _unwrap_response(response: Dict[str, Any]) -> Any:
         api_error = response.get("error")
         api_response = response.get("response")
 
@@ -93,30 +186,228 @@ class VkApiBase:
 
         return api_response
 
-        # TODO FIXME remove
-        # decoder = json.JSONDecoder(strict=False)
-        # response_parsed = decoder.raw_decode(response)
+    @staticmethod
+    def _split_calls(
+        calls: List[Tuple[str, Dict[str, Any]]]
+    ) -> Iterator[Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Any]]]:
+        """
+        Packs calls into batches, yields each batch with its execute request
+        """
+        for start in range(0, len(calls), VK_EXECUTE_MAX_CALLS):
+            batch = calls[start : start + VK_EXECUTE_MAX_CALLS]
+
+            code = (
+                "return ["
+                + ",".join(
+                    f"API.{method}({json.dumps(request, ensure_ascii=False)})"
+                    for method, request in batch
+                )
+                + "];"
+            )
+
+            yield batch, {"code": code}
+
+    @classmethod
+    def _split_execute_response(
+        cls, batch: List[Tuple[str, Dict[str, Any]]], response: Dict[str, Any]
+    ) -> List[Union[Any, VkApiError]]:
+        results: List[Union[Any, VkApiError]] = []
+
+        # Every failed call returns false and appends its error to the
+        # execute_errors list, so errors follow the order of calls
+        execute_errors = iter(response.get("execute_errors", []))
+
+        for (method, _), result in zip(batch, cls._unwrap_response(response)):
+            if result is not False:
+                results.append(result)
+                continue
+
+            execute_error = next(execute_errors, None)
+
+            if execute_error:
+                results.append(
+                    VkApiError(execute_error["error_code"], execute_error["error_msg"])
+                )
+            else:
+                results.append(
+                    VkApiError(
+                        VK_EXECUTE_UNKNOWN_ERROR_CODE,
+                        f"Call to {method} failed within execute",
+                    )
+                )
+
+        return results
+
+
+class VkApiBase(VkApiClientBase):
+    def __init__(
+        self,
+        params: VkApiClientParams,
+        debug: bool = False,
+        hooks: Optional[Sequence[RequestHook]] = None,
+    ) -> None:
+        """
+        Debug makes every HTTP request logged process-wide, which is slow,
+        use hooks to monitor the client in production
+        """
+        super().__init__(params, hooks)
+
+        self._session = requests.Session()
+        self._session.headers["Accept"] = "application/json"
+        self._session.headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        if debug:
+            _enable_requests_debug()
+
+    def _call(self, method: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Performs a single HTTP request to the API, retrying if throttled
+
+        Returns the whole decoded response, other errors are not handled here
+        """
+        logging.debug("Request: %s", request)
+
+        tmp_request = self._prepare_request(request)
+        started = time.perf_counter()
+        payload_bytes = 0
+
+        for attempt in range(self._client_params.max_retries + 1):
+            self._token_bucket.acquire()
+
+            content = self._session.get(
+                self._api_url + method, params=tmp_request
+            ).content
+            payload_bytes += len(content)
+
+            response = loads(content)
+
+            if not self._is_throttled(response, attempt):
+                break
+
+        self._notify_hooks(method, started, attempt, payload_bytes, response)
+
+        return response
+
+    @contextlib.contextmanager
+    def _call_stream(self, method: str, request: Dict[str, Any]) -> Iterator[Readable]:
+        """
+        Same as _call, but gives the body of a successful response as a
+        stream, to be decoded while it is being read
+
+        The response is closed (its connection goes back to the pool) when
+        the context is left, even if the body hasn't been read to the end.
+        Raises VkApiError if the response is an error
+        """
+        logging.debug("Request: %s", request)
+
+        tmp_request = self._prepare_request(request)
+        started = time.perf_counter()
+        payload_bytes = 0
+
+        for attempt in range(self._client_params.max_retries + 1):
+            self._token_bucket.acquire()
+
+            http_response = self._session.get(
+                self._api_url + method, params=tmp_request, stream=True
+            )
+
+            try:
+                http_response.raw.decode_content = True
+                payload_bytes += int(http_response.headers.get("Content-Length", 0))
+
+                # Errors are small, and the error key always goes first
+                head = http_response.raw.read(_STREAM_HEAD_SIZE)
+
+                if not head.lstrip(b"{ \t\r\n").startswith(b'"error"'):
+                    self._token_bucket.on_success()
+                    # Latency here is the time to the first bytes of the body
+                    self._notify_hooks(method, started, attempt, payload_bytes, {})
+                    yield PrefixedStream(head, http_response.raw)
+                    return
+
+                response = loads(head + http_response.raw.read())
+            finally:
+                http_response.close()
+
+            if not self._is_throttled(response, attempt):
+                break
+
+        self._notify_hooks(method, started, attempt, payload_bytes, response)
+
+        api_error = response["error"]
+
+        raise VkApiError(api_error["error_code"], api_error["error_msg"])
 
+    def query(self, method: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        return self._unwrap_response(self._call(method, request))
+
+    def query_many(
+        self, calls: List[Tuple[str, Dict[str, Any]]]
+    ) -> List[Union[Any, VkApiError]]:
+        """
+        Runs a list of (method, request) calls using the `execute` method
+
+        Calls are packed into batches of VK_EXECUTE_MAX_CALLS, every batch is a
+        single HTTP request. Results are returned in the same order as calls.
+        A failed call doesn't fail the whole batch, instead its VkApiError is
+        returned in place of the result.
+        """
+        results: List[Union[Any, VkApiError]] = []
+
+        for batch, request in self._split_calls(calls):
+            response = self._call("execute", request)
+            results.extend(self._split_execute_response(batch, response))
 
+        return results
+
+
+@dataclass_slots
 @dataclass
 class UtilsResolveScreenNameResult:
     type: str  # user, group, application
     object_id: int
 
 
+def resolve_screen_name_result_factory(
+    result: Dict[str, Any]
+) -> UtilsResolveScreenNameResult:
+    object_type, object_id = result["type"], result["object_id"]
+
+    return UtilsResolveScreenNameResult(object_type, object_id)
+
+
 class VkApiUtils(VkApiBase):
     def resolve_screen_name(self, screen_name: str) -> UtilsResolveScreenNameResult:
         result = self.query("utils.resolveScreenName", {"screen_name": screen_name})
 
-        object_type, object_id = result["type"], result["object_id"]
+        return resolve_screen_name_result_factory(result)
+
+    def resolve_screen_names(
+        self, screen_names: List[str]
+    ) -> List[Union[UtilsResolveScreenNameResult, VkApiError]]:
+        """
+        Resolves screen names in batches, see VkApiBase.query_many
+        """
+        results = self.query_many(
+            [
+                ("utils.resolveScreenName", {"screen_name": screen_name})
+                for screen_name in screen_names
+            ]
+        )
 
-        return UtilsResolveScreenNameResult(object_type, object_id)
+        return [
+            result
+            if isinstance(result, VkApiError)
+            else resolve_screen_name_result_factory(result)
+            for result in results
+        ]
 
 
 ObjectIdType = int
 UserIdType = int
 
 
+@dataclass_slots
 @dataclass
 class PostCommentsInfo:
     count: int
@@ -124,6 +415,7 @@ class PostCommentsInfo:
     groups_can_post: bool
 
 
+@dataclass_slots
 @dataclass
 class PostLikesInfo:
     count: int
@@ -132,12 +424,14 @@ class PostLikesInfo:
     can_publish: bool
 
 
+@dataclass_slots
 @dataclass
 class PostRepostsInfo:
     count: int
     user_reposted: bool
 
 
+@dataclass_slots
 @dataclass
 class PostSource:
     type: str  # vk, widget, api, rss, sms
@@ -146,6 +440,7 @@ class PostSource:
     data: Optional[str]  # profile_activity, profile_photo, comments, like, poll
 
 
+@dataclass_slots
 @dataclass
 class PlaceDescription:
     id: int
@@ -164,6 +459,7 @@ class PlaceDescription:
     address: Optional[int] = None
 
 
+@dataclass_slots
 @dataclass
 class PostGeoInfo:
     type: str
@@ -171,17 +467,26 @@ class PostGeoInfo:
     place: PlaceDescription
 
 
+@dataclass_slots
 @dataclass
 class Attachment(ABC):
     pass
 
 
+@dataclass_slots
 @dataclass
 class AttachmentOwned(Attachment):
     id: ObjectIdType
     owner_id: UserIdType
 
 
+PHOTO_SIZE_RANK: Dict[str, int] = {
+    size_type: rank
+    for rank, size_type in enumerate(["s", "m", "o", "p", "q", "r", "x", "y", "z", "w"])
+}
+
+
+@dataclass_slots
 @dataclass
 class PhotoSize:
     type: str
@@ -193,11 +498,24 @@ class PhotoSize:
         if not isinstance(other, PhotoSize):
             raise ValueError("Can't compare photo size to something else")
 
-        order: List[str] = ["s", "m", "o", "p", "q", "r", "x", "y", "z", "w"]
+        return self.rank < other.rank
 
-        return order.index(self.type) < order.index(other.type)
+    @property
+    def rank(self) -> int:
+        """
+        Position of the size in the list of sizes ordered from the smallest
+        """
+        try:
+            return PHOTO_SIZE_RANK[self.type]
+        except KeyError as exc:
+            raise ValueError(f"Unknown photo size type {self.type}") from exc
 
 
+def _photo_size_rank(size: PhotoSize) -> int:
+    return size.rank
+
+
+@dataclass_slots
 @dataclass
 class Photo(AttachmentOwned):
     album_id: ObjectIdType
@@ -208,13 +526,21 @@ class Photo(AttachmentOwned):
     width: Optional[int]
     height: Optional[int]
 
+    def largest(self) -> PhotoSize:
+        return max(self.sizes, key=_photo_size_rank)
+
+    def smallest(self) -> PhotoSize:
+        return min(self.sizes, key=_photo_size_rank)
+
 
+@dataclass_slots
 @dataclass
 class DirectlyUploadedPhoto(AttachmentOwned):
     photo_130: str
     photo_604: str
 
 
+@dataclass_slots
 @dataclass
 class Video(AttachmentOwned):
     title: str
@@ -237,6 +563,7 @@ class Video(AttachmentOwned):
     image: List[PhotoSize]
 
 
+@dataclass_slots
 @dataclass
 class Artist:
     id: str
@@ -244,6 +571,7 @@ class Artist:
     domain: str
 
 
+@dataclass_slots
 @dataclass
 class Audio(AttachmentOwned):
     artist: str
@@ -261,12 +589,14 @@ class Audio(AttachmentOwned):
     main_artists: List[Artist]
 
 
+@dataclass_slots
 @dataclass
 class Graffiti(AttachmentOwned):
     photo_130: str
     photo_604: str
 
 
+@dataclass_slots
 @dataclass
 class Product:
     def __init__(self) -> None:
@@ -274,6 +604,7 @@ class Product:
         raise NotImplementedError("")
 
 
+@dataclass_slots
 @dataclass
 class Button:
     def __init__(self) -> None:
@@ -281,6 +612,7 @@ class Button:
         raise NotImplementedError("")
 
 
+@dataclass_slots
 @dataclass
 class Link(Attachment):
     url: str
@@ -296,6 +628,7 @@ class Link(Attachment):
     type: str = "link"
 
 
+@dataclass_slots
 @dataclass
 class Note(Attachment):
     def __init__(self) -> None:
@@ -303,12 +636,14 @@ class Note(Attachment):
         raise NotImplementedError("")
 
 
+@dataclass_slots
 @dataclass
 class ApplicationContent(AttachmentOwned):
     photo_130: str
     photo_604: str
 
 
+@dataclass_slots
 @dataclass
 class Poll(AttachmentOwned):
     def __init__(self) -> None:
@@ -316,6 +651,7 @@ class Poll(AttachmentOwned):
         raise NotImplementedError("")
 
 
+@dataclass_slots
 @dataclass
 class WikiPage(Attachment):
     def __init__(self) -> None:
@@ -323,6 +659,7 @@ class WikiPage(Attachment):
         raise NotImplementedError("")
 
 
+@dataclass_slots
 @dataclass
 class PhotoAlbum(AttachmentOwned):
     thumb: Photo
@@ -336,6 +673,7 @@ class PhotoAlbum(AttachmentOwned):
 Photos = List[int]
 
 
+@dataclass_slots
 @dataclass
 class Currency:
     id: int
@@ -343,6 +681,7 @@ class Currency:
     title: str
 
 
+@dataclass_slots
 @dataclass
 class Price:
     amount: str
@@ -350,12 +689,14 @@ class Price:
     currency: Currency
 
 
+@dataclass_slots
 @dataclass
 class MarketCategorySection:
     id: int
     name: str
 
 
+@dataclass_slots
 @dataclass
 class MarketCategory:
     id: int
@@ -363,6 +704,7 @@ class MarketCategory:
     section: MarketCategorySection
 
 
+@dataclass_slots
 @dataclass
 class Market(AttachmentOwned):
     availability: int
@@ -373,6 +715,7 @@ class Market(AttachmentOwned):
     price: Price
 
 
+@dataclass_slots
 @dataclass
 class DocumentPreviewPhotoSize:
     type: str
@@ -381,6 +724,7 @@ class DocumentPreviewPhotoSize:
     height: int
 
 
+@dataclass_slots
 @dataclass
 class DocumentPreviewVideo:
     file_size: int
@@ -389,17 +733,20 @@ class DocumentPreviewVideo:
     height: int
 
 
+@dataclass_slots
 @dataclass
 class DocumentPreviewPhoto:
     sizes: List[PhotoSize]
 
 
+@dataclass_slots
 @dataclass
 class DocumentPreview:
     photo: DocumentPreviewPhoto
     video: DocumentPreviewVideo
 
 
+@dataclass_slots
 @dataclass
 class Document(AttachmentOwned):
     title: str
@@ -412,214 +759,392 @@ class Document(AttachmentOwned):
     access_key: str
 
 
-def attachment_factory(attachment: Dict[str, Any]) -> Attachment:
-    logging.debug("Original attachment: %s", attachment)
+_fromtimestamp = datetime.datetime.fromtimestamp
 
-    attachment_type = validate_type(attachment["type"], str)
-    data = validate_type(attachment[attachment_type], dict)
 
-    logging.debug("Detected type: %s", attachment_type)
-
-    if attachment_type == "photo":
-        photo = Photo(
-            id=validate_type(data["id"], int),
-            owner_id=validate_type(data["owner_id"], int),
-            album_id=validate_type(data["album_id"], ObjectIdType),
-            user_id=validate_type_optional(data.get("user_id"), UserIdType),
-            text=validate_type(data["text"], str),
-            date=datetime.datetime.fromtimestamp(validate_type(data["date"], int)),
-            sizes=[],
-            width=validate_type_optional(data.get("width"), int),
-            height=validate_type_optional(data.get("height"), int),
-        )
+class _Field(NamedTuple):
+    """
+    Describes how to get a dataclass field from the raw API object
+    """
+
+    key: str
+    type: Any
+    optional: bool = False
+    convert: Optional[Callable[[Any], Any]] = None
+    default_factory: Optional[Callable[[], Any]] = None
 
-        for size_raw in data["sizes"]:
-            size = PhotoSize(
-                type=validate_type(size_raw["type"], str),
-                url=validate_type(size_raw["url"], str),
-                width=validate_type(size_raw["width"], int),
-                height=validate_type(size_raw["height"], int),
-            )
 
-            photo.sizes.append(size)
+def _invalid_type(cls_name: str, name: str, value: Any, desired_type: Any) -> None:
+    raise ValueError(
+        f"Incorrect type {type(value)} of {cls_name}.{name}, should be {desired_type}"
+    )
 
-        return photo
 
-    if attachment_type == "posted_photo":
-        return DirectlyUploadedPhoto(
-            id=validate_type(data["id"], int),
-            owner_id=validate_type(data["owner_id"], int),
-            photo_130=validate_type(data["photo_130"], str),
-            photo_604=validate_type(data["photo_604"], str),
+def _compile_parser(
+    cls: Type[_T],
+    schema: Dict[str, _Field],
+    constants: Optional[Dict[str, Any]] = None,
+) -> Callable[[Dict[str, Any]], _T]:
+    """
+    Builds a parser of the raw API object into `cls` out of the schema
+
+    The parser is generated as a straight-line function, one block per field:
+    get the value, check its type, convert it. So the schema is interpreted
+    only once, not on every object.
+    """
+    cls_name = cls.__name__
+    namespace: Dict[str, Any] = {
+        "_cls": cls,
+        "_cls_name": cls_name,
+        "_invalid_type": _invalid_type,
+        "_constants": constants or {},
+    }
+    lines = [
+        "def parse(raw):",
+        "    if not isinstance(raw, dict):",
+        "        _invalid_type(_cls_name, 'self', raw, dict)",
+    ]
+
+    for pos, (name, field) in enumerate(schema.items()):
+        namespace[f"_type_{pos}"] = field.type
+        namespace[f"_convert_{pos}"] = field.convert
+        namespace[f"_default_{pos}"] = field.default_factory
+
+        value = f"_{pos}"
+        convert = f"_convert_{pos}({value})" if field.convert else value
+        # Exact type check is much cheaper than isinstance call
+        valid = (
+            f"isinstance({value}, _type_{pos})"
+            if isinstance(field.type, tuple)
+            else f"(type({value}) is _type_{pos} or isinstance({value}, _type_{pos}))"
         )
 
-    if attachment_type == "link":
-        product_raw = data.get("product")
-        product: Optional[Product] = None
+        if field.optional:
+            default = f"_default_{pos}()" if field.default_factory else "None"
+            lines += [
+                f"    {value} = raw.get({field.key!r})",
+                f"    if {value} is None:",
+                f"        {value} = {default}",
+                f"    elif {valid}:",
+                f"        {value} = {convert}",
+                "    else:",
+                f"        _invalid_type(_cls_name, {name!r}, {value}, _type_{pos})",
+            ]
+        else:
+            lines += [
+                f"    {value} = raw[{field.key!r}]",
+                f"    if not {valid}:",
+                f"        _invalid_type(_cls_name, {name!r}, {value}, _type_{pos})",
+            ]
 
-        if product_raw:
-            product = Product()
+            if field.convert:
+                lines.append(f"    {value} = {convert}")
 
-        button_raw = data.get("button")
-        button: Optional[Button] = None
+    # Positional arguments are cheaper than keyword ones
+    values = {name: f"_{pos}" for pos, name in enumerate(schema)}
+    values.update({name: f"_constants[{name!r}]" for name in (constants or {})})
+    arguments: List[str] = []
 
-        if button_raw:
-            button = Button()
+    for dataclass_field in fields(cast(Any, cls)):
+        # Fields with defaults can be omitted, the rest should go by name
+        if dataclass_field.name not in values:
+            break
 
-        return Link(
-            url=validate_type(data["url"], str),
-            title=validate_type(data["title"], str),
-            caption=validate_type_optional(data.get("caption"), str),
-            description=validate_type_optional(data.get("description"), str),
-            photo=cast(
-                Photo, attachment_factory({"type": "photo", "photo": data["photo"]})
-            )
-            if "photo" in data
-            else None,
-            is_external=validate_type_optional(data.get("is_external"), bool),
-            product=product,
-            button=button,
-            preview_page=validate_type_optional(data.get("preview_page"), str),
-            preview_url=validate_type_optional(data.get("preview_url"), str),
-        )
+        arguments.append(values.pop(dataclass_field.name))
 
-    if attachment_type == "video":
-        sizes_raw = data["image"] or []
-        sizes: List[PhotoSize] = []
-
-        for size_raw in sizes_raw:
-            sizes.append(
-                PhotoSize(
-                    type="",
-                    url=validate_type(size_raw["url"], str),
-                    width=validate_type(size_raw["width"], int),
-                    height=validate_type(size_raw["height"], int),
-                )
-            )
+    arguments += [f"{name}={value}" for name, value in values.items()]
 
-        adding_data_raw = validate_type_optional(data.get("adding_date"), int)
-
-        return Video(
-            id=validate_type(data["id"], int),
-            owner_id=validate_type(data["owner_id"], int),
-            title=validate_type(data["title"], str),
-            description=validate_type(data["description"], str),
-            duration=validate_type(data["duration"], int),
-            photo_130=validate_type_optional(data.get("photo_130"), str),
-            photo_320=validate_type_optional(data.get("photo_320"), str),
-            photo_640=validate_type_optional(data.get("photo_640"), str),
-            photo_800=validate_type_optional(data.get("photo_800"), str),
-            date=datetime.datetime.fromtimestamp(validate_type(data["date"], int)),
-            adding_date=datetime.datetime.fromtimestamp(adding_data_raw)
-            if adding_data_raw
-            else None,
-            views=validate_type(data["views"], int),
-            comments=validate_type_optional(data.get("comments"), int),
-            player=validate_type_optional(data.get("player"), str),
-            access_key=validate_type(data["access_key"], str),
-            is_favourite=int_to_bool_optional(
-                validate_type_optional(data.get("is_favourite"), int)
-            ),
-            processing=int_to_bool_optional(
-                validate_type_optional(data.get("processing"), int)
-            ),
-            live=int_to_bool_optional(validate_type_optional(data.get("live"), int)),
-            upcoming=int_to_bool_optional(
-                validate_type_optional(data.get("upcoming"), int)
-            ),
-            image=sizes,
-        )
+    lines.append(f"    return _cls({', '.join(arguments)})")
 
-    if attachment_type == "audio":
-        return Audio(
-            id=validate_type(data["id"], int),
-            artist=validate_type(data["artist"], str),
-            owner_id=validate_type(data["owner_id"], int),
-            title=validate_type(data["title"], str),
-            duration=validate_type(data["duration"], int),
-            is_explicit=validate_type(data["is_explicit"], bool),
-            is_focus_track=validate_type(data["is_focus_track"], bool),
-            track_code=validate_type(data["track_code"], str),
-            url=validate_type(data["url"], str),
-            date=datetime.datetime.fromtimestamp(validate_type(data["date"], int)),
-            album_id=validate_type(data["album_id"], int),
-            main_artists=[
-                Artist(
-                    name=validate_type(artist["name"], str),
-                    domain=validate_type(artist["domain"], str),
-                    id=validate_type(artist["id"], str),
-                )
-                for artist in data["main_artists"]
-            ],
-            short_videos_allowed=validate_type(data["short_videos_allowed"], bool),
-            stories_allowed=validate_type(data["stories_allowed"], bool),
-            stories_cover_allowed=validate_type(data["stories_cover_allowed"], bool),
-        )
+    source = compile("\n".join(lines), f"<{cls_name} parser>", "exec")
+    exec(source, namespace)  # pylint: disable=exec-used
+
+    return cast(Callable[[Dict[str, Any]], _T], namespace["parse"])
+
+
+def _list_of(parser: Callable[[Dict[str, Any]], _T]) -> Callable[[List[Any]], List[_T]]:
+    def parse(raw: List[Any]) -> List[_T]:
+        return [parser(item) for item in raw]
+
+    return parse
+
+
+def _not_implemented(cls: Type[Any]) -> Callable[[Any], Any]:
+    def parse(raw: Any) -> Any:
+        # Empty objects are treated as absent, otherwise cls raises
+        return cls() if raw else None
+
+    return parse
+
+
+_parse_photo_size = _compile_parser(
+    PhotoSize,
+    {
+        "type": _Field("type", str),
+        "url": _Field("url", str),
+        "width": _Field("width", int),
+        "height": _Field("height", int),
+    },
+)
+
+_parse_photo = _compile_parser(
+    Photo,
+    {
+        "id": _Field("id", int),
+        "owner_id": _Field("owner_id", int),
+        "album_id": _Field("album_id", int),
+        "user_id": _Field("user_id", int, optional=True),
+        "text": _Field("text", str),
+        "date": _Field("date", int, convert=_fromtimestamp),
+        "sizes": _Field("sizes", list, convert=_list_of(_parse_photo_size)),
+        "width": _Field("width", int, optional=True),
+        "height": _Field("height", int, optional=True),
+    },
+)
+
+_parse_directly_uploaded_photo = _compile_parser(
+    DirectlyUploadedPhoto,
+    {
+        "id": _Field("id", int),
+        "owner_id": _Field("owner_id", int),
+        "photo_130": _Field("photo_130", str),
+        "photo_604": _Field("photo_604", str),
+    },
+)
+
+_parse_link = _compile_parser(
+    Link,
+    {
+        "url": _Field("url", str),
+        "title": _Field("title", str),
+        "caption": _Field("caption", str, optional=True),
+        "description": _Field("description", str, optional=True),
+        "photo": _Field("photo", dict, optional=True, convert=_parse_photo),
+        "is_external": _Field("is_external", bool, optional=True),
+        "product": _Field(
+            "product", dict, optional=True, convert=_not_implemented(Product)
+        ),
+        "button": _Field(
+            "button", dict, optional=True, convert=_not_implemented(Button)
+        ),
+        "preview_page": _Field("preview_page", str, optional=True),
+        "preview_url": _Field("preview_url", str, optional=True),
+    },
+)
+
+_parse_video_image = _compile_parser(
+    PhotoSize,
+    {
+        "url": _Field("url", str),
+        "width": _Field("width", int),
+        "height": _Field("height", int),
+    },
+    constants={"type": ""},
+)
+
+_parse_video = _compile_parser(
+    Video,
+    {
+        "id": _Field("id", int),
+        "owner_id": _Field("owner_id", int),
+        "title": _Field("title", str),
+        "description": _Field("description", str),
+        "duration": _Field("duration", int),
+        "photo_130": _Field("photo_130", str, optional=True),
+        "photo_320": _Field("photo_320", str, optional=True),
+        "photo_640": _Field("photo_640", str, optional=True),
+        "photo_800": _Field("photo_800", str, optional=True),
+        "date": _Field("date", int, convert=_fromtimestamp),
+        "adding_date": _Field(
+            "adding_date", int, optional=True, convert=_fromtimestamp
+        ),
+        "views": _Field("views", int),
+        "comments": _Field("comments", int, optional=True),
+        "player": _Field("player", str, optional=True),
+        "access_key": _Field("access_key", str),
+        "is_favourite": _Field("is_favourite", int, optional=True, convert=int_to_bool),
+        "processing": _Field("processing", int, optional=True, convert=int_to_bool),
+        "live": _Field("live", int, optional=True, convert=int_to_bool),
+        "upcoming": _Field("upcoming", int, optional=True, convert=int_to_bool),
+        "image": _Field(
+            "image",
+            list,
+            optional=True,
+            convert=_list_of(_parse_video_image),
+            default_factory=list,
+        ),
+    },
+)
+
+_parse_artist = _compile_parser(
+    Artist,
+    {
+        "id": _Field("id", str),
+        "name": _Field("name", str),
+        "domain": _Field("domain", str),
+    },
+)
+
+_parse_audio = _compile_parser(
+    Audio,
+    {
+        "id": _Field("id", int),
+        "owner_id": _Field("owner_id", int),
+        "artist": _Field("artist", str),
+        "title": _Field("title", str),
+        "duration": _Field("duration", int),
+        "is_explicit": _Field("is_explicit", bool),
+        "is_focus_track": _Field("is_focus_track", bool),
+        "track_code": _Field("track_code", str),
+        "url": _Field("url", str),
+        "date": _Field("date", int, convert=_fromtimestamp),
+        "album_id": _Field("album_id", int),
+        "main_artists": _Field("main_artists", list, convert=_list_of(_parse_artist)),
+        "short_videos_allowed": _Field("short_videos_allowed", bool),
+        "stories_allowed": _Field("stories_allowed", bool),
+        "stories_cover_allowed": _Field("stories_cover_allowed", bool),
+    },
+)
 
-    if attachment_type == "market":
-        return Market(
-            id=validate_type(data["id"], int),
-            owner_id=validate_type(data["owner_id"], int),
-            availability=validate_type(data["availability"], int),
-            category=MarketCategory(
-                id=validate_type(data["category"]["id"], int),
-                name=validate_type(data["category"]["name"], str),
-                section=MarketCategorySection(
-                    id=validate_type(data["category"]["section"]["id"], int),
-                    name=validate_type(data["category"]["section"]["name"], str),
-                ),
+_parse_market = _compile_parser(
+    Market,
+    {
+        "id": _Field("id", int),
+        "owner_id": _Field("owner_id", int),
+        "availability": _Field("availability", int),
+        "category": _Field(
+            "category",
+            dict,
+            convert=_compile_parser(
+                MarketCategory,
+                {
+                    "id": _Field("id", int),
+                    "name": _Field("name", str),
+                    "section": _Field(
+                        "section",
+                        dict,
+                        convert=_compile_parser(
+                            MarketCategorySection,
+                            {"id": _Field("id", int), "name": _Field("name", str)},
+                        ),
+                    ),
+                },
             ),
-            description=validate_type(data["description"], str),
-            price=Price(
-                amount=validate_type(data["price"]["amount"], str),
-                text=validate_type(data["price"]["text"], str),
-                currency=Currency(
-                    id=validate_type(data["price"]["currency"]["id"], int),
-                    name=validate_type(data["price"]["currency"]["name"], str),
-                    title=validate_type(data["price"]["currency"]["title"], str),
-                ),
+        ),
+        "description": _Field("description", str),
+        "price": _Field(
+            "price",
+            dict,
+            convert=_compile_parser(
+                Price,
+                {
+                    "amount": _Field("amount", str),
+                    "text": _Field("text", str),
+                    "currency": _Field(
+                        "currency",
+                        dict,
+                        convert=_compile_parser(
+                            Currency,
+                            {
+                                "id": _Field("id", int),
+                                "name": _Field("name", str),
+                                "title": _Field("title", str),
+                            },
+                        ),
+                    ),
+                },
             ),
-            title=validate_type(data["title"], str),
-            thumb_photo=validate_type(data["thumb_photo"], str),
-        )
+        ),
+        "title": _Field("title", str),
+        "thumb_photo": _Field("thumb_photo", str),
+    },
+)
 
-    if attachment_type == "doc":
-        return Document(
-            id=validate_type(data["id"], int),
-            owner_id=validate_type(data["owner_id"], int),
-            title=validate_type(data["title"], str),
-            size=validate_type(data["size"], int),
-            ext=validate_type(data["ext"], str),
-            type=validate_type(data["type"], int),
-            url=validate_type(data["url"], str),
-            preview=DocumentPreview(
-                photo=DocumentPreviewPhoto(
-                    sizes=[
-                        PhotoSize(
-                            type=validate_type(size_raw["type"], str),
-                            url=validate_type(size_raw["src"], str),
-                            width=validate_type(size_raw["width"], int),
-                            height=validate_type(size_raw["height"], int),
-                        )
-                        for size_raw in data["preview"]["photo"]["sizes"]
-                    ]
-                ),
-                video=DocumentPreviewVideo(
-                    src=validate_type(data["preview"]["video"]["src"], str),
-                    width=validate_type(data["preview"]["video"]["width"], int),
-                    height=validate_type(data["preview"]["video"]["height"], int),
-                    file_size=validate_type(data["preview"]["video"]["file_size"], int),
-                ),
+_parse_document_preview = _compile_parser(
+    DocumentPreview,
+    {
+        "photo": _Field(
+            "photo",
+            dict,
+            convert=_compile_parser(
+                DocumentPreviewPhoto,
+                {
+                    "sizes": _Field(
+                        "sizes",
+                        list,
+                        convert=_list_of(
+                            _compile_parser(
+                                PhotoSize,
+                                {
+                                    "type": _Field("type", str),
+                                    "url": _Field("src", str),
+                                    "width": _Field("width", int),
+                                    "height": _Field("height", int),
+                                },
+                            )
+                        ),
+                    ),
+                },
+            ),
+        ),
+        "video": _Field(
+            "video",
+            dict,
+            convert=_compile_parser(
+                DocumentPreviewVideo,
+                {
+                    "src": _Field("src", str),
+                    "width": _Field("width", int),
+                    "height": _Field("height", int),
+                    "file_size": _Field("file_size", int),
+                },
             ),
-            date=datetime.datetime.fromtimestamp(validate_type(data["date"], int)),
-            access_key=validate_type(data["access_key"], str),
+        ),
+    },
+)
+
+_parse_document = _compile_parser(
+    Document,
+    {
+        "id": _Field("id", int),
+        "owner_id": _Field("owner_id", int),
+        "title": _Field("title", str),
+        "size": _Field("size", int),
+        "ext": _Field("ext", str),
+        "type": _Field("type", int),
+        "url": _Field("url", str),
+        "preview": _Field("preview", dict, convert=_parse_document_preview),
+        "date": _Field("date", int, convert=_fromtimestamp),
+        "access_key": _Field("access_key", str),
+    },
+)
+
+_ATTACHMENT_PARSERS: Dict[str, Callable[[Dict[str, Any]], Attachment]] = {
+    "photo": _parse_photo,
+    "posted_photo": _parse_directly_uploaded_photo,
+    "link": _parse_link,
+    "video": _parse_video,
+    "audio": _parse_audio,
+    "market": _parse_market,
+    "doc": _parse_document,
+}
+
+
+def attachment_factory(attachment: Dict[str, Any]) -> Attachment:
+    attachment_type = validate_type(attachment["type"], str)
+    data = validate_type(attachment[attachment_type], dict)
+
+    parser = _ATTACHMENT_PARSERS.get(attachment_type)
+
+    if parser is None:
+        raise NotImplementedError(
+            f"Attachment of type {attachment_type} is not defined: {data}"
         )
 
-    raise NotImplementedError(
-        f"Attachment of type {attachment_type} is not defined: {data}"
-    )
+    return parser(data)
 
 
+@dataclass_slots
 @dataclass
 class PostCopyHistoryItem:
     def __init__(self) -> None:
@@ -627,6 +1152,7 @@ class PostCopyHistoryItem:
         raise NotImplementedError()
 
 
+@dataclass_slots
 @dataclass
 class Post:
     id: ObjectIdType
@@ -655,13 +1181,438 @@ class Post:
     is_pinned: Optional[bool]
 
 
+@dataclass_slots
 @dataclass
 class Wall:
     count: int
     items: List[Post]
 
 
+@dataclass
+class WallGetRequest:
+    domain: str
+    offset: int
+    count: int
+    owner_id: Optional[int] = None
+    _filter: Optional[str] = None
+    extended: Optional[bool] = None
+    fields: Optional[List[str]] = None
+
+    def to_query(self) -> Dict[str, Union[int, str]]:
+        query: Dict[str, Union[int, str]] = {}
+
+        if self.owner_id:
+            query["owner_id"] = self.owner_id
+
+        if self._filter:
+            query["filter"] = self._filter
+
+        if self.extended:
+            query["extended"] = self.extended
+
+        if self.fields:
+            query["fields"] = ",".join(self.fields)
+
+        query["domain"] = self.domain
+        query["offset"] = self.offset
+        query["count"] = self.count
+
+        return query
+
+
+_parse_geo = _compile_parser(
+    PostGeoInfo,
+    {
+        "type": _Field("type", str),
+        "coordinates": _Field("coordinates", str),
+        "place": _Field(
+            "place",
+            dict,
+            optional=True,
+            convert=_compile_parser(
+                PlaceDescription,
+                {
+                    "id": _Field("id", int),
+                    "title": _Field("title", str),
+                    "latitude": _Field("latitude", (int, float)),
+                    "longtitude": _Field("longitude", (int, float)),
+                    "created": _Field("created", int, convert=_fromtimestamp),
+                    "icon": _Field("icon", str),
+                    "country": _Field("country", str),
+                    "city": _Field("city", str),
+                    "type": _Field("type", int, optional=True),
+                },
+            ),
+        ),
+    },
+)
+
+
+def _attachments_parser(
+    skip_unknown: bool, attachment_types: Optional[AbstractSet[str]] = None
+) -> Callable[[List[Any]], List[Attachment]]:
+    """
+    Attachments of types not in `attachment_types` (if given) are dropped
+    without being parsed
+    """
+    if not skip_unknown and attachment_types is None:
+        return _list_of(attachment_factory)
+
+    def parse(raw: List[Any]) -> List[Attachment]:
+        attachments: List[Attachment] = []
+
+        for attachment_raw in raw:
+            if (
+                attachment_types is not None
+                and attachment_raw.get("type") not in attachment_types
+            ):
+                continue
+
+            try:
+                attachments.append(attachment_factory(attachment_raw))
+            except NotImplementedError as exc:
+                if not skip_unknown:
+                    raise
+
+                logging.warning("Skipping attachment: %s", exc)
+
+        return attachments
+
+    return parse
+
+
+def _post_schema(skip_unknown_attachments: bool) -> Dict[str, _Field]:
+    return {
+        "id": _Field("id", int),
+        "owner_id": _Field("owner_id", int),
+        "from_id": _Field("from_id", int),
+        "created_by": _Field("created_by", int, optional=True),
+        "date": _Field("date", int, convert=_fromtimestamp),
+        "text": _Field("text", str),
+        "reply_owner_id": _Field("reply_owner_id", int, optional=True),
+        "reply_post_id": _Field("reply_post_id", int, optional=True),
+        "friends_only": _Field("friends_only", bool, optional=True),
+        "comments": _Field(
+            "comments",
+            dict,
+            convert=_compile_parser(
+                PostCommentsInfo,
+                {
+                    "count": _Field("count", int),
+                    "can_post": _Field("can_post", int, convert=int_to_bool),
+                    "groups_can_post": _Field(
+                        "groups_can_post", int, convert=int_to_bool
+                    ),
+                },
+            ),
+        ),
+        "likes": _Field(
+            "likes",
+            dict,
+            convert=_compile_parser(
+                PostLikesInfo,
+                {
+                    "count": _Field("count", int),
+                    "user_likes": _Field("user_likes", int, convert=int_to_bool),
+                    "can_like": _Field("can_like", int, convert=int_to_bool),
+                    "can_publish": _Field("can_publish", int, convert=int_to_bool),
+                },
+            ),
+        ),
+        "reposts": _Field(
+            "reposts",
+            dict,
+            convert=_compile_parser(
+                PostRepostsInfo,
+                {
+                    "count": _Field("count", int),
+                    "user_reposted": _Field("user_reposted", int, convert=int_to_bool),
+                },
+            ),
+        ),
+        "post_type": _Field("post_type", str),
+        "post_source": _Field(
+            "post_source",
+            dict,
+            convert=_compile_parser(
+                PostSource,
+                {
+                    "type": _Field("type", str),
+                    "platform": _Field("platform", str, optional=True),
+                    "url": _Field("url", str, optional=True),
+                    "data": _Field("data", str, optional=True),
+                },
+            ),
+        ),
+        "attachments": _Field(
+            "attachments",
+            list,
+            optional=True,
+            convert=_attachments_parser(skip_unknown_attachments),
+            default_factory=list,
+        ),
+        "geo": _Field("geo", dict, optional=True, convert=_parse_geo),
+        "signer_id": _Field("signer_id", int, optional=True),
+        "can_pin": _Field("can_pin", int, optional=True, convert=int_to_bool),
+        "can_delete": _Field("can_delete", int, optional=True, convert=int_to_bool),
+        "can_edit": _Field("can_edit", int, optional=True, convert=int_to_bool),
+        "is_pinned": _Field("is_pinned", int, optional=True, convert=int_to_bool),
+        "marked_as_ads": _Field("marked_as_ads", int, convert=int_to_bool),
+        "is_favourite": _Field("is_favourite", int, optional=True, convert=int_to_bool),
+    }
+
+
+_POST_CONSTANTS: Dict[str, Any] = {"copy_history": None}  # TODO FIXME
+
+_POST_PARSERS: Dict[bool, Callable[[Dict[str, Any]], Post]] = {
+    skip_unknown_attachments: _compile_parser(
+        Post, _post_schema(skip_unknown_attachments), _POST_CONSTANTS
+    )
+    for skip_unknown_attachments in (False, True)
+}
+
+
+def _field_parser(cls_name: str, name: str, field: _Field) -> Callable[[Any], Any]:
+    """
+    Parser of a single field, for the objects decoded field by field
+    """
+
+    def parse(raw: Dict[str, Any]) -> Any:
+        value = raw.get(field.key)
+
+        if value is None:
+            if not field.optional:
+                raise KeyError(field.key)
+
+            return field.default_factory() if field.default_factory else None
+
+        if not isinstance(value, field.type):
+            _invalid_type(cls_name, name, value, field.type)
+
+        return field.convert(value) if field.convert else value
+
+    return parse
+
+
+_LAZY_POST_FIELD_PARSERS: Dict[str, Callable[[Any], Any]] = {
+    name: _field_parser(Post.__name__, name, field)
+    for name, field in _post_schema(skip_unknown_attachments=False).items()
+    if name != "attachments"
+}
+
+
+class LazyPost(Post):
+    """
+    Post view over the raw API object
+
+    Fields are decoded on the first access and then cached on the instance,
+    so the ones nobody reads are never decoded. Attachments of types not in
+    `attachment_types` (if given) are not decoded at all.
+    """
+
+    __slots__ = ("_raw", "_attachment_types", "_skip_unknown_attachments")
+
+    _raw: Dict[str, Any]
+    _attachment_types: Optional[AbstractSet[str]]
+    _skip_unknown_attachments: bool
+
+    # pylint: disable=super-init-not-called
+    def __init__(
+        self,
+        raw: Dict[str, Any],
+        attachment_types: Optional[AbstractSet[str]] = None,
+        skip_unknown_attachments: bool = False,
+    ) -> None:
+        # Dataclass fields are not set here, they are filled by __getattr__
+        self._raw = validate_type(raw, dict)
+        self._attachment_types = attachment_types
+        self._skip_unknown_attachments = skip_unknown_attachments
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called when the attribute is not set yet
+        if name == "attachments":
+            value: Any = _attachments_parser(
+                self._skip_unknown_attachments, self._attachment_types
+            )(validate_type(self._raw.get("attachments") or [], list))
+        elif name in _POST_CONSTANTS:
+            value = _POST_CONSTANTS[name]
+        elif name in _LAZY_POST_FIELD_PARSERS:
+            value = _LAZY_POST_FIELD_PARSERS[name](self._raw)
+        else:
+            raise AttributeError(
+                f"'{self.__class__.__name__}' object has no attribute '{name}'"
+            )
+
+        setattr(self, name, value)
+
+        return value
+
+
+def post_parser(
+    skip_unknown_attachments: bool = False,
+    lazy: bool = False,
+    attachment_types: Optional[AbstractSet[str]] = None,
+) -> Callable[[Dict[str, Any]], Post]:
+    """
+    Returns a parser of a single raw post, see wall_factory for the arguments
+    """
+    if lazy:
+        return lambda post_raw: LazyPost(
+            post_raw, attachment_types, skip_unknown_attachments
+        )
+
+    return _POST_PARSERS[skip_unknown_attachments]
+
+
+def wall_factory(
+    response: Dict[str, Any],
+    skip_unknown_attachments: bool = False,
+    lazy: bool = False,
+    attachment_types: Optional[AbstractSet[str]] = None,
+) -> Wall:
+    """
+    Parses wall.get response
+
+    Unknown (or not yet implemented) attachments fail the whole page, unless
+    `skip_unknown_attachments` is set, in this case they are logged and left
+    out of the post attachments.
+
+    With `lazy` posts are returned as LazyPost views, decoded on access and
+    keeping only `attachment_types` attachments (if given)
+    """
+    parse_post = post_parser(skip_unknown_attachments, lazy, attachment_types)
+
+    return Wall(
+        validate_type(response["count"], int),
+        [parse_post(post_raw) for post_raw in response["items"]],
+    )
+
+
+class WallWalk:
+    """
+    State of a wall walk from the newest post to the oldest one
+
+    The walk stops at the first (not pinned) post with id less or equal to
+    `since_id`, which is the high-watermark of the previous walk. The first
+    page is small, so when nothing new was posted the whole walk is a
+    single cheap request. Every next page is twice as large, until
+    `max_page_size` is reached.
+
+    Posts published while we are paging shift the offsets, so the same
+    post can be returned twice by VK. Such posts are yielded only once.
+    """
+
+    _seen: Set[ObjectIdType]
+    _offset: int
+    _count: int
+    _done: bool
+
+    def __init__(
+        self,
+        domain: str,
+        since_id: Optional[ObjectIdType] = None,
+        limit: Optional[int] = None,
+        first_page_size: int = 10,
+        max_page_size: int = VK_WALL_GET_MAX_COUNT,
+    ) -> None:
+        self._domain = domain
+        self._since_id = since_id
+        self._limit = limit
+        self._max_page_size = max_page_size
+
+        self._seen = set()
+        self._offset = 0
+        self._count = min(first_page_size, max_page_size)
+        self._done = False
+
+    def next_request(self) -> Optional[WallGetRequest]:
+        if self._done:
+            return None
+
+        return WallGetRequest(
+            domain=self._domain, offset=self._offset, count=self._count
+        )
+
+    def consume(self, wall: Wall) -> List[Post]:
+        """
+        Takes the page returned for the last request, returns new posts from it
+        """
+        posts: List[Post] = []
+
+        for post in wall.items:
+            if post.id in self._seen:
+                continue
+
+            if self._since_id is not None and post.id <= self._since_id:
+                if post.is_pinned:
+                    # Pinned post is always on top, no matter how old it is
+                    continue
+
+                self._done = True
+                return posts
+
+            self._seen.add(post.id)
+            posts.append(post)
+
+            if self._limit is not None and len(self._seen) >= self._limit:
+                self._done = True
+                return posts
+
+        self._offset += len(wall.items)
+        self._count = min(self._count * 2, self._max_page_size)
+
+        if not wall.items or self._offset >= wall.count:
+            self._done = True
+
+        return posts
+
+
 class VkApiWall(VkApiBase):
+    _skip_unknown_attachments: bool
+    _lazy: bool
+    _attachment_types: Optional[AbstractSet[str]]
+
+    def __init__(
+        self,
+        params: VkApiClientParams,
+        debug: bool = False,
+        hooks: Optional[Sequence[RequestHook]] = None,
+        skip_unknown_attachments: bool = False,
+        lazy: bool = False,
+        attachment_types: Optional[AbstractSet[str]] = None,
+    ) -> None:
+        """
+        With `skip_unknown_attachments` posts with attachments we can't parse
+        yet are returned without them, instead of failing the whole page.
+
+        With `lazy` posts are LazyPost views, decoded on access and keeping
+        only `attachment_types` attachments (if given), see wall_factory
+        """
+        super().__init__(params, debug, hooks)
+
+        self._skip_unknown_attachments = skip_unknown_attachments
+        self._lazy = lazy
+        self._attachment_types = attachment_types
+
+    def _wall_factory(self, response: Dict[str, Any]) -> Wall:
+        return wall_factory(
+            response, self._skip_unknown_attachments, self._lazy, self._attachment_types
+        )
+
+    def stream(self, domain: str, offset: int, count: int) -> Iterator[Post]:
+        """
+        Same as get, but posts are decoded one by one while the response is
+        being read, so the whole page is never materialized at once
+        """
+        request = WallGetRequest(domain=domain, offset=offset, count=count)
+        parse_post = post_parser(
+            self._skip_unknown_attachments, self._lazy, self._attachment_types
+        )
+
+        with self._call_stream("wall.get", request.to_query()) as body:
+            for post_raw in iter_items(body, "response.items"):
+                yield parse_post(post_raw)
+
     def get(
         self,
         domain: str,
@@ -672,147 +1623,55 @@ class VkApiWall(VkApiBase):
         extended: Optional[bool] = None,
         fields: Optional[List[str]] = None,
     ) -> Wall:
-        query: Dict[str, Union[int, str]] = {}
-
-        if owner_id:
-            query["owner_id"] = owner_id
-
-        if _filter:
-            query["filter"] = _filter
-
-        if extended:
-            query["extended"] = extended
-
-        if fields:
-            query["fields"] = ",".join(fields)
-
-        query["domain"] = domain
-        query["offset"] = offset
-        query["count"] = count
+        request = WallGetRequest(
+            domain=domain,
+            offset=offset,
+            count=count,
+            owner_id=owner_id,
+            _filter=_filter,
+            extended=extended,
+            fields=fields,
+        )
 
-        response = self.query("wall.get", query)
+        response = self.query("wall.get", request.to_query())
 
-        result = Wall(response["count"], [])
+        return self._wall_factory(response)
 
-        for post_raw in response["items"]:
-            geo_raw = validate_type_optional(post_raw.get("geo"), dict)
-            geo: Optional[PostGeoInfo] = None
+    def get_many(
+        self, wall_requests: List[WallGetRequest]
+    ) -> List[Union[Wall, VkApiError]]:
+        """
+        Gets several walls (or several pages of a wall) in batches,
+        see VkApiBase.query_many
+        """
+        results = self.query_many(
+            [("wall.get", request.to_query()) for request in wall_requests]
+        )
 
-            if geo_raw:
-                geo = PostGeoInfo(
-                    type=validate_type(geo_raw["type"], str),
-                    coordinates=validate_type(geo_raw["coordinates"], int),
-                    place=PlaceDescription(
-                        id=validate_type(geo_raw["place"]["id"], ObjectIdType),
-                        title=validate_type(geo_raw["place"]["tile"], str),
-                        latitude=validate_type(geo_raw["place"]["latitude"], int),
-                        longtitude=validate_type(geo_raw["place"]["longtitude"], int),
-                        created=datetime.datetime.fromtimestamp(
-                            validate_type(geo_raw["place"]["created"], int)
-                        ),
-                        icon=validate_type(geo_raw["place"]["icon"], str),
-                        country=validate_type(geo_raw["place"]["country"], str),
-                        city=validate_type(geo_raw["place"]["city"], str),
-                        type=validate_type(geo_raw["place"]["type"], int),
-                    ),
-                )
+        return [
+            result if isinstance(result, VkApiError) else self._wall_factory(result)
+            for result in results
+        ]
 
-            attachments_raw = post_raw.get("attachments", [])
-            attachments: List[Attachment] = []
-
-            for attachment_raw in attachments_raw:
-                attachment = attachment_factory(attachment_raw)
-                attachments.append(attachment)
-
-            post = Post(
-                id=validate_type(post_raw["id"], ObjectIdType),
-                owner_id=validate_type(post_raw["owner_id"], UserIdType),
-                from_id=validate_type(post_raw["from_id"], UserIdType),
-                created_by=validate_type_optional(
-                    post_raw.get("created_by"), UserIdType
-                ),
-                date=datetime.datetime.fromtimestamp(
-                    validate_type(post_raw["date"], int)
-                ),
-                text=validate_type(post_raw["text"], str),
-                reply_owner_id=validate_type_optional(
-                    post_raw.get("reply_owner_id"), UserIdType
-                ),
-                reply_post_id=validate_type_optional(
-                    post_raw.get("reply_post_id"), ObjectIdType
-                ),
-                friends_only=validate_type_optional(post_raw.get("friends_only"), bool),
-                comments=PostCommentsInfo(
-                    validate_type(
-                        validate_type(post_raw["comments"], dict)["count"], int
-                    ),
-                    int_to_bool(validate_type(post_raw["comments"], dict)["can_post"]),
-                    int_to_bool(
-                        validate_type(post_raw["comments"], dict)["groups_can_post"]
-                    ),
-                ),
-                likes=PostLikesInfo(
-                    count=validate_type(
-                        validate_type(post_raw["likes"], dict)["count"], int
-                    ),
-                    user_likes=int_to_bool(
-                        validate_type(post_raw["likes"], dict)["user_likes"]
-                    ),
-                    can_like=int_to_bool(
-                        validate_type(post_raw["likes"], dict)["can_like"]
-                    ),
-                    can_publish=int_to_bool(
-                        validate_type(post_raw["likes"], dict)["can_publish"]
-                    ),
-                ),
-                reposts=PostRepostsInfo(
-                    count=validate_type(
-                        validate_type(post_raw["reposts"], dict)["count"], int
-                    ),
-                    user_reposted=int_to_bool(
-                        validate_type(post_raw["reposts"], dict)["user_reposted"]
-                    ),
-                ),
-                post_type=validate_type(post_raw["post_type"], str),
-                post_source=PostSource(
-                    type=validate_type(
-                        validate_type(post_raw["post_source"], dict)["type"], str
-                    ),
-                    platform=validate_type_optional(
-                        validate_type(post_raw["post_source"], dict).get("platform"),
-                        str,
-                    ),
-                    url=validate_type_optional(
-                        validate_type(post_raw["post_source"], dict).get("url"), str
-                    ),
-                    data=validate_type_optional(
-                        validate_type(post_raw["post_source"], dict).get("data"), str
-                    ),
-                ),
-                attachments=attachments,
-                geo=geo,
-                signer_id=validate_type_optional(post_raw.get("signer_id"), UserIdType),
-                copy_history=None,  # TODO FIXME
-                can_pin=int_to_bool_optional(
-                    validate_type_optional(post_raw.get("can_pin"), int)
-                ),
-                can_delete=int_to_bool_optional(
-                    validate_type_optional(post_raw.get("can_delete"), int)
-                ),
-                can_edit=int_to_bool_optional(
-                    validate_type_optional(post_raw.get("can_edit"), int)
-                ),
-                is_pinned=int_to_bool_optional(
-                    validate_type_optional(post_raw.get("is_pinned"), int)
-                ),
-                marked_as_ads=int_to_bool(
-                    validate_type(post_raw["marked_as_ads"], int)
-                ),
-                is_favourite=int_to_bool_optional(
-                    validate_type_optional(post_raw.get("is_favourite"), int)
-                ),
+    def iter_posts(
+        self,
+        domain: str,
+        since_id: Optional[ObjectIdType] = None,
+        limit: Optional[int] = None,
+        first_page_size: int = 10,
+        max_page_size: int = VK_WALL_GET_MAX_COUNT,
+    ) -> Iterator[Post]:
+        """
+        Walks the wall from the newest post to the oldest one, see WallWalk
+        """
+        walk = WallWalk(domain, since_id, limit, first_page_size, max_page_size)
+
+        while True:
+            request = walk.next_request()
+
+            if request is None:
+                return
+
+            yield from walk.consume(
+                self._wall_factory(self.query("wall.get", request.to_query()))
             )
-
-            result.items.append(post)
-
-        return result
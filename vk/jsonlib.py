@@ -0,0 +1,107 @@
+import json
+import logging
+from typing import Any, Callable, Dict, Iterator, Optional, Protocol, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None  # type: ignore
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover
+    ijson = None  # type: ignore
+
+JsonInput = Union[bytes, bytearray, memoryview, str]
+
+
+def _stdlib_loads(data: JsonInput) -> Any:
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+
+    return json.loads(data)
+
+
+def _orjson_loads(data: JsonInput) -> Any:
+    return orjson.loads(data)
+
+
+def _msgspec_loads(data: JsonInput) -> Any:
+    return msgspec.json.decode(data)
+
+
+BACKENDS: Dict[str, Callable[[JsonInput], Any]] = {"json": _stdlib_loads}
+
+if msgspec is not None:
+    BACKENDS["msgspec"] = _msgspec_loads
+
+if orjson is not None:
+    BACKENDS["orjson"] = _orjson_loads
+
+# The fastest of the installed ones
+BACKEND = next(
+    backend for backend in ("msgspec", "orjson", "json") if backend in BACKENDS
+)
+
+logging.debug("Using %s to decode json", BACKEND)
+
+loads: Callable[[JsonInput], Any] = BACKENDS[BACKEND]
+
+
+class Readable(Protocol):
+    # pylint: disable=too-few-public-methods
+    def read(self, size: int = -1) -> bytes:
+        ...
+
+
+class PrefixedStream:
+    """
+    Stream which returns the already consumed `prefix` first and then
+    the rest of the `stream`
+    """
+
+    def __init__(self, prefix: bytes, stream: Readable) -> None:
+        self._prefix = prefix
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._prefix:
+            # Not every stream accepts negative size
+            return self._stream.read(size) if size >= 0 else self._stream.read()
+
+        if size < 0:
+            data, self._prefix = self._prefix + self._stream.read(), b""
+            return data
+
+        data, self._prefix = self._prefix[:size], self._prefix[size:]
+
+        return data
+
+
+def iter_items(
+    stream: Readable, prefix: str, chunk_size: int = 64 * 1024
+) -> Iterator[Any]:
+    """
+    Yields items of the array found at `prefix` ("response.items" for instance)
+
+    With ijson installed the document is parsed incrementally, so only one
+    item is kept in memory at a time. Otherwise the whole document is
+    decoded first.
+    """
+    if ijson is not None:
+        yield from ijson.items(
+            stream, prefix + ".item", use_float=True, buf_size=chunk_size
+        )
+        return
+
+    data: Optional[Any] = loads(stream.read())
+
+    for key in prefix.split("."):
+        data = data.get(key) if isinstance(data, dict) else None
+
+    yield from data or []
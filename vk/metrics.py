@@ -0,0 +1,195 @@
+import abc
+import bisect
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import prometheus_client
+except ImportError:  # pragma: no cover
+    prometheus_client = None  # type: ignore
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS: Sequence[float] = (
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    float("inf"),
+)
+
+
+def _format_bucket(bucket: float) -> str:
+    return "+Inf" if bucket == float("inf") else str(bucket)
+
+
+@dataclass
+class RequestRecord:
+    """
+    Single API call as seen by the client, including throttling retries
+    """
+
+    method: str
+    latency: float
+    payload_bytes: int
+    retries: int
+    error_code: Optional[int] = None
+
+
+class RequestHook(abc.ABC):
+    """
+    Gets called after every API call, must be cheap and thread-safe
+    """
+
+    @abc.abstractmethod
+    def on_request(self, record: RequestRecord) -> None:
+        raise NotImplementedError()
+
+
+@dataclass
+class LatencyHistogram:
+    buckets: Sequence[float] = LATENCY_BUCKETS
+    counts: List[int] = field(default_factory=list)
+    total: float = 0.0
+    count: int = 0
+
+    def __post_init__(self) -> None:
+        if not self.counts:
+            self.counts = [0] * len(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+@dataclass
+class MethodMetrics:
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    payload_bytes: int = 0
+    retries: int = 0
+    errors: Dict[int, int] = field(default_factory=lambda: defaultdict(int))
+
+
+class MetricsRecorder(RequestHook):
+    """
+    Keeps per-method latency histograms and counters in memory
+
+    Use `collect` to export them to a metrics registry of your choice
+    """
+
+    _metrics: Dict[str, MethodMetrics]
+
+    def __init__(self) -> None:
+        self._metrics = defaultdict(MethodMetrics)
+        self._lock = threading.Lock()
+
+    def on_request(self, record: RequestRecord) -> None:
+        with self._lock:
+            metrics = self._metrics[record.method]
+            metrics.latency.observe(record.latency)
+            metrics.payload_bytes += record.payload_bytes
+            metrics.retries += record.retries
+
+            if record.error_code is not None:
+                metrics.errors[record.error_code] += 1
+
+    def _samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        # Called under the lock
+        samples: List[Tuple[str, Dict[str, str], float]] = []
+
+        for method, metrics in self._metrics.items():
+            labels = {"method": method}
+            cumulative = 0
+
+            for bucket, count in zip(metrics.latency.buckets, metrics.latency.counts):
+                cumulative += count
+                samples.append(
+                    (
+                        "vk_api_request_seconds_bucket",
+                        {**labels, "le": _format_bucket(bucket)},
+                        cumulative,
+                    )
+                )
+
+            samples += [
+                ("vk_api_request_seconds_sum", labels, metrics.latency.total),
+                ("vk_api_request_seconds_count", labels, metrics.latency.count),
+                ("vk_api_payload_bytes_total", labels, metrics.payload_bytes),
+                ("vk_api_retries_total", labels, metrics.retries),
+            ]
+            samples.extend(
+                (
+                    "vk_api_errors_total",
+                    {**labels, "error_code": str(error_code)},
+                    count,
+                )
+                for error_code, count in metrics.errors.items()
+            )
+
+        return samples
+
+    def collect(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """
+        Yields (name, labels, value) samples in the Prometheus naming style
+
+        The samples are copied under the lock and yielded after it is
+        released, so a slow exporter never blocks the requests
+        """
+        with self._lock:
+            samples = self._samples()
+
+        yield from samples
+
+
+class PrometheusHook(RequestHook):
+    """
+    Reports requests straight to prometheus_client metrics
+    """
+
+    def __init__(
+        self, registry: Optional["prometheus_client.CollectorRegistry"] = None
+    ) -> None:
+        if prometheus_client is None:
+            raise RuntimeError("prometheus_client is not installed")
+
+        registry = registry or prometheus_client.REGISTRY
+
+        self._latency = prometheus_client.Histogram(
+            "vk_api_request_seconds",
+            "VK API call latency, including retries",
+            ["method"],
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self._payload_bytes = prometheus_client.Counter(
+            "vk_api_payload_bytes",
+            "VK API response payload size",
+            ["method"],
+            registry=registry,
+        )
+        self._retries = prometheus_client.Counter(
+            "vk_api_retries",
+            "VK API calls retried because of throttling",
+            ["method"],
+            registry=registry,
+        )
+        self._errors = prometheus_client.Counter(
+            "vk_api_errors",
+            "VK API errors by code",
+            ["method", "error_code"],
+            registry=registry,
+        )
+
+    def on_request(self, record: RequestRecord) -> None:
+        self._latency.labels(record.method).observe(record.latency)
+        self._payload_bytes.labels(record.method).inc(record.payload_bytes)
+        self._retries.labels(record.method).inc(record.retries)
+
+        if record.error_code is not None:
+            self._errors.labels(record.method, str(record.error_code)).inc()
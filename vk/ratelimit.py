@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+# VK allows 3 requests per second per token by default
+VK_DEFAULT_REQUESTS_PER_SECOND = 3.0
+
+
+class TokenBucket:
+    """
+    Token bucket shared by everyone who uses the same access token
+
+    Safe to use from several threads and from several asyncio tasks at the
+    same time: a caller reserves a token under a short lock and then waits
+    for its turn outside of it, so nobody holds the lock while sleeping.
+
+    The rate is adaptive: every throttling error halves it (down to
+    `min_rate`), every successful request brings it back up by
+    a fraction of `max_rate`.
+
+    Tokens are counted from `_updated_at`, which is moved to the end of the
+    backoff when throttled, so the callers waiting meanwhile go one by one
+    after it instead of all at once.
+    """
+
+    _max_rate: float
+    _min_rate: float
+    _rate: float
+    _capacity: float
+    _tokens: float
+    _updated_at: float
+
+    def __init__(
+        self,
+        rate: float = VK_DEFAULT_REQUESTS_PER_SECOND,
+        capacity: Optional[float] = None,
+        min_rate: Optional[float] = None,
+    ) -> None:
+        if rate <= 0:
+            raise ValueError(f"Rate should be positive, got {rate}")
+
+        self._max_rate = rate
+        self._min_rate = min_rate if min_rate is not None else rate / 16
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else rate
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def _refill(self, now: float) -> None:
+        # Nothing is refilled before the end of a backoff
+        if now <= self._updated_at:
+            return
+
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated_at) * self._rate
+        )
+        self._updated_at = now
+
+    def _reserve(self) -> float:
+        """
+        Takes a token and returns how long the caller has to wait before
+        using it. Token count can go negative, this is how the waiting
+        callers are put in line.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+
+            delay = -self._tokens / self._rate if self._tokens < 0 else 0.0
+
+            return max(0.0, self._updated_at - now) + delay
+
+    def acquire(self) -> None:
+        delay = self._reserve()
+
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self) -> None:
+        delay = self._reserve()
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def on_success(self) -> None:
+        with self._lock:
+            if self._rate < self._max_rate:
+                self._refill(time.monotonic())
+                self._rate = min(self._max_rate, self._rate + self._max_rate / 10)
+
+    def on_throttled(self, backoff: float) -> None:
+        """
+        Slows the bucket down and makes everyone wait for `backoff` seconds,
+        then a single token is available at once
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._rate = max(self._min_rate, self._rate / 2)
+            self._tokens = min(self._tokens, 1.0)
+            self._updated_at = max(self._updated_at, now + backoff)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_token_bucket(
+    token: str, rate: float = VK_DEFAULT_REQUESTS_PER_SECOND
+) -> TokenBucket:
+    """
+    Returns the process-wide bucket for the token, creating it if needed
+
+    The rate is only used when the bucket is created, all the clients of
+    the same token share one budget
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(token)
+
+        if bucket is None:
+            bucket = _buckets[token] = TokenBucket(rate)
+
+        return bucket
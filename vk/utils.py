@@ -1,6 +1,8 @@
-from typing import Any, Optional, TypeVar
+from dataclasses import fields
+from typing import Any, Optional, Set, Type, TypeVar, cast
 
 _T = TypeVar("_T")
+_C = TypeVar("_C")
 
 
 def int_to_bool_optional(value: Optional[int]) -> Optional[bool]:
@@ -31,3 +33,40 @@ def validate_type_optional(to_validate: _T, desired_type: Any) -> _T:
         return to_validate
 
     return validate_type(to_validate, desired_type)
+
+
+def dataclass_slots(cls: Type[_C]) -> Type[_C]:
+    """
+    Recreates the dataclass with __slots__, same as dataclass(slots=True)
+    from python 3.10+ does
+
+    Slotted instances don't have a per-instance __dict__, so they take
+    much less memory and have faster attribute access
+    """
+    inherited_slots: Set[str] = set()
+
+    for base in cls.__mro__[1:-1]:
+        inherited_slots.update(getattr(base, "__slots__", ()))
+
+    field_names = tuple(
+        field.name
+        for field in fields(cast(Any, cls))
+        if field.name not in inherited_slots
+    )
+
+    cls_dict = dict(cls.__dict__)
+    cls_dict["__slots__"] = field_names
+
+    for field_name in field_names:
+        # Defaults are kept by the dataclass __init__, class attributes
+        # with the same names would conflict with slots
+        cls_dict.pop(field_name, None)
+
+    cls_dict.pop("__dict__", None)
+    cls_dict.pop("__weakref__", None)
+
+    metaclass: Any = type(cls)
+    slotted_cls = cast(Type[_C], metaclass(cls.__name__, cls.__bases__, cls_dict))
+    slotted_cls.__qualname__ = cls.__qualname__
+
+    return slotted_cls